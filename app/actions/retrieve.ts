@@ -20,7 +20,8 @@ export async function searchKnowledgeBase(query: string): Promise<SearchResult[]
     const embedResponse = await fetch(`${PYTHON_API_URL}/embed`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ text: query }),
+      // target: 'documents' -> vektör, documents tablosundaki saklama biçiminde (float16 / kırpılmış) döner
+      body: JSON.stringify({ text: query, target: 'documents' }),
       cache: 'no-store'
     });
 
@@ -29,11 +30,11 @@ export async function searchKnowledgeBase(query: string): Promise<SearchResult[]
       return []; 
     }
 
-    const { embedding } = await embedResponse.json();
+    const { embedding, match_rpc } = await embedResponse.json();
 
     // 2. Supabase RPC ile Vektör Araması Yap
     // match_documents fonksiyonunu SQL ile oluşturmuştuk (Katman 2 başı)
-    const { data: documents, error } = await supabase.rpc('match_documents', {
+    const { data: documents, error } = await supabase.rpc(match_rpc || 'match_documents', {
       query_embedding: embedding,
       match_threshold: 0.50, // Benzerlik eşiği
       match_count: 5 // En alakalı 5 parça
@@ -0,0 +1,356 @@
+import os
+import json
+import time
+import fcntl
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from vector_format import STORE_FORMAT, VectorFormat
+
+# documents tablosunun süreç içi ANN (IVF-Flat) aynası.
+# - Vektörler diskte düz bir dosyada (np.memmap) durur; süreçler aynı sayfaları paylaşır.
+# - İçerik/metadata yanındaki sqlite dosyasında tutulur (reranking için metin gerekir).
+# - documents.ingest_seq yüksek su işaretinden (high-water mark) artımlı senkronlanır.
+# - Tek yazıcı (dosya kilidi), diğer süreçler okuyucu: meta.json'daki generation değişince yeniden map'ler.
+# Eğitim eşiğinin altında tam tarama yapılır; küme sayısı büyüdükçe yeniden eğitilir.
+
+logger = logging.getLogger("BabyLexitAnn")
+
+# --- AYARLAR ---
+ANN_INDEX_ENABLED = os.getenv("ANN_INDEX_ENABLED", "0") == "1"
+ANN_INDEX_DIR = os.getenv(
+    "ANN_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ann_index")
+)
+ANN_SYNC_SECONDS = float(os.getenv("ANN_SYNC_SECONDS", "30"))
+ANN_SYNC_BATCH = int(os.getenv("ANN_SYNC_BATCH", "1000"))
+# Eşzamanlı transaction'lar sıra numaralarını geç görünür kılabilir; son N numara tekrar taranır
+ANN_SYNC_OVERLAP = int(os.getenv("ANN_SYNC_OVERLAP", "500"))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+ANN_MIN_TRAIN = int(os.getenv("ANN_MIN_TRAIN", "4096"))
+# Eğitimden sonra satır sayısı bu kat büyüyünce kümeler yeniden eğitilir
+ANN_RETRAIN_GROWTH = float(os.getenv("ANN_RETRAIN_GROWTH", "4"))
+
+SEQ_COLUMN = "ingest_seq"
+
+
+def _nlist_for(n: int) -> int:
+    return int(min(4096, max(16, 4 * np.sqrt(n))))
+
+
+def kmeans(sample: np.ndarray, nlist: int, iterations: int = 10, seed: int = 7) -> np.ndarray:
+    """Küresel k-means (vektörler normalize; benzerlik iç çarpım)."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        # Boş kalan kümeleri rastgele bir noktaya taşı
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+class AnnIndex:
+    """
+    IVF-Flat indeks + içerik aynası.
+    search() thread-safe'tir; yazma işlemleri (sync/add/train) sadece kilit sahibi süreçte çalışır.
+    """
+
+    def __init__(self, path: str = ANN_INDEX_DIR, fmt: VectorFormat = STORE_FORMAT, nprobe: int = ANN_NPROBE):
+        self.fmt = fmt
+        self.path = os.path.join(path, fmt.label.replace("/", "_"))
+        self.nprobe = nprobe
+        self.dtype = np.float16 if fmt.dtype == "float16" else np.float32
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self.writer = False
+
+        self.meta: Dict[str, Any] = {}
+        self.count = 0
+        self.dim = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._assign: Optional[np.ndarray] = None
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[np.ndarray] = []
+        self._db: Optional[sqlite3.Connection] = None
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.searches = 0
+        self.last_sync = 0.0
+        self.last_sync_added = 0
+
+    # --- Dosyalar ---
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_meta(self) -> Dict[str, Any]:
+        try:
+            with open(self._file("meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, meta: Dict[str, Any]):
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._file("meta.json"))
+
+    def _truncate(self, name: str, size: int):
+        path = self._file(name)
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+    def open(self) -> "AnnIndex":
+        os.makedirs(self.path, exist_ok=True)
+        # İlk açan süreç yazıcı olur; diğerleri meta.json'u izleyen okuyuculardır
+        self._lock_file = open(self._file("writer.lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.writer = True
+        except OSError:
+            self.writer = False
+        self._db = sqlite3.connect(self._file("mirror.db"), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " pos INTEGER PRIMARY KEY, doc_id TEXT UNIQUE NOT NULL, content TEXT, metadata TEXT)"
+        )
+        self.reload(force=True)
+        logger.info(f"🧭 ANN indeksi açıldı: {self.path} ({self.count} vektör, {'yazıcı' if self.writer else 'okuyucu'})")
+        return self
+
+    def reload(self, force: bool = False):
+        """meta.json'daki generation değiştiyse dosyaları yeniden map'ler."""
+        meta = self._read_meta()
+        if not force and meta.get("generation") == self.meta.get("generation"):
+            return
+        with self._lock:
+            self.meta = meta
+            self.count = int(meta.get("count", 0))
+            self.dim = int(meta.get("dim", 0))
+            if not self.count or not self.dim:
+                self._vectors = self._assign = self._centroids = None
+                self._lists = []
+                return
+            self._vectors = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r", shape=(self.count, self.dim))
+            self._centroids = None
+            self._lists = []
+            if meta.get("nlist"):
+                self._centroids = np.load(self._file("centroids.npy"))
+                self._assign = np.memmap(self._file("assign.bin"), dtype=np.int32, mode="r", shape=(self.count,))
+                order = np.argsort(self._assign, kind="stable")
+                bounds = np.searchsorted(self._assign[order], np.arange(len(self._centroids) + 1))
+                self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self._centroids))]
+
+    @property
+    def ready(self) -> bool:
+        return self.count > 0
+
+    # --- Arama ---
+
+    def search(self, vector: List[float], k: int = 10, threshold: float = 0.0) -> List[Dict[str, Any]]:
+        """Sorgu vektörüne en yakın k dokümanı (documents satırı + similarity) döndürür."""
+        q = np.asarray(self.fmt.apply(vector), dtype=np.float32)
+        with self._lock:
+            if not self.count or q.shape[0] != self.dim:
+                return []
+            if self._lists:
+                probe = np.argsort(-(self._centroids @ q))[:self.nprobe]
+                candidates = np.concatenate([self._lists[c] for c in probe])
+            else:
+                candidates = np.arange(self.count)
+            if not len(candidates):
+                return []
+            # Sıralı erişim memmap'te ardışık sayfa okumaları demektir
+            candidates = np.sort(candidates)
+            scores = np.asarray(self._vectors[candidates], dtype=np.float32) @ q
+        self.searches += 1
+        top = np.argsort(-scores)[:k]
+        hits = [(int(candidates[i]), float(scores[i])) for i in top if scores[i] > threshold]
+        if not hits:
+            return []
+        marks = ",".join("?" * len(hits))
+        rows = self._db.execute(
+            f"SELECT pos, doc_id, content, metadata FROM docs WHERE pos IN ({marks})", [p for p, _ in hits]
+        ).fetchall()
+        by_pos = {r[0]: r for r in rows}
+        results = []
+        for pos, score in hits:
+            row = by_pos.get(pos)
+            if row:
+                results.append({
+                    "id": row[1], "content": row[2],
+                    "metadata": json.loads(row[3]) if row[3] else {}, "similarity": score,
+                })
+        return results
+
+    # --- Yazma (sadece yazıcı süreç) ---
+
+    def add(self, rows: List[Dict[str, Any]], hwm: int) -> int:
+        """Satırları (id, content, metadata, vector) sona ekler. Zaten olan doc_id'ler atlanır."""
+        if not self.writer:
+            raise RuntimeError("ANN indeksine sadece yazıcı süreç ekleyebilir")
+        known = set()
+        ids = [str(r["id"]) for r in rows]
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            marks = ",".join("?" * len(part))
+            known.update(x[0] for x in self._db.execute(f"SELECT doc_id FROM docs WHERE doc_id IN ({marks})", part))
+        fresh = [r for r in rows if str(r["id"]) not in known and r.get("vector")]
+        meta = dict(self.meta)
+        if fresh:
+            vectors = np.asarray([self.fmt.apply(r["vector"]) for r in fresh], dtype=np.float32)
+            dim = int(meta.get("dim") or vectors.shape[1])
+            keep = vectors.shape[1] == dim
+            if not keep:
+                logger.warning(f"⚠️ Boyutu uymayan {len(fresh)} vektör atlandı ({vectors.shape[1]} != {dim})")
+                fresh = []
+            else:
+                start = int(meta.get("count", 0))
+                # Yarım kalmış bir önceki yazımın artıklarını temizle (meta.json'daki count esastır)
+                self._truncate("vectors.bin", start * dim * np.dtype(self.dtype).itemsize)
+                self._truncate("assign.bin", start * 4)
+                with open(self._file("vectors.bin"), "ab") as f:
+                    f.write(vectors.astype(self.dtype).tobytes())
+                if meta.get("nlist"):
+                    centroids = np.load(self._file("centroids.npy"))
+                    assign = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+                    with open(self._file("assign.bin"), "ab") as f:
+                        f.write(assign.tobytes())
+                self._db.execute("BEGIN")
+                self._db.execute("DELETE FROM docs WHERE pos >= ?", (start,))
+                self._db.executemany(
+                    "INSERT INTO docs (pos, doc_id, content, metadata) VALUES (?, ?, ?, ?)",
+                    [(start + i, str(r["id"]), r.get("content"), json.dumps(r.get("metadata") or {}, ensure_ascii=False))
+                     for i, r in enumerate(fresh)]
+                )
+                self._db.execute("COMMIT")
+                meta.update(dim=dim, count=start + len(fresh))
+        meta["hwm"] = max(int(meta.get("hwm", 0)), hwm)
+        meta["generation"] = int(meta.get("generation", 0)) + 1
+        self._write_meta(meta)
+
+        trained = int(meta.get("trained_count", 0))
+        count = int(meta.get("count", 0))
+        if count >= ANN_MIN_TRAIN and (not trained or count >= trained * ANN_RETRAIN_GROWTH):
+            self.train()
+        else:
+            self.reload()
+        return len(fresh)
+
+    def remove(self, doc_ids: List[str]) -> int:
+        """
+        Silinen documents satırlarını içerik aynasından çıkarır. Vektör dosyada kalır ama search() içeriği
+        olmayan pozisyonu atlar. Ayna sqlite'ta paylaşıldığı için her süreç çağırabilir.
+        """
+        ids = [str(d) for d in doc_ids]
+        removed = 0
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            marks = ",".join("?" * len(part))
+            removed += self._db.execute(f"DELETE FROM docs WHERE doc_id IN ({marks})", part).rowcount
+        return removed
+
+    def train(self):
+        """Kümeleri yeniden eğitir ve tüm satırları yeniden atar (dosyalar atomik değiştirilir)."""
+        meta = dict(self._read_meta())
+        count, dim = int(meta.get("count", 0)), int(meta.get("dim", 0))
+        if not count:
+            return
+        t0 = time.perf_counter()
+        vectors = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r", shape=(count, dim))
+        nlist = _nlist_for(count)
+        rng = np.random.default_rng(7)
+        sample_idx = np.sort(rng.choice(count, min(count, 64 * nlist), replace=False))
+        centroids = kmeans(np.asarray(vectors[sample_idx], dtype=np.float32), nlist)
+
+        assign = np.empty(count, dtype=np.int32)
+        for start in range(0, count, 65536):
+            block = np.asarray(vectors[start:start + 65536], dtype=np.float32)
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+
+        np.save(self._file("centroids.tmp.npy"), centroids)
+        os.replace(self._file("centroids.tmp.npy"), self._file("centroids.npy"))
+        assign.tofile(self._file("assign.tmp"))
+        os.replace(self._file("assign.tmp"), self._file("assign.bin"))
+        meta.update(nlist=nlist, trained_count=count, generation=int(meta.get("generation", 0)) + 1)
+        self._write_meta(meta)
+        self.reload()
+        logger.info(f"🧮 ANN kümeleri eğitildi: {count} vektör, {nlist} küme, {time.perf_counter() - t0:.1f}s")
+
+    def sync_once(self, client) -> int:
+        """documents'tan yüksek su işaretinden sonraki satırları çeker. Eklenen satır sayısını döndürür."""
+        if not self.writer:
+            self.reload()
+            return 0
+        column = self.fmt.column
+        added = 0
+        hwm = int(self.meta.get("hwm", 0))
+        cursor = max(0, hwm - ANN_SYNC_OVERLAP)
+        while True:
+            data = (
+                client.table("documents")
+                .select(f"id, content, metadata, {SEQ_COLUMN}, {column}")
+                .gt(SEQ_COLUMN, cursor)
+                .not_.is_(column, "null")
+                .order(SEQ_COLUMN)
+                .limit(ANN_SYNC_BATCH)
+                .execute().data or []
+            )
+            if not data:
+                break
+            rows = [{
+                "id": d["id"], "content": d.get("content"), "metadata": d.get("metadata"),
+                "vector": json.loads(d[column]) if isinstance(d[column], str) else d[column],
+            } for d in data]
+            cursor = int(data[-1][SEQ_COLUMN])
+            added += self.add(rows, cursor)
+            if len(data) < ANN_SYNC_BATCH:
+                break
+        self.last_sync = time.time()
+        self.last_sync_added = added
+        if added:
+            logger.info(f"🔄 ANN indeksine {added} yeni doküman eklendi (toplam {self.count})")
+        return added
+
+    def start_sync(self, client, interval: float = ANN_SYNC_SECONDS):
+        if self._thread:
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.sync_once(client)
+                except Exception as e:
+                    logger.error(f"❌ ANN Senkron Hatası: {e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, daemon=True, name="ann-sync")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "format": self.fmt.label,
+            "count": self.count,
+            "nlist": int(self.meta.get("nlist", 0)),
+            "nprobe": self.nprobe,
+            "hwm": int(self.meta.get("hwm", 0)),
+            "writer": self.writer,
+            "searches": self.searches,
+            "last_sync": self.last_sync,
+            "last_sync_added": self.last_sync_added,
+        }
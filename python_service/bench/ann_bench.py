@@ -0,0 +1,103 @@
+"""
+Süreç içi ANN indeksi vs. Supabase match_documents RPC: recall@k ve gecikme.
+
+Önce indeks senkronlanır (ANN_INDEX_DIR), sonra aynı sorgular iki yoldan da çalıştırılır.
+Recall iki referansa göre raporlanır: RPC sonuçları ve yerel tam tarama (nprobe = tüm kümeler).
+
+Kullanım (python_service klasöründen):
+    python bench/ann_bench.py --num-queries 200 --nprobe 4 8 16 32
+    python bench/ann_bench.py --queries sorular.txt --no-rpc
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import AnnIndex  # noqa: E402
+from vector_format import match_request  # noqa: E402
+from chunking import split_sentences  # noqa: E402
+
+
+def percentiles(values):
+    arr = np.asarray(values) * 1000
+    return f"p50={np.percentile(arr, 50):7.2f}ms p95={np.percentile(arr, 95):7.2f}ms"
+
+
+def recall(reference, found, k):
+    scores = [len(set(r[:k]) & set(f[:k])) / max(min(k, len(r)), 1) for r, f in zip(reference, found) if r]
+    return float(np.mean(scores)) if scores else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN indeks benchmark")
+    parser.add_argument("--queries", help="Her satırda bir sorgu")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=0.0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    parser.add_argument("--no-rpc", action="store_true", help="Sadece yerel indeksi ölç")
+    args = parser.parse_args()
+
+    from vector_migrate import _client
+    from sentence_transformers import SentenceTransformer
+
+    client = None if args.no_rpc else _client()
+    index = AnnIndex().open()
+    if index.writer and client is not None:
+        t0 = time.perf_counter()
+        added = index.sync_once(client)
+        print(f"Senkron: +{added} doküman, {time.perf_counter() - t0:.1f}s")
+    if not index.ready:
+        sys.exit("İndeks boş. ANN_INDEX_ENABLED=1 ile servisi çalıştırın veya RPC erişimi verin.")
+    stats = index.stats()
+    print(f"İndeks: {stats['count']} vektör, {stats['nlist']} küme, biçim {stats['format']}\n")
+
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        rnd = random.Random(7)
+        positions = rnd.sample(range(index.count), min(args.num_queries, index.count))
+        marks = ",".join("?" * len(positions))
+        texts = [r[0] or "" for r in index._db.execute(f"SELECT content FROM docs WHERE pos IN ({marks})", positions)]
+        questions = [(split_sentences(t) or [t])[0][:300] for t in texts if t.strip()]
+
+    model = SentenceTransformer(args.model, device="cpu")
+    vectors = model.encode(questions, batch_size=32, normalize_embeddings=True, show_progress_bar=False).tolist()
+
+    rpc_ids, rpc_times = [], []
+    if client is not None:
+        for vec in vectors:
+            rpc, params = match_request(vec, args.threshold, args.k)
+            t0 = time.perf_counter()
+            data = client.rpc(rpc, params).execute().data or []
+            rpc_times.append(time.perf_counter() - t0)
+            rpc_ids.append([str(d["id"]) for d in data])
+        print(f"{'RPC':14s} {percentiles(rpc_times)}")
+
+    nlist = max(stats["nlist"], 1)
+    index.nprobe = nlist
+    exact_ids = [[d["id"] for d in index.search(v, args.k, args.threshold)] for v in vectors]
+
+    for nprobe in sorted(set(args.nprobe + [nlist])):
+        index.nprobe = nprobe
+        times, found = [], []
+        for vec in vectors:
+            t0 = time.perf_counter()
+            docs = index.search(vec, args.k, args.threshold)
+            times.append(time.perf_counter() - t0)
+            found.append([d["id"] for d in docs])
+        line = f"{'ANN nprobe=' + str(nprobe):14s} {percentiles(times)}  recall@{args.k}(tam)={recall(exact_ids, found, args.k):.4f}"
+        if rpc_ids:
+            line += f"  recall@{args.k}(rpc)={recall(rpc_ids, found, args.k):.4f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
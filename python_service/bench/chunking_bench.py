@@ -0,0 +1,97 @@
+"""
+Chunker karşılaştırması: eski karakter dilimleyici vs. yapı duyarlı token chunker.
+
+Kullanım (python_service klasöründen):
+    python bench/chunking_bench.py dosya1.pdf dosya2.txt
+    python bench/chunking_bench.py --synthetic 400            # örnek kanun metni üretir
+    python bench/chunking_bench.py kanun.pdf --embed          # ingest süresini de ölçer (model yükler)
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chunking import CharChunker, LegalChunker, TokenCounter, get_chunker  # noqa: E402
+from extraction import extract_pdf_path  # noqa: E402
+
+
+def synthetic_statute(articles: int, seed: int = 7) -> str:
+    rnd = random.Random(seed)
+    words = ("hak", "yükümlülük", "sözleşme", "kiracı", "kiraya", "veren", "tazminat", "süre", "ihtar",
+             "mahkeme", "karar", "başvuru", "itiraz", "kanun", "hüküm", "uygulanır", "saklıdır", "taraflar")
+    parts = ["TÜRK BORÇLAR KANUNU\n"]
+    for n in range(1, articles + 1):
+        paras = []
+        for p in range(rnd.randint(1, 4)):
+            sentences = [
+                " ".join(rnd.choice(words) for _ in range(rnd.randint(6, 25))).capitalize() + "."
+                for _ in range(rnd.randint(1, 6))
+            ]
+            paras.append(f"({p + 1}) " + " ".join(sentences))
+        parts.append(f"MADDE {n} – " + "\n".join(paras))
+    return "\n\n".join(parts)
+
+
+def load_text(path: str) -> str:
+    if path.lower().endswith(".pdf"):
+        return extract_pdf_path(path).text
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+def measure(chunker, text: str, counter: TokenCounter, limit: int, model=None) -> dict:
+    t0 = time.perf_counter()
+    chunks = chunker.chunk(text)
+    chunk_seconds = time.perf_counter() - t0
+
+    tokens = counter.count_many(chunks) if chunks else []
+    total_chars = sum(len(c) for c in chunks)
+    row = {
+        "chunker": chunker.name,
+        "chunks": len(chunks),
+        "avg_tokens": round(sum(tokens) / len(tokens), 1) if tokens else 0,
+        "max_tokens": max(tokens) if tokens else 0,
+        "truncated": sum(1 for n in tokens if n > limit),
+        "dup_ratio": round(max(total_chars - len(text), 0) / max(len(text), 1), 3),
+        "chunk_ms": round(chunk_seconds * 1000, 1),
+    }
+    if model is not None and chunks:
+        t0 = time.perf_counter()
+        model.encode(chunks, batch_size=32, normalize_embeddings=True, show_progress_bar=False)
+        row["embed_s"] = round(time.perf_counter() - t0, 2)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunker benchmark")
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--synthetic", type=int, default=0, help="Üretilecek madde sayısı")
+    parser.add_argument("--embed", action="store_true", help="Embedding süresini de ölç")
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    args = parser.parse_args()
+
+    model = None
+    if args.embed:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.model, device="cpu")
+
+    legal = get_chunker(model) if model is not None else LegalChunker()
+    counter = legal.counter
+    limit = getattr(model, "max_seq_length", None) or legal.max_tokens
+
+    inputs = [(p, load_text(p)) for p in args.files]
+    if args.synthetic or not inputs:
+        inputs.append((f"synthetic[{args.synthetic or 300}]", synthetic_statute(args.synthetic or 300)))
+
+    for name, text in inputs:
+        print(f"\n=== {name} ({len(text):,} karakter) ===")
+        for chunker in (CharChunker(), legal):
+            row = measure(chunker, text, counter, limit, model)
+            print("  " + "  ".join(f"{k}={v}" for k, v in row.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Embedding backend karşılaştırması: torch fp32 / onnx fp32 / onnx int8.
+Her backend için yükleme süresi, throughput (metin/sn) ve fp32'ye göre kosinüs paritesi raporlanır.
+
+Kullanım (python_service klasöründen):
+    python bench/embedding_backends_bench.py
+    python bench/embedding_backends_bench.py --model BAAI/bge-m3 --texts 512 --backends torch onnx-int8
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_backends import BACKENDS, PARITY_SAMPLE, load_embedding_model, parity_check, throughput  # noqa: E402
+from chunking import LegalChunker  # noqa: E402
+from bench.chunking_bench import synthetic_statute  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend benchmark")
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    parser.add_argument("--texts", type=int, default=256, help="Throughput için chunk sayısı")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    args = parser.parse_args()
+
+    # Gerçekçi uzunlukta chunk'lar: sentetik kanun metni, yapı duyarlı chunker ile
+    chunks = LegalChunker().chunk(synthetic_statute(args.texts))[:args.texts]
+    print(f"{len(chunks)} chunk, model: {args.model}\n")
+
+    reference = None
+    for backend in args.backends:
+        t0 = time.perf_counter()
+        model, used = load_embedding_model(args.model, backend)
+        load_s = time.perf_counter() - t0
+        if used != backend:
+            print(f"{backend:10s} yüklenemedi (torch'a düştü), atlanıyor")
+            continue
+        if reference is None:
+            # Parite her zaman torch fp32'ye göre ölçülür
+            reference = model if backend == "torch" else load_embedding_model(args.model, "torch")[0]
+
+        speed = throughput(model, chunks, batch_size=args.batch_size)
+        parity = parity_check(model, reference, PARITY_SAMPLE + chunks[:22])
+        print(
+            f"{backend:10s} yükleme={load_s:6.1f}s  {speed['texts_per_sec']:8.1f} metin/sn  "
+            f"parite ort={parity['mean_cos']:.4f} min={parity['min_cos']:.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
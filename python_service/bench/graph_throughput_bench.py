@@ -0,0 +1,142 @@
+"""
+Eşzamanlı graph çalışmalarının örtüşüp örtüşmediğini ölçer (LLM çağrıları event loop'u bloklamamalı).
+
+N soru önce sırayla, sonra aynı anda çalıştırılır. Rapor:
+  - duvar saati süresi ve örtüşme oranı (çalışma sürelerinin toplamı / duvar saati; ~N ise tam örtüşme)
+  - event loop gecikmesi (10 ms'lik bir ticker'ın en büyük gecikmesi; bloklayan çağrı varsa saniyeler olur)
+  - sağlayıcı başına en yüksek eşzamanlı çağrı (LLM_CONCURRENCY_* sınırı)
+
+Varsayılan: katmanların sağlayıcı çağrıları --latency saniye süren sahte çağrılarla değiştirilir (API anahtarı gerekmez).
+--live: gerçek katmanlar ve API'ler kullanılır.
+
+Kullanım (python_service klasöründen):
+    python bench/graph_throughput_bench.py --runs 16 --latency 0.5
+    LLM_CONCURRENCY_GEMINI=4 python bench/graph_throughput_bench.py --runs 16
+    python bench/graph_throughput_bench.py --live --runs 4 --query "Kira artış oranı nedir?"
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_limits import provider_slot, provider_limiter  # noqa: E402
+
+
+def install_fake_layers(graph, latency: float):
+    """Katmanların dış çağrılarını sağlayıcı slot'u içinde asyncio.sleep yapan sahte çağrılarla değiştirir."""
+    from layers.guard import GuardOutput
+    from layers.understanding import QueryUnderstanding
+    from layers.router import RouteDecision
+    from layers.rag import RagResult
+    from layers.expert import ExpertResult
+    from layers.author import AuthorResult
+
+    async def call(provider: str = "gemini"):
+        async with provider_slot(provider):
+            await asyncio.sleep(latency)
+
+    async def analyze(query):
+        await call()
+        return QueryUnderstanding(is_safe=True, category="SAFE", refined_query=query, route="internal",
+                                  route_confidence=1.0, intent="INTERNAL", complexity=3, topic="bench")
+
+    async def analyze_input(query):
+        await call()
+        return GuardOutput(is_safe=True, safe=True, category="SAFE", original_query=query,
+                           refined_query=query, reason="bench", confidence_score=1.0)
+
+    async def decide(query, understanding=None, embedding=None):
+        if not understanding:
+            await call()
+        return RouteDecision(route="internal", confidence=1.0, reasoning="bench")
+
+    async def search(query, intent=None, embedding=None):
+        await call()
+        return RagResult(found=True, source_type="internal", context_str="bench", sources=[], chunks=[])
+
+    async def embed_query(query):
+        # Gerçek embedder (yerel model / Gemini) hiç çağrılmaz
+        return [0.0] * 8
+
+    async def get_response(query, context="", complexity_data=None):
+        if complexity_data is None:
+            await call()
+        await call()
+        return ExpertResult(answer="bench", model_used="bench", complexity_score=1, topic="bench", reasoning="")
+
+    async def write_report(query, rag_result=None, web_result=None, expert_result=None):
+        await call()
+        return AuthorResult(final_markdown="bench")
+
+    graph.understanding_layer.analyze = analyze
+    graph.guard_layer.analyze_input = analyze_input
+    graph.router_layer.decide = decide
+    graph.rag_layer.search = search
+    graph.rag_layer.embed_query = embed_query
+    graph.expert_layer.get_response = get_response
+    graph.author_layer.write_report = write_report
+    graph.supabase_client = None
+
+
+async def loop_lag_monitor(stop: asyncio.Event, interval: float = 0.01) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - t0 - interval)
+    return worst
+
+
+async def run_one(graph, query: str, i: int) -> float:
+    t0 = time.perf_counter()
+    await graph.app.ainvoke({
+        "question_id": f"bench-{i}", "query": query, "safety_status": "unknown",
+        "route": "internal", "final_report": "", "status": "processing",
+    })
+    return time.perf_counter() - t0
+
+
+async def measure(graph, query: str, runs: int, concurrent: bool):
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(loop_lag_monitor(stop))
+    t0 = time.perf_counter()
+    if concurrent:
+        durations = await asyncio.gather(*(run_one(graph, query, i) for i in range(runs)))
+    else:
+        durations = [await run_one(graph, query, i) for i in range(runs)]
+    wall = time.perf_counter() - t0
+    stop.set()
+    lag = await monitor
+    return wall, sum(durations), lag
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Eşzamanlı graph çalışması throughput benchmark")
+    parser.add_argument("--runs", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.5, help="Sahte sağlayıcı çağrısı süresi (s)")
+    parser.add_argument("--query", default="Kiracı kira bedelini ödemezse tahliye süreci nasıl işler?")
+    parser.add_argument("--live", action="store_true", help="Gerçek katmanlar / API'ler")
+    args = parser.parse_args()
+
+    import graph
+    if not args.live:
+        install_fake_layers(graph, args.latency)
+
+    print(f"{args.runs} çalışma, {'canlı' if args.live else f'sahte gecikme {args.latency}s'}\n")
+    print(f"{'mod':10s} {'duvar s':>8s} {'toplam s':>9s} {'örtüşme':>8s} {'çalışma/s':>10s} {'loop gecikmesi':>15s}")
+    for label, concurrent in (("sıralı", False), ("eşzamanlı", True)):
+        wall, total, lag = await measure(graph, args.query, args.runs, concurrent)
+        print(f"{label:10s} {wall:8.2f} {total:9.2f} {total / wall:8.2f} {args.runs / wall:10.2f} {lag * 1000:12.1f} ms")
+
+    print("\nSağlayıcı sınırları:")
+    for provider, stat in provider_limiter.stats().items():
+        print(f"  {provider:10s} limit={stat['limit']:3d} en yüksek eşzamanlı={stat['peak_in_flight']:3d} "
+              f"ort. bekleme={stat['wait_ms_avg']:.1f} ms "
+              f"en derin sıra={stat['peak_queue_depth']:3d} 429={stat['rate_limited']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+"""
+Kompakt vektör biçimleri için recall / boyut karşılaştırması (float32 tam boyut referans).
+Her biçim için: bayt/vektör, insert JSON payload'ı, recall@k ve tam tarama süresi.
+
+Kullanım (python_service klasöründen):
+    python bench/vector_format_bench.py --from-db 20000                 # documents tablosundan (kendi korpusumuz)
+    python bench/vector_format_bench.py --from-db 20000 --queries sorular.txt
+    python bench/vector_format_bench.py kanun.pdf sozlesme.txt          # dosyaları chunk'layıp vektörler
+
+Sorgu dosyası verilmezse korpustan rastgele chunk'ların ilk cümlesi sorgu olarak kullanılır.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_format import VectorFormat  # noqa: E402
+from chunking import get_chunker, split_sentences  # noqa: E402
+
+DEFAULT_FORMATS = ["float32/0", "float16/0", "float16/768", "float16/512", "float32/256", "float16/256", "float16/128"]
+
+
+def _normalize(m: np.ndarray) -> np.ndarray:
+    return m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+
+def compact_matrix(m: np.ndarray, fmt: VectorFormat) -> np.ndarray:
+    """VectorFormat.apply'ın vektörize karşılığı (float16 yuvarlama aynı: round-to-nearest-even)."""
+    if fmt.dim and fmt.dim < m.shape[1]:
+        m = _normalize(m[:, :fmt.dim])
+    if fmt.dtype == "float16":
+        m = m.astype(np.float16).astype(np.float32)
+    return m
+
+
+def load_from_db(limit: int):
+    from vector_migrate import _client
+
+    client = _client()
+    rows, page, last = [], 1000, None
+    while len(rows) < limit:
+        query = client.table("documents").select("id, content, embedding").not_.is_("embedding", "null").order("id")
+        if last is not None:
+            query = query.gt("id", last)
+        data = query.limit(min(page, limit - len(rows))).execute().data or []
+        if not data:
+            break
+        rows.extend(data)
+        last = data[-1]["id"]
+    texts = [r["content"] for r in rows]
+    vectors = [json.loads(r["embedding"]) if isinstance(r["embedding"], str) else r["embedding"] for r in rows]
+    return texts, np.asarray(vectors, dtype=np.float32)
+
+
+def load_from_files(paths, model):
+    from bench.chunking_bench import load_text
+
+    chunker = get_chunker(model)
+    texts = [c for p in paths for c in chunker.chunk(load_text(p))]
+    vectors = model.encode(texts, batch_size=32, normalize_embeddings=True, show_progress_bar=False)
+    return texts, np.asarray(vectors, dtype=np.float32)
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)]))
+
+
+def top_k(docs: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = queries @ docs.T
+    idx = np.argpartition(-scores, k, axis=1)[:, :k]
+    order = np.take_along_axis(scores, idx, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(idx, order, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kompakt vektör recall/boyut benchmark")
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--from-db", type=int, default=0, help="documents tablosundan okunacak satır sayısı")
+    parser.add_argument("--queries", help="Her satırda bir sorgu")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    parser.add_argument("--formats", nargs="+", default=DEFAULT_FORMATS, help="dtype/dim (0: tam boyut)")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(args.model, device="cpu")
+
+    if args.from_db:
+        texts, docs = load_from_db(args.from_db)
+    elif args.files:
+        texts, docs = load_from_files(args.files, model)
+    else:
+        sys.exit("--from-db N veya dosya yolu verin.")
+    docs = _normalize(docs)
+
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    else:
+        rnd = random.Random(7)
+        sample = rnd.sample(texts, min(args.num_queries, len(texts)))
+        questions = [(split_sentences(t) or [t])[0][:300] for t in sample]
+    queries = _normalize(np.asarray(
+        model.encode(questions, batch_size=32, normalize_embeddings=True, show_progress_bar=False), dtype=np.float32
+    ))
+
+    full_dim = docs.shape[1]
+    k = min(args.k, len(docs) - 1)
+    truth = top_k(docs, queries, k)
+    print(f"{len(docs)} doküman, {len(queries)} sorgu, boyut {full_dim}, recall@{k}\n")
+    print(f"{'biçim':16s} {'bayt/vek':>9s} {'toplam MB':>10s} {'JSON/vek':>9s} {'recall':>8s} {'tarama ms':>10s}")
+
+    for spec in args.formats:
+        dtype, dim = spec.split("/")
+        fmt = VectorFormat(dtype, int(dim))
+        d = compact_matrix(docs, fmt)
+        q = compact_matrix(queries, fmt)
+        t0 = time.perf_counter()
+        found = top_k(d, q, k)
+        scan_ms = (time.perf_counter() - t0) * 1000 / len(q)
+        payload = np.mean([len(json.dumps(fmt.apply(v.tolist()))) for v in docs[:50]])
+        size = fmt.bytes_per_vector(full_dim)
+        print(f"{fmt.label:16s} {size:9d} {size * len(docs) / 2**20:10.1f} {payload:9.0f} "
+              f"{recall_at_k(truth, found):8.4f} {scan_ms:10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import os
+import re
+import logging
+from typing import Iterable, Iterator, List, Optional
+
+# Metin parçalama (chunking).
+# - CharChunker: eski karakter tabanlı kaydırmalı pencere (800 karakter / 100 örtüşme).
+# - LegalChunker: boyutu model token'ı ile ölçer; madde > paragraf > cümle > kelime
+#   sınırlarını tercih eder. Regex'ler modül yüklenirken bir kez derlenir.
+
+logger = logging.getLogger("BabyLexitChunking")
+
+# --- AYARLAR ---
+CHUNKER = os.getenv("CHUNKER", "legal").lower()           # legal | char
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "128"))
+CHUNK_OVERLAP_SENTENCES = int(os.getenv("CHUNK_OVERLAP_SENTENCES", "0"))
+# Akış modunda bu kadar karakter birikince son güvenli sınırdan kesilip parçalanır
+CHUNK_STREAM_WINDOW_CHARS = int(os.getenv("CHUNK_STREAM_WINDOW_CHARS", "65536"))
+
+# --- ÖNCEDEN DERLENMİŞ SEGMENTASYON DESENLERİ ---
+# "MADDE 12 –", "Madde 5-", "GEÇİCİ MADDE 3", "EK MADDE 1", "Md. 7"
+_ARTICLE_RE = re.compile(
+    r"(?m)^[ \t]*(?:(?:GEÇİCİ|Geçici|EK|Ek)\s+)?(?:MADDE|Madde)\s+\d+[/A-Za-z]*\b|^[ \t]*Md\.\s*\d+"
+)
+_PARAGRAPH_RE = re.compile(r"\n[ \t]*\n+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…:;])\s+(?=[\"'“(]?[A-ZÇĞİÖŞÜ0-9(])")
+_WORD_RE = re.compile(r"\S+\s*")
+_APPROX_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+# Cümle sonu sanılmaması gereken kısaltmalar (atıf ve künyelerde sık geçer)
+_ABBREVIATIONS = frozenset({
+    "m.", "md.", "mad.", "f.", "fık.", "b.", "bnt.", "vb.", "vs.", "bkz.", "krş.", "s.", "sy.", "no.",
+    "av.", "dr.", "prof.", "doç.", "yrd.", "öğr.", "e.", "k.", "t.", "hd.", "cgk.", "hgk.", "ibk.", "yhgk.",
+    "tbk.", "tmk.", "tck.", "cmk.", "hmk.", "iik.", "ttk.", "ymk.", "st.", "sn.", "no:", "esas.", "karar.",
+})
+# Baş harf ("Ahmet B.") ve sıra sayısı ("4. Hukuk Dairesi") cümle sonu değildir
+_INITIAL_RE = re.compile(r"(?:^|\s)(?:[A-ZÇĞİÖŞÜ]|\d+)\.$")
+
+
+# -----------------------------------------------------------------------------
+# TOKEN SAYIMI
+# -----------------------------------------------------------------------------
+
+class TokenCounter:
+    """Embedding modelinin tokenizer'ı ile sayar; yoksa hızlı bir regex tahmini kullanır."""
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer
+
+    @classmethod
+    def for_model(cls, model) -> "TokenCounter":
+        return cls(getattr(model, "tokenizer", None) if model is not None else None)
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        if self.tokenizer is not None:
+            try:
+                ids = self.tokenizer(
+                    texts, add_special_tokens=False,
+                    return_attention_mask=False, return_token_type_ids=False
+                )["input_ids"]
+                return [len(x) for x in ids]
+            except Exception as e:
+                logger.warning(f"⚠️ Tokenizer hatası ({e}), yaklaşık sayım kullanılıyor.")
+                self.tokenizer = None
+        # Türkçe sondan eklemeli olduğu için kelime başına ~1.3 alt-kelime varsayıyoruz
+        return [int(len(_APPROX_TOKEN_RE.findall(t)) * 1.3) + 1 for t in texts]
+
+    def count(self, text: str) -> int:
+        return self.count_many([text])[0]
+
+
+# -----------------------------------------------------------------------------
+# SEGMENTASYON
+# -----------------------------------------------------------------------------
+
+def _split_at(pattern: re.Pattern, text: str) -> List[str]:
+    """Desenin eşleştiği konumlardan böler (eşleşme sonraki parçanın başında kalır)."""
+    starts = [m.start() for m in pattern.finditer(text)]
+    if not starts:
+        return [text]
+    if starts[0] != 0:
+        starts.insert(0, 0)
+    starts.append(len(text))
+    return [text[a:b] for a, b in zip(starts, starts[1:]) if text[a:b].strip()]
+
+
+def split_articles(text: str) -> List[str]:
+    return _split_at(_ARTICLE_RE, text)
+
+
+def split_paragraphs(text: str) -> List[str]:
+    return [p for p in _PARAGRAPH_RE.split(text) if p.strip()]
+
+
+def _ends_with_abbreviation(fragment: str) -> bool:
+    tail = fragment.rstrip()
+    last = tail.rsplit(None, 1)[-1].lower() if tail else ""
+    return last in _ABBREVIATIONS or bool(_INITIAL_RE.search(tail))
+
+
+def split_sentences(text: str) -> List[str]:
+    parts = _SENTENCE_RE.split(text)
+    sentences: List[str] = []
+    for part in parts:
+        if sentences and _ends_with_abbreviation(sentences[-1]):
+            sentences[-1] = f"{sentences[-1]} {part}"
+        else:
+            sentences.append(part)
+    return [s for s in sentences if s.strip()]
+
+
+def split_words(text: str) -> List[str]:
+    return _WORD_RE.findall(text)
+
+
+# -----------------------------------------------------------------------------
+# CHUNKER'LAR
+# -----------------------------------------------------------------------------
+
+class CharChunker:
+    """Eski karakter tabanlı parçalayıcı (kelime/madde sınırlarını gözetmez)."""
+    name = "char"
+
+    def __init__(self, chunk_size: int = 800, overlap: int = 100):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    def chunk(self, text: str) -> List[str]:
+        chunks = []
+        start = 0
+        while start < len(text):
+            end = start + self.chunk_size
+            chunk = text[start:end]
+            if chunk: chunks.append(chunk)
+            start = end - self.overlap
+        return chunks
+
+    def iter_chunks(self, pieces: Iterable[str]) -> Iterator[str]:
+        """chunk() ile aynı parçaları üretir ama metnin tamamını bellekte tutmaz. Boş parçalar atlanır."""
+        step = self.chunk_size - self.overlap
+        buf = ""
+        for piece in pieces:
+            buf += piece
+            start = 0
+            while len(buf) - start >= self.chunk_size:
+                chunk = buf[start:start + self.chunk_size]
+                if chunk.strip(): yield chunk
+                start += step
+            buf = buf[start:]
+        if buf.strip():
+            yield buf
+
+
+class LegalChunker:
+    """
+    Türk hukuk metinleri için yapı duyarlı, token tabanlı parçalayıcı.
+    Her chunk en fazla `max_tokens` model token'ıdır. Maddeler mümkünse bölünmez;
+    `min_tokens`'tan kısa ardışık maddeler birleştirilir.
+    """
+    name = "legal"
+
+    def __init__(self, counter: Optional[TokenCounter] = None,
+                 max_tokens: int = CHUNK_MAX_TOKENS, min_tokens: int = CHUNK_MIN_TOKENS,
+                 overlap_sentences: int = CHUNK_OVERLAP_SENTENCES):
+        self.counter = counter or TokenCounter()
+        self.max_tokens = max_tokens
+        self.min_tokens = min(min_tokens, max_tokens)
+        self.overlap_sentences = overlap_sentences
+
+    # Seviye sırası: paragraf -> cümle -> kelime
+    _LEVELS = (split_paragraphs, split_sentences, split_words)
+
+    def _fit(self, text: str, tokens: int, level: int) -> List[tuple]:
+        """Metni (parça, token) listesine böler; her parça max_tokens'a sığar."""
+        if tokens <= self.max_tokens or level >= len(self._LEVELS):
+            return [(text, tokens)]
+        units = self._LEVELS[level](text)
+        if len(units) <= 1:
+            return self._fit(text, tokens, level + 1)
+        counts = self.counter.count_many(units)
+        pieces = []
+        for unit, n in zip(units, counts):
+            pieces.extend(self._fit(unit, n, level + 1))
+        sep = " " if level >= 1 else "\n\n"
+        return self._merge(pieces, sep, limit=self.max_tokens)
+
+    def _merge(self, pieces: List[tuple], sep: str, limit: int, only_below: int = 0) -> List[tuple]:
+        """Ardışık parçaları `limit`'i aşmadan birleştirir (token toplamı yaklaşık toplanır)."""
+        out: List[tuple] = []
+        for text, n in pieces:
+            text = text.strip()
+            if not text:
+                continue
+            if out:
+                prev_text, prev_n = out[-1]
+                fits = prev_n + n <= limit
+                if fits and (not only_below or prev_n < only_below):
+                    out[-1] = (f"{prev_text}{sep}{text}", prev_n + n)
+                    continue
+            out.append((text, n))
+        return out
+
+    def _with_overlap(self, chunks: List[str]) -> List[str]:
+        if self.overlap_sentences <= 0 or len(chunks) < 2:
+            return chunks
+        out = [chunks[0]]
+        for prev, cur in zip(chunks, chunks[1:]):
+            tail = " ".join(split_sentences(prev)[-self.overlap_sentences:])
+            out.append(f"{tail} {cur}")
+        return out
+
+    def chunk(self, text: str) -> List[str]:
+        if not text or not text.strip():
+            return []
+        articles = split_articles(text)
+        counts = self.counter.count_many(articles)
+        pieces = []
+        for article, n in zip(articles, counts):
+            pieces.extend(self._fit(article, n, 0))
+        # Kısa maddeleri komşularıyla birleştir, uzun maddeler kendi chunk'ında kalır
+        merged = self._merge(pieces, "\n\n", limit=self.max_tokens, only_below=self.min_tokens)
+        return self._with_overlap([t for t, _ in merged])
+
+    def _safe_cut(self, buf: str) -> int:
+        """Akış tamponunda güvenli kesim noktası: son madde başı, yoksa son paragraf sonu."""
+        half = len(buf) // 2
+        last_article = None
+        for m in _ARTICLE_RE.finditer(buf, half):
+            last_article = m.start()
+        if last_article:
+            return last_article
+        para = buf.rfind("\n\n", half)
+        return para + 2 if para != -1 else len(buf)
+
+    def iter_chunks(self, pieces: Iterable[str]) -> Iterator[str]:
+        """Parça parça gelen metni sınırlı tamponla parçalar (akış modu)."""
+        buf = ""
+        for piece in pieces:
+            buf += piece
+            if len(buf) >= CHUNK_STREAM_WINDOW_CHARS:
+                cut = self._safe_cut(buf)
+                yield from self.chunk(buf[:cut])
+                buf = buf[cut:]
+        if buf.strip():
+            yield from self.chunk(buf)
+
+
+def get_chunker(model=None, name: str = CHUNKER):
+    """CHUNKER ayarına göre parçalayıcıyı döndürür. Token limiti modelin max_seq_length'ini aşmaz."""
+    if name == "char":
+        return CharChunker()
+    max_tokens = CHUNK_MAX_TOKENS
+    seq_len = getattr(model, "max_seq_length", None) if model is not None else None
+    if seq_len:
+        # [CLS]/[SEP] gibi özel token'lar için pay bırak
+        max_tokens = min(max_tokens, seq_len - 2)
+    return LegalChunker(TokenCounter.for_model(model), max_tokens=max_tokens)
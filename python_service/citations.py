@@ -0,0 +1,375 @@
+import os
+import re
+import pickle
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Kanun / madde atıf indeksi ("TCK 86", "TBK m. 344", "6098 sayılı Kanun'un 344. maddesi").
+# - Ingestion sırasında: kanun metinlerinde "MADDE 86" başlıkları o anki kanun bağlamıyla etiketlenir
+#   (metadata.articles), metin içindeki atıflar metadata.cites olarak saklanır.
+# - Sorguda: derlenmiş tek bir regex atıfları bulur, indeks (kanun, madde) -> chunk eşlemesini döndürür.
+#   Sadece atıftan oluşan sorgular ("TCK 86 nedir?") niyet sınıflandırma / embedding / RPC / rerank yolunu atlar;
+#   atıf içeren uzun sorularda madde chunk'ları vektör aramasının adaylarına eklenir.
+
+logger = logging.getLogger("BabyLexitCitations")
+
+# --- AYARLAR ---
+# Varsayılan kapalı: indeks her HTTP sürecinde (prefork çocukları dahil) ayrı tutulur ve paylaşılan bellek
+# kazancını bozar. Chunk etiketleme (CitationTagger, ingestion) bu ayardan bağımsız her zaman çalışır.
+CITATION_INDEX_ENABLED = os.getenv("CITATION_INDEX_ENABLED", "0") == "1"
+CITATION_INDEX_PATH = os.getenv(
+    "CITATION_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".citation_index", "citations.pkl")
+)
+CITATION_SYNC_SECONDS = float(os.getenv("CITATION_SYNC_SECONDS", "60"))
+CITATION_SYNC_BATCH = int(os.getenv("CITATION_SYNC_BATCH", "1000"))
+CITATION_SYNC_OVERLAP = int(os.getenv("CITATION_SYNC_OVERLAP", "500"))
+# Bir sorguda en fazla bu kadar madde chunk'ı döndürülür
+CITATION_MAX_CHUNKS = int(os.getenv("CITATION_MAX_CHUNKS", "5"))
+# Atıflar dışında en fazla bu kadar anlamlı kelime kalan sorgu "sadece atıf" sayılır ve RAG kısa devre yapar
+# ("TCK 86", "TBK m. 344 nedir?"); daha uzun sorularda madde chunk'ları normal aramaya eklenir
+CITATION_ONLY_MAX_WORDS = int(os.getenv("CITATION_ONLY_MAX_WORDS", "2"))
+
+SEQ_COLUMN = "ingest_seq"
+
+# Kod -> (kanun numarası, adlar ve kısaltmalar)
+LAWS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "TCK": ("5237", ("TCK", "Türk Ceza Kanunu")),
+    "TBK": ("6098", ("TBK", "Türk Borçlar Kanunu", "Borçlar Kanunu")),
+    "TMK": ("4721", ("TMK", "MK", "Türk Medeni Kanunu", "Medeni Kanun")),
+    "TTK": ("6102", ("TTK", "Türk Ticaret Kanunu")),
+    "HMK": ("6100", ("HMK", "Hukuk Muhakemeleri Kanunu")),
+    "CMK": ("5271", ("CMK", "Ceza Muhakemesi Kanunu")),
+    "İİK": ("2004", ("İİK", "IIK", "İcra ve İflas Kanunu", "İcra İflas Kanunu")),
+    "İK": ("4857", ("İş Kanunu", "İşK")),
+    "AY": ("2709", ("AY", "Anayasa", "T.C. Anayasası", "Türkiye Cumhuriyeti Anayasası")),
+    "TKHK": ("6502", ("TKHK", "Tüketicinin Korunması Hakkında Kanun")),
+    "KVKK": ("6698", ("KVKK", "Kişisel Verilerin Korunması Kanunu")),
+    "İYUK": ("2577", ("İYUK", "İdari Yargılama Usulü Kanunu")),
+    "KK": ("5326", ("Kabahatler Kanunu",)),
+    "KMK": ("634", ("KMK", "Kat Mülkiyeti Kanunu")),
+    "TrK": ("2918", ("KTK", "Karayolları Trafik Kanunu")),
+    "VUK": ("213", ("VUK", "Vergi Usul Kanunu")),
+}
+
+_ALIAS_TO_CODE: Dict[str, str] = {}
+for _code, (_number, _aliases) in LAWS.items():
+    for _alias in _aliases:
+        _ALIAS_TO_CODE[_alias.casefold()] = _code
+    _ALIAS_TO_CODE[f"{_number} sayılı".casefold()] = _code
+
+# Uzun adlar önce denenir ("Türk Medeni Kanunu" > "MK")
+_ALIAS_ALT = "|".join(re.escape(a) for a in sorted(
+    [a for _, aliases in LAWS.values() for a in aliases] + [f"{n} sayılı" for n, _ in LAWS.values()],
+    key=len, reverse=True
+))
+# Kanun adından sonra gelebilecek ekler / kelimeler: "TCK'nın", "6098 sayılı Kanun'un", "TBK’ya"
+_LAW_TAIL = r"(?:['’]?[a-zçğıöşü]{0,5})?(?:\s+(?:Kanun|Kanunu|Kanunun|Kanun['’][a-zçğıöşü]+))?"
+_ART_WORD = r"(?:m\.|md\.|mad\.|madde(?:si|sinin|sine|sinde)?|Madde)"
+
+# Madde kelimesi olmadan kanun adından sonra gelen sayı bu kelimelerden biriyle devam ediyorsa atıf değildir:
+# "TCK 5 yıl hapis", "TBK 2020 yılında", "İİK 30 gün içinde", "TTK 100 TL"
+_UNIT_WORD = (
+    r"(?:y[ıi]l|g[üu]n|hafta|saat|dakika|ya[şs]|ay(?![a-zçğıöşü])|ayl[ıi]k|aydan|ayda|aya|"
+    r"tl|lira|kuru[şs]|euro|dolar|adet|kez|kere|kişi|sayfa|%)"
+)
+# "TCK 86", "TCK m. 86", "TBK md. 344/2", "TCK'nın 86. maddesi"
+# Madde kelimesi yoksa (?(word)...) yıl benzeri sayılar (19xx/20xx) ve birim/zaman kelimesi izleyen sayılar elenir.
+_FORWARD_RE = re.compile(
+    rf"(?<![\wÇĞİÖŞÜçğıöşü])(?P<law>{_ALIAS_ALT}){_LAW_TAIL}\s*,?\s*(?P<word>{_ART_WORD}\s*)?"
+    rf"(?(word)|(?!(?:19|20)\d\d(?!\d)))(?P<art>\d{{1,4}})(?!\d)"
+    rf"(?(word)|(?![.\s'’]*{_UNIT_WORD}))(?:\s*/\s*\d+)?\.?"
+    rf"(?:\s*(?:{_ART_WORD}))?(?!\d)",
+    re.IGNORECASE
+)
+# "86. madde (TCK)", "344. maddesi ... TBK" (madde önce, kanun en fazla 40 karakter sonra)
+_BACKWARD_RE = re.compile(
+    rf"(?P<art>\d{{1,4}})\.?\s*{_ART_WORD}[^\n]{{0,40}}?(?<![\wÇĞİÖŞÜçğıöşü])(?P<law>{_ALIAS_ALT})(?![\wÇĞİÖŞÜçğıöşü])",
+    re.IGNORECASE
+)
+# Kanun metinlerindeki madde başlıkları
+_HEADING_RE = re.compile(r"(?m)^[ \t]*(?:(?:GEÇİCİ|Geçici|EK|Ek)\s+)?(?:MADDE|Madde)\s+(?P<art>\d+)\b")
+# Kanun başlığı: "TÜRK CEZA KANUNU" satırı veya "Kanun Numarası : 5237"
+_TITLE_RE = re.compile(
+    rf"(?m)^[ \t]*(?P<name>{_ALIAS_ALT})[ \t]*$|Kanun\s+Numarası\s*:?\s*(?P<number>\d{{2,5}})",
+    re.IGNORECASE
+)
+_NUMBER_TO_CODE = {number: code for code, (number, _) in LAWS.items()}
+# Günlük dilde de geçen kısaltmalar ("her ay 10 bin TL") yalnızca büyük harfle yazılınca atıf sayılır
+_CASE_SENSITIVE = frozenset({"ay", "mk"})
+
+
+def _code_for(alias: str) -> Optional[str]:
+    alias = alias.casefold()
+    return _ALIAS_TO_CODE.get(alias) or _ALIAS_TO_CODE.get(re.sub(r"\s+", " ", alias))
+
+
+def citation_key(code: str, article) -> str:
+    return f"{code} {int(article)}"
+
+
+def _iter_citations(text: str):
+    """(eşleşme, "TCK 86") çiftleri; kanun adı çözülemeyen ve küçük harfli "ay"/"mk" eşleşmeleri atlanır."""
+    for regex in (_FORWARD_RE, _BACKWARD_RE):
+        for m in regex.finditer(text or ""):
+            law = m.group("law")
+            if law.casefold() in _CASE_SENSITIVE and not law.isupper():
+                continue
+            code = _code_for(law)
+            if code:
+                yield m, citation_key(code, m.group("art"))
+
+
+def find_citations(text: str) -> List[str]:
+    """Metindeki kanun/madde atıflarını sırayla döndürür: ["TCK 86", "TBK 344"]."""
+    return list(dict.fromkeys(key for _, key in _iter_citations(text)))
+
+
+# Sadece-atıf sorgularında yok sayılan soru kalıpları ("TCK 86. madde ne diyor?")
+_QUERY_FILLER = frozenset({
+    "ne", "nedir", "neler", "nelerdir", "diyor", "der", "madde", "maddesi", "maddeleri", "metni", "metin",
+    "hükmü", "içeriği", "nasıl", "göre", "hakkında", "ve", "ile", "kanun", "kanunu", "sayılı", "mi", "mı",
+})
+
+
+def citation_only(text: str) -> bool:
+    """Sorgu, atıflar ve soru kalıpları çıkarılınca CITATION_ONLY_MAX_WORDS kelimeden fazla içermiyorsa True."""
+    spans = sorted({m.span() for m, _ in _iter_citations(text)})
+    if not spans:
+        return False
+    rest, last = [], 0
+    for start, end in spans:
+        rest.append(text[last:start])
+        last = max(last, end)
+    rest.append(text[last:])
+    words = [w for w in re.findall(r"\w+", " ".join(rest).casefold()) if w not in _QUERY_FILLER]
+    return len(words) <= CITATION_ONLY_MAX_WORDS
+
+
+def detect_law(text: str) -> Optional[str]:
+    """Kanun metni başlığını ("TÜRK BORÇLAR KANUNU", "Kanun Numarası: 6098") tanır."""
+    for m in _TITLE_RE.finditer(text or ""):
+        if m.group("number"):
+            code = _NUMBER_TO_CODE.get(m.group("number"))
+        else:
+            code = _code_for(m.group("name"))
+        if code:
+            return code
+    return None
+
+
+class CitationTagger:
+    """
+    Tek bir dosyanın chunk'larını sırayla etiketler. Kanun bağlamı dosyanın başlığından
+    (veya dosya adından) alınır ve yeni bir kanun başlığı görülene kadar korunur.
+    """
+
+    def __init__(self, source: str = ""):
+        self.law = detect_law(os.path.basename(source).replace("_", " ").rsplit(".", 1)[0])
+        # Uzun maddeler birden fazla chunk'a bölünür; başlıksız devam chunk'ları son maddeye aittir
+        self.article: Optional[str] = None
+
+    def _switch_law(self, text: str):
+        law = detect_law(text)
+        if law and law != self.law:
+            self.law, self.article = law, None
+
+    def tag(self, chunk: str) -> Dict[str, List[str]]:
+        articles: List[str] = []
+        pos = 0
+        for m in _HEADING_RE.finditer(chunk):
+            head = chunk[pos:m.start()]
+            # Madde başlığından önceki bölüm: önceki maddenin devamı veya yeni kanun başlığı (derleme dosyalar)
+            if pos == 0 and self.article and head.strip() and not detect_law(head):
+                articles.append(self.article)
+            self._switch_law(head)
+            pos = m.end()
+            if self.law:
+                key = citation_key(self.law, m.group("art"))
+                if key not in articles:
+                    articles.append(key)
+                self.article = key
+        if pos == 0:
+            self._switch_law(chunk)
+            if self.article and chunk.strip():
+                articles.append(self.article)
+        cites = [c for c in find_citations(chunk) if c not in articles]
+        tags: Dict[str, List[str]] = {}
+        if articles: tags["articles"] = articles
+        if cites: tags["cites"] = cites
+        return tags
+
+    def metadata_for(self, chunk: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        tags = self.tag(chunk)
+        return {**metadata, **tags} if tags else metadata
+
+
+class CitationIndex:
+    """(kanun, madde) -> chunk eşlemesi. Madde metni chunk'larının içeriği bellekte tutulur."""
+
+    def __init__(self, path: Optional[str] = CITATION_INDEX_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self.articles: Dict[str, List[str]] = {}       # "TCK 86" -> madde metnini içeren chunk id'leri
+        self.cites: Dict[str, List[str]] = {}          # "TCK 86" -> o maddeye atıf yapan chunk id'leri
+        self.chunks: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        self._seen: set = set()
+        self.hwm = 0
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.lookups = 0
+        self.hits = 0
+
+    def load(self) -> "CitationIndex":
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "rb") as f:
+                    state = pickle.load(f)
+                with self._lock:
+                    self.articles, self.cites, self.chunks, self._seen, self.hwm = state
+                logger.info(f"📑 Atıf indeksi yüklendi: {len(self.articles)} madde")
+            except Exception as e:
+                logger.warning(f"⚠️ Atıf snapshot okunamadı ({e}), sıfırdan kurulacak.")
+        return self
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with self._lock:
+            with open(tmp, "wb") as f:
+                pickle.dump((self.articles, self.cites, self.chunks, self._seen, self.hwm), f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            self._dirty = False
+        os.replace(tmp, self.path)
+
+    def add(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """documents satırlarını ekler. metadata.articles/cites yoksa (eski satırlar) atıflar içerikten çıkarılır."""
+        added = 0
+        with self._lock:
+            for row in rows:
+                doc_id = str(row.get("id") or "")
+                if not doc_id or doc_id in self._seen:
+                    continue
+                self._seen.add(doc_id)
+                metadata = row.get("metadata") or {}
+                articles = metadata.get("articles") or []
+                cites = metadata.get("cites")
+                if cites is None and not articles:
+                    cites = find_citations(row.get("content") or "")
+                for key in articles:
+                    self.articles.setdefault(key, []).append(doc_id)
+                    self.chunks[doc_id] = (row.get("content") or "", metadata)
+                for key in cites or []:
+                    self.cites.setdefault(key, []).append(doc_id)
+                added += 1
+            if added:
+                self._dirty = True
+        return added
+
+    def remove(self, doc_ids: Iterable[str]) -> int:
+        """Silinen documents satırlarını madde ve atıf listelerinden çıkarır."""
+        drop = {str(d) for d in doc_ids}
+        with self._lock:
+            drop &= self._seen
+            if not drop:
+                return 0
+            for table in (self.articles, self.cites):
+                for key in list(table):
+                    kept = [d for d in table[key] if d not in drop]
+                    if kept:
+                        table[key] = kept
+                    else:
+                        del table[key]
+            for doc_id in drop:
+                self.chunks.pop(doc_id, None)
+            self._seen -= drop
+            self._dirty = True
+        return len(drop)
+
+    def resolve(self, query: str) -> List[str]:
+        """Sorgudaki atıflardan indekste madde metni bulunanları döndürür."""
+        return [key for key in find_citations(query) if key in self.articles]
+
+    def lookup(self, query: str, limit: int = CITATION_MAX_CHUNKS) -> List[Dict[str, Any]]:
+        """Sorgudaki atıfların madde metni chunk'larını döndürür; çözülemezse boş liste."""
+        self.lookups += 1
+        keys = self.resolve(query)
+        if not keys:
+            return []
+        results: List[Dict[str, Any]] = []
+        seen = set()
+        with self._lock:
+            for key in keys:
+                for doc_id in self.articles.get(key, []):
+                    if doc_id in seen:
+                        continue
+                    seen.add(doc_id)
+                    content, metadata = self.chunks[doc_id]
+                    results.append({"id": doc_id, "content": content, "metadata": metadata, "citation": key})
+        self.hits += 1
+        return results[:limit]
+
+    def citing(self, key: str) -> List[str]:
+        return list(self.cites.get(key, []))
+
+    def sync_once(self, client) -> int:
+        added = 0
+        cursor = max(0, self.hwm - CITATION_SYNC_OVERLAP)
+        while True:
+            data = (
+                client.table("documents")
+                .select(f"id, content, metadata, {SEQ_COLUMN}")
+                .gt(SEQ_COLUMN, cursor)
+                .order(SEQ_COLUMN)
+                .limit(CITATION_SYNC_BATCH)
+                .execute().data or []
+            )
+            if not data:
+                break
+            added += self.add(data)
+            cursor = int(data[-1][SEQ_COLUMN])
+            with self._lock:
+                self.hwm = max(self.hwm, cursor)
+                self._dirty = True
+            if len(data) < CITATION_SYNC_BATCH:
+                break
+        if added:
+            logger.info(f"🔄 Atıf indeksine {added} chunk işlendi ({len(self.articles)} madde)")
+        self.save()
+        return added
+
+    def start_sync(self, client, interval: float = CITATION_SYNC_SECONDS):
+        if self._thread:
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.sync_once(client)
+                except Exception as e:
+                    logger.error(f"❌ Atıf Senkron Hatası: {e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, daemon=True, name="citation-sync")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self.save()
+        except Exception as e:
+            logger.error(f"Atıf Snapshot Yazma Hatası: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "articles": len(self.articles),
+            "cited_articles": len(self.cites),
+            "chunks": len(self._seen),
+            "hwm": self.hwm,
+            "lookups": self.lookups,
+            "hits": self.hits,
+        }
@@ -0,0 +1,231 @@
+import os
+import logging
+import threading
+import importlib.util
+from typing import Any, Dict, Optional
+
+# Süreç genelinde paylaşılan sağlayıcı istemcileri (Gemini, Supabase).
+# Her katman kendi genai.Client / Supabase istemcisini kuruyordu: ayrı bağlantı havuzları, ayrı TLS el sıkışmaları.
+# Burada her sağlayıcı için tek istemci, sınırları ayarlanabilir keep-alive httpx havuzu (h2 kuruluysa HTTP/2)
+# ile kurulur ve tüm katmanlara aynısı verilir. Taşıyıcı katmanı yeni TCP bağlantılarını sayar; istek sayısıyla
+# farkı bağlantı yeniden kullanımını verir.
+
+logger = logging.getLogger("BabyLexitClients")
+
+# --- AYARLAR ---
+CLIENT_POOL_MAX_CONNECTIONS = int(os.getenv("CLIENT_POOL_MAX_CONNECTIONS", "100"))
+CLIENT_POOL_MAX_KEEPALIVE = int(os.getenv("CLIENT_POOL_MAX_KEEPALIVE", "20"))
+CLIENT_KEEPALIVE_EXPIRY = float(os.getenv("CLIENT_KEEPALIVE_EXPIRY", "60"))
+CLIENT_TIMEOUT = float(os.getenv("CLIENT_TIMEOUT", "60"))
+# HTTP/2 sadece h2 paketi kuruluysa açılır
+CLIENT_HTTP2 = os.getenv("CLIENT_HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+
+
+class PoolStats:
+    """Bir istemcinin istek ve yeni bağlantı sayaçları (reused = requests - new_connections)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+
+    def request(self):
+        with self._lock:
+            self.requests += 1
+
+    def event(self, name: str):
+        with self._lock:
+            if name == "connection.connect_tcp.complete":
+                self.new_connections += 1
+            elif name == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "tls_handshakes": self.tls_handshakes,
+                "reused": reused,
+                "reuse_ratio": round(reused / self.requests, 4) if self.requests else 0.0,
+            }
+
+
+def _limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=CLIENT_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=CLIENT_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=CLIENT_KEEPALIVE_EXPIRY,
+    )
+
+
+def _transport(stats: PoolStats):
+    """Havuz ayarlı, yeni bağlantıları sayan senkron taşıyıcı."""
+    import httpx
+
+    class CountingTransport(httpx.HTTPTransport):
+        def handle_request(self, request):
+            stats.request()
+            previous = request.extensions.get("trace")
+
+            def trace(name, info):
+                stats.event(name)
+                if previous:
+                    previous(name, info)
+
+            request.extensions["trace"] = trace
+            return super().handle_request(request)
+
+    return CountingTransport(http2=CLIENT_HTTP2, limits=_limits())
+
+
+def _async_transport(stats: PoolStats):
+    import httpx
+
+    class CountingAsyncTransport(httpx.AsyncHTTPTransport):
+        async def handle_async_request(self, request):
+            stats.request()
+            previous = request.extensions.get("trace")
+
+            async def trace(name, info):
+                stats.event(name)
+                if previous:
+                    await previous(name, info)
+
+            request.extensions["trace"] = trace
+            return await super().handle_async_request(request)
+
+    return CountingAsyncTransport(http2=CLIENT_HTTP2, limits=_limits())
+
+
+def _httpx_client(stats: PoolStats):
+    import httpx
+    return httpx.Client(transport=_transport(stats), timeout=CLIENT_TIMEOUT)
+
+
+def _httpx_async_client(stats: PoolStats):
+    import httpx
+    return httpx.AsyncClient(transport=_async_transport(stats), timeout=CLIENT_TIMEOUT)
+
+
+class ClientRegistry:
+    """Sağlayıcı başına tek, paylaşılan istemci. İlk isteyen kurar; kurulamazsa None döner (katmanlar fail-open)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[tuple, Any] = {}
+        self._pool_stats: Dict[str, PoolStats] = {}
+        self._pooled: Dict[str, bool] = {}
+        self.handouts: Dict[str, int] = {}
+
+    def _get(self, name: str, credential: str, factory):
+        key = (name, credential)
+        with self._lock:
+            self.handouts[name] = self.handouts.get(name, 0) + 1
+            if key not in self._clients:
+                stats = self._pool_stats.setdefault(name, PoolStats())
+                try:
+                    self._clients[key] = factory(stats)
+                except Exception as e:
+                    logger.error(f"❌ {name} istemcisi kurulamadı: {e}")
+                    return None
+            return self._clients[key]
+
+    def gemini(self, api_key: Optional[str] = None):
+        api_key = api_key or os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            return None
+        return self._get("gemini", api_key, lambda stats: self._build_gemini(api_key, stats))
+
+    def supabase(self, url: Optional[str] = None, key: Optional[str] = None):
+        url = url or os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+        key = key or os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY")
+        if not url or not key:
+            return None
+        return self._get("supabase", f"{url}\x00{key}", lambda stats: self._build_supabase(url, key, stats))
+
+    def _build_gemini(self, api_key: str, stats: PoolStats):
+        from google import genai
+        from google.genai import types
+
+        # SDK sürümüne göre: hazır httpx istemcisi (yeni) -> client_args (orta) -> varsayılan havuz (eski)
+        attempts = (
+            lambda: {"httpx_client": _httpx_client(stats), "httpx_async_client": _httpx_async_client(stats)},
+            lambda: {
+                "client_args": {"transport": _transport(stats)},
+                "async_client_args": {"transport": _async_transport(stats)},
+            },
+        )
+        for options in attempts:
+            try:
+                client = genai.Client(api_key=api_key, http_options=types.HttpOptions(**options()))
+                self._pooled["gemini"] = True
+                logger.info(f"🔌 Paylaşılan Gemini istemcisi (havuz {CLIENT_POOL_MAX_CONNECTIONS}, HTTP/2: {CLIENT_HTTP2})")
+                return client
+            except Exception:
+                continue
+        self._pooled["gemini"] = False
+        logger.info("🔌 Paylaşılan Gemini istemcisi (SDK özel havuzu desteklemiyor, varsayılan havuz)")
+        return genai.Client(api_key=api_key)
+
+    def _build_supabase(self, url: str, key: str, stats: PoolStats):
+        from supabase import create_client
+
+        try:
+            try:
+                from supabase import SyncClientOptions as Options
+            except ImportError:
+                from supabase import ClientOptions as Options
+            client = create_client(url, key, options=Options(httpx_client=_httpx_client(stats)))
+            self._pooled["supabase"] = True
+            logger.info(f"🔌 Paylaşılan Supabase istemcisi (havuz {CLIENT_POOL_MAX_CONNECTIONS}, HTTP/2: {CLIENT_HTTP2})")
+            return client
+        except Exception:
+            self._pooled["supabase"] = False
+            logger.info("🔌 Paylaşılan Supabase istemcisi (SDK özel havuzu desteklemiyor, varsayılan havuz)")
+            return create_client(url, key)
+
+    def _after_fork(self):
+        """fork sonrası çocuk süreçte: ebeveynin havuzları (soketleri) paylaşılmaz, istemciler yeniden kurulur."""
+        self._lock = threading.Lock()
+        _inherited_clients.extend(self._clients.values())
+        self._clients.clear()
+        self._pool_stats.clear()
+        self._pooled.clear()
+        self.handouts.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "http2": CLIENT_HTTP2,
+                "max_connections": CLIENT_POOL_MAX_CONNECTIONS,
+                "max_keepalive": CLIENT_POOL_MAX_KEEPALIVE,
+                "clients": {
+                    name: {
+                        "instances": sum(1 for key in self._clients if key[0] == name),
+                        "handouts": self.handouts.get(name, 0),
+                        "pooled": self._pooled.get(name, False),
+                        **stats.stats(),
+                    }
+                    for name, stats in self._pool_stats.items()
+                },
+            }
+
+
+client_registry = ClientRegistry()
+# Ebeveynden devralınan istemciler kapatılmadan tutulur (kapatmak ebeveynin soketlerini etkileyebilir)
+_inherited_clients: list = []
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=client_registry._after_fork)
+
+
+def gemini_client(api_key: Optional[str] = None):
+    return client_registry.gemini(api_key)
+
+
+def supabase_client(url: Optional[str] = None, key: Optional[str] = None):
+    return client_registry.supabase(url, key)
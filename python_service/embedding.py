@@ -0,0 +1,133 @@
+import os
+import asyncio
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+# Embedding servis katmanı:
+# encode çağrıları event loop'u bloklamasın diye ayrı bir executor'da çalışır,
+# eşzamanlı /embed istekleri tek bir encode çağrısında birleştirilir (micro-batching).
+
+logger = logging.getLogger("BabyLexitEmbedding")
+
+# --- AYARLAR ---
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "64"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+EMBED_EXECUTOR_WORKERS = int(os.getenv("EMBED_EXECUTOR_WORKERS", "1"))
+
+
+class EmbeddingBatcher:
+    """
+    Dinamik micro-batcher.
+    Kuyruğa düşen ilk metinden itibaren en fazla `max_wait_ms` kadar bekler
+    veya `max_batch_size` dolunca biriken metinleri tek seferde encode eder.
+    """
+
+    def __init__(self,
+                 encode_fn: Callable[[List[str]], List[List[float]]],
+                 max_batch_size: int = EMBED_MAX_BATCH_SIZE,
+                 max_wait_ms: float = EMBED_MAX_WAIT_MS,
+                 workers: int = EMBED_EXECUTOR_WORKERS):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="embed")
+        # Event loop başına ayrı kuyruk + toplayıcı task (uvicorn loop'u ve kuyruk worker thread'lerinin loop'ları);
+        # encode aynı executor'da sıralanır
+        self._loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[asyncio.Queue, asyncio.Task]]" = \
+            weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        # Basit sayaçlar (boyutlandırma için)
+        self.batches = 0
+        self.items = 0
+
+    def _queue_for(self, loop: asyncio.AbstractEventLoop) -> asyncio.Queue:
+        with self._lock:
+            state = self._loops.get(loop)
+            if state and not state[1].done():
+                return state[0]
+            # Kapanmış loop'ların (asyncio.run) bitmiş task'ları loop'u canlı tutmasın
+            for old in [l for l, (_, task) in self._loops.items() if task.done()]:
+                del self._loops[old]
+            queue: asyncio.Queue = asyncio.Queue()
+            self._loops[loop] = (queue, loop.create_task(self._run(loop, queue)))
+            return queue
+
+    async def embed(self, text: str) -> List[float]:
+        """Tek metni vektöre çevirir (diğer eşzamanlı isteklerle birleştirilerek)."""
+        return (await self.embed_many([text]))[0]
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """Metin listesini vektöre çevirir. Sıra korunur."""
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        queue = self._queue_for(loop)
+        futures = []
+        for text in texts:
+            fut = loop.create_future()
+            queue.put_nowait((text, fut))
+            futures.append(fut)
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue) -> List[Tuple[str, asyncio.Future]]:
+        batch = [await queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Kuyrukta bekleyenleri beklemeden topla
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        while True:
+            batch = await self._collect(loop, queue)
+            # İptal edilmiş istekleri (client bağlantıyı kapattıysa) atla
+            batch = [(t, f) for t, f in batch if not f.done()]
+            if not batch:
+                continue
+            texts = [t for t, _ in batch]
+            try:
+                vectors = await loop.run_in_executor(self.executor, self.encode_fn, texts)
+            except Exception as e:
+                logger.error(f"Batch Embedding Hatası ({len(texts)} metin): {e}")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(texts)
+            for (_, fut), vec in zip(batch, vectors):
+                if not fut.done():
+                    fut.set_result(vec)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "queue_depth": sum(queue.qsize() for queue, _ in list(self._loops.values())),
+            "loops": len(self._loops),
+        }
+
+    async def close(self):
+        """Çağıran loop'un toplayıcı task'ını durdurur (diğer loop'ların task'ları loop'larıyla biter)."""
+        state = self._loops.pop(asyncio.get_running_loop(), None)
+        if state:
+            state[1].cancel()
+            try:
+                await state[1]
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=False)
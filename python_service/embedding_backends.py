@@ -0,0 +1,120 @@
+import os
+import time
+import logging
+from typing import Dict, List, Optional
+
+# Embedding modeli çalışma zamanı (backend) seçimi.
+#   torch      : PyTorch fp32 (eski davranış)
+#   onnx       : ONNX Runtime fp32
+#   onnx-int8  : ONNX Runtime, dinamik int8 quantization (CPU'da en hızlısı)
+# ONNX dosyaları ilk açılışta export edilip EMBED_ONNX_DIR altına kaydedilir, sonraki açılışlar diskten okur.
+# Üç backend de aynı SentenceTransformer.encode arayüzünü sunar; çağıran kodun değişmesi gerekmez.
+
+logger = logging.getLogger("BabyLexitEmbedBackend")
+
+# --- AYARLAR ---
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch").lower()
+EMBED_ONNX_DIR = os.getenv(
+    "EMBED_ONNX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".onnx_models")
+)
+# avx512_vnni | avx512 | avx2 | arm64 (CPU'ya göre seçin)
+EMBED_QUANT_CONFIG = os.getenv("EMBED_QUANT_CONFIG", "avx2")
+# 1 ise açılışta fp32 ile kosinüs uyumu kontrol edilir; eşiğin altındaysa torch'a dönülür
+EMBED_PARITY_CHECK = os.getenv("EMBED_PARITY_CHECK", "0") == "1"
+EMBED_PARITY_MIN = float(os.getenv("EMBED_PARITY_MIN", "0.99"))
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Parite kontrolü için sabit örnek (kısa soru, madde metni, uzun paragraf karışık)
+PARITY_SAMPLE = [
+    "Kiracı kira bedelini ödemezse ev sahibi ne yapabilir?",
+    "TBK m. 344 uyarınca kira bedelinin artırılması",
+    "MADDE 86 – (1) Kasten başkasının vücuduna acı veren veya sağlığının ya da algılama yeteneğinin bozulmasına neden olan kişi, bir yıldan üç yıla kadar hapis cezası ile cezalandırılır.",
+    "İşçinin kıdem tazminatına hak kazanabilmesi için en az bir yıl çalışmış olması gerekir.",
+    "Boşanma davasında velayet hangi kriterlere göre belirlenir?",
+    "Tüketici hakem heyetine başvuru süresi ve parasal sınırlar nelerdir?",
+    "Yargıtay 9. HD. E. 2019/1234 K. 2020/5678 sayılı kararında işe iade talebi değerlendirilmiştir.",
+    "Miras hukuku nedir?",
+    "Anonim şirket yönetim kurulu üyelerinin sorumluluğu TTK kapsamında düzenlenmiştir ve kusur esasına dayanır.",
+    "Trafik kazası sonrası sigorta şirketine başvuru nasıl yapılır?",
+]
+
+
+def _onnx_dir(name: str) -> str:
+    return os.path.join(EMBED_ONNX_DIR, name.replace("/", "__"))
+
+
+def _quantized_file() -> str:
+    return f"model_qint8_{EMBED_QUANT_CONFIG}.onnx"
+
+
+def _load_onnx(name: str, quantized: bool):
+    from sentence_transformers import SentenceTransformer
+
+    local_dir = _onnx_dir(name)
+    if not os.path.exists(os.path.join(local_dir, "onnx", "model.onnx")):
+        logger.info(f"⏳ {name} ONNX'e export ediliyor (bir kereye mahsus)...")
+        model = SentenceTransformer(name, device="cpu", backend="onnx")
+        model.save_pretrained(local_dir)
+
+    if not quantized:
+        return SentenceTransformer(local_dir, device="cpu", backend="onnx")
+
+    qfile = _quantized_file()
+    if not os.path.exists(os.path.join(local_dir, "onnx", qfile)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        logger.info(f"⏳ {name} int8'e quantize ediliyor ({EMBED_QUANT_CONFIG})...")
+        base = SentenceTransformer(local_dir, device="cpu", backend="onnx")
+        export_dynamic_quantized_onnx_model(base, EMBED_QUANT_CONFIG, local_dir)
+    return SentenceTransformer(
+        local_dir, device="cpu", backend="onnx", model_kwargs={"file_name": f"onnx/{qfile}"}
+    )
+
+
+def load_embedding_model(name: str, backend: str = EMBED_BACKEND):
+    """
+    Modeli istenen backend ile yükler. ONNX yolu başarısız olursa PyTorch'a düşer.
+    (model, kullanılan backend) döndürür.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in BACKENDS:
+        logger.warning(f"⚠️ Bilinmeyen EMBED_BACKEND '{backend}', torch kullanılıyor.")
+        backend = "torch"
+
+    if backend != "torch":
+        try:
+            model = _load_onnx(name, quantized=(backend == "onnx-int8"))
+            if EMBED_PARITY_CHECK:
+                reference = SentenceTransformer(name, device="cpu")
+                parity = parity_check(model, reference)
+                del reference
+                logger.info(f"🔬 {backend} parite: ort {parity['mean_cos']:.4f}, min {parity['min_cos']:.4f}")
+                if parity["min_cos"] < EMBED_PARITY_MIN:
+                    raise ValueError(f"Parite eşiğin altında ({parity['min_cos']:.4f} < {EMBED_PARITY_MIN})")
+            return model, backend
+        except Exception as e:
+            logger.warning(f"⚠️ {backend} backend yüklenemedi ({e}). PyTorch'a geçiliyor...")
+
+    return SentenceTransformer(name, device="cpu"), "torch"
+
+
+def parity_check(model, reference, texts: Optional[List[str]] = None) -> Dict[str, float]:
+    """Aynı metinlerde iki modelin vektörleri arasındaki kosinüs benzerliği (vektörler normalize)."""
+    texts = texts or PARITY_SAMPLE
+    a = model.encode(texts, normalize_embeddings=True, show_progress_bar=False)
+    b = reference.encode(texts, normalize_embeddings=True, show_progress_bar=False)
+    cos = (a * b).sum(axis=1)
+    return {"mean_cos": float(cos.mean()), "min_cos": float(cos.min())}
+
+
+def throughput(model, texts: List[str], batch_size: int = 32, repeats: int = 1) -> Dict[str, float]:
+    """Metin/sn ölçümü (ilk çağrı ısınma için hariç tutulur)."""
+    model.encode(texts[:batch_size], batch_size=batch_size, normalize_embeddings=True, show_progress_bar=False)
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        model.encode(texts, batch_size=batch_size, normalize_embeddings=True, show_progress_bar=False)
+    seconds = time.perf_counter() - t0
+    return {"texts_per_sec": round(len(texts) * repeats / seconds, 1), "seconds": round(seconds, 3)}
@@ -0,0 +1,256 @@
+import os
+import time
+import sqlite3
+import re
+import hashlib
+import logging
+import threading
+import unicodedata
+import weakref
+from array import array
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+# İçerik adresli embedding önbelleği.
+# Anahtar: sha256(model adı + normalize edilmiş metin).
+# 1. katman: bellekte boyut sınırlı LRU, 2. katman: yeniden başlatmaya dayanıklı sqlite dosyası.
+
+logger = logging.getLogger("BabyLexitEmbedCache")
+
+# --- AYARLAR ---
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "1") == "1"
+EMBED_CACHE_MEMORY_MB = float(os.getenv("EMBED_CACHE_MEMORY_MB", "64"))
+EMBED_CACHE_DISK_MB = float(os.getenv("EMBED_CACHE_DISK_MB", "1024"))
+EMBED_CACHE_PATH = os.getenv(
+    "EMBED_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".embedding_cache", "embeddings.db")
+)
+# Disk boyutu her N yazımda bir kontrol edilir
+_DISK_CHECK_EVERY = 500
+
+_WS_RE = re.compile(r"\s+")
+
+# Prefork sunumda (serve.py) her çocuk süreç kendi sqlite bağlantısını açar
+_live_caches: "weakref.WeakSet" = weakref.WeakSet()
+_inherited_connections: list = []
+
+
+def _reopen_after_fork():
+    for cache in list(_live_caches):
+        cache._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reopen_after_fork)
+
+
+def normalize_text(text: str) -> str:
+    return _WS_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def _pack(vec: List[float]) -> bytes:
+    return array("f", vec).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    arr = array("f")
+    arr.frombytes(blob)
+    return arr.tolist()
+
+
+class EmbeddingCache:
+    """
+    İki katmanlı embedding önbelleği.
+    Vektörler float32 olarak saklanır (model çıktısı zaten float32).
+    """
+
+    def __init__(self, model_name: str,
+                 memory_mb: float = EMBED_CACHE_MEMORY_MB,
+                 disk_mb: float = EMBED_CACHE_DISK_MB,
+                 path: Optional[str] = EMBED_CACHE_PATH):
+        self.model_name = model_name
+        self.memory_limit = int(memory_mb * 1024 * 1024)
+        self.disk_limit = int(disk_mb * 1024 * 1024)
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._mem_bytes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+        self.path = path
+        if path and self.disk_limit > 0:
+            self._open_db()
+        _live_caches.add(self)
+
+    def _open_db(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, model TEXT NOT NULL, vec BLOB NOT NULL, last_used INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+            logger.info(f"💾 Embedding önbelleği (disk): {self.path}")
+        except Exception as e:
+            logger.warning(f"⚠️ Disk önbelleği açılamadı ({e}). Sadece bellek katmanı kullanılacak.")
+            self._db = None
+
+    def _after_fork(self):
+        """
+        fork sonrası çocuk süreçte çağrılır: sqlite bağlantısı süreçler arasında paylaşılamaz.
+        Ebeveynin bağlantısı kapatılmaz (kapatmak WAL dosyasına dokunur), sadece bırakılır.
+        """
+        self._lock = threading.Lock()
+        if self._db is not None:
+            _inherited_connections.append(self._db)
+            self._db = None
+            self._open_db()
+
+    # --- Bellek katmanı ---
+
+    def _mem_get(self, key: str) -> Optional[bytes]:
+        blob = self._mem.get(key)
+        if blob is not None:
+            self._mem.move_to_end(key)
+        return blob
+
+    def _mem_put(self, key: str, blob: bytes):
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= len(old)
+        self._mem[key] = blob
+        self._mem_bytes += len(blob)
+        while self._mem_bytes > self.memory_limit and self._mem:
+            _, evicted = self._mem.popitem(last=False)
+            self._mem_bytes -= len(evicted)
+            self.memory_evictions += 1
+
+    # --- Disk katmanı ---
+
+    def _disk_get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        if not self._db or not keys:
+            return {}
+        found: Dict[str, bytes] = {}
+        try:
+            # sqlite parametre limiti için parça parça sorgula
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._db.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", part).fetchall()
+                found.update(rows)
+            if found:
+                now = int(time.time())
+                self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+        except Exception as e:
+            logger.error(f"Disk Önbellek Okuma Hatası: {e}")
+        return found
+
+    def _disk_put_many(self, items: Dict[str, bytes]):
+        if not self._db or not items:
+            return
+        now = int(time.time())
+        try:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vec, last_used) VALUES (?, ?, ?, ?)",
+                [(k, self.model_name, v, now) for k, v in items.items()]
+            )
+            self._writes += len(items)
+            if self._writes >= _DISK_CHECK_EVERY:
+                self._writes = 0
+                self._disk_evict()
+        except Exception as e:
+            logger.error(f"Disk Önbellek Yazma Hatası: {e}")
+
+    def _disk_size(self) -> int:
+        page_count = self._db.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+        freelist = self._db.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - freelist) * page_size
+
+    def _disk_evict(self):
+        """Disk sınırı aşıldıysa en uzun süredir kullanılmayan kayıtların ~%10'unu siler."""
+        if self._disk_size() <= self.disk_limit:
+            return
+        total = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        n = max(1, total // 10)
+        self._db.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (n,)
+        )
+        self.disk_evictions += n
+        logger.info(f"🧹 Embedding disk önbelleğinden {n} kayıt silindi.")
+
+    # --- Ana API ---
+
+    def get_or_compute(self, texts: List[str],
+                       encode_fn: Callable[[List[str]], List[List[float]]]) -> List[Optional[List[float]]]:
+        """
+        Önbellekte olanları döndürür, olmayanları tek `encode_fn` çağrısıyla hesaplayıp yazar.
+        Aynı çağrıdaki tekrar eden metinler bir kez hesaplanır. Sıra korunur.
+        """
+        keys = [cache_key(self.model_name, t) for t in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                blob = self._mem_get(key)
+                if blob is not None:
+                    self.memory_hits += 1
+                    results[i] = _unpack(blob)
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if missing:
+                for key, blob in self._disk_get_many(list(missing)).items():
+                    self._mem_put(key, blob)
+                    for i in missing.pop(key):
+                        self.disk_hits += 1
+                        results[i] = _unpack(blob)
+
+        if not missing:
+            return results
+
+        miss_keys = list(missing)
+        self.misses += sum(len(missing[k]) for k in miss_keys)
+        vectors = encode_fn([texts[missing[k][0]] for k in miss_keys])
+
+        fresh: Dict[str, bytes] = {}
+        for key, vec in zip(miss_keys, vectors):
+            if not vec:
+                continue
+            fresh[key] = _pack(vec)
+            for i in missing[key]:
+                results[i] = vec
+        with self._lock:
+            for key, blob in fresh.items():
+                self._mem_put(key, blob)
+            self._disk_put_many(fresh)
+        return results
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "model": self.model_name,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._mem),
+            "memory_mb": round(self._mem_bytes / (1024 * 1024), 2),
+            "memory_evictions": self.memory_evictions,
+            "disk_evictions": self.disk_evictions,
+            "disk": bool(self._db),
+        }
@@ -0,0 +1,307 @@
+import os
+import sys
+import time
+import types
+import logging
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Iterator, List, Tuple, Optional
+
+# Dosyadan metin çıkarma (PDF / OCR / düz metin).
+# Büyük PDF'ler sayfa aralıklarına bölünüp process pool üzerinde paralel okunur.
+# NOT: Bu modül process pool'daki çocuk süreçlere de yüklenir, ağır import eklemeyin.
+
+logger = logging.getLogger("BabyLexitExtract")
+
+# --- AYARLAR ---
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "24"))
+PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", "8"))
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0")) or (os.cpu_count() or 1)
+
+TEXT_READ_BLOCK_CHARS = int(os.getenv("TEXT_READ_BLOCK_CHARS", str(1 << 20)))
+
+IMAGE_TYPES = ['jpg', 'jpeg', 'png', 'bmp', 'tiff']
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+@dataclass
+class ExtractResult:
+    text: str
+    pages: int
+    mode: str = "serial"
+    page_seconds: List[float] = field(default_factory=list)
+
+    def timing_summary(self) -> str:
+        if not self.page_seconds:
+            return f"📄 Metin çıkarımı ({self.mode}): {self.pages} sayfa"
+        total = sum(self.page_seconds)
+        slowest = max(range(len(self.page_seconds)), key=self.page_seconds.__getitem__)
+        return (
+            f"📄 PDF çıkarımı ({self.mode}): {self.pages} sayfa, "
+            f"ort {total / len(self.page_seconds):.3f} sn/sayfa, "
+            f"en yavaş sayfa {slowest + 1} ({self.page_seconds[slowest]:.3f} sn)"
+        )
+
+
+# Varsayılan spawn, `python main.py` ile başlatılmış sürecin __main__'ini her worker'da __mp_main__ olarak tekrar
+# çalıştırır (.env, FastAPI, Supabase bağlantısı, model). Worker'lar sadece bu modülün fonksiyonlarını çalıştırır:
+# süreç başlatılırken __main__ yerine boş bir modül gösterilir, çocuk ana modülü import etmez.
+_main_swap_lock = threading.Lock()
+_spawn = multiprocessing.get_context("spawn")
+
+try:
+    from multiprocessing.popen_spawn_posix import Popen as _SpawnPopen
+except ImportError:  # Windows: varsayılan spawn
+    _SpawnPopen = None
+
+
+if _SpawnPopen is not None:
+    class _WorkerPopen(_SpawnPopen):
+        def _launch(self, process_obj):
+            with _main_swap_lock:
+                real_main = sys.modules["__main__"]
+                sys.modules["__main__"] = types.ModuleType("__main__")
+                try:
+                    super()._launch(process_obj)
+                finally:
+                    sys.modules["__main__"] = real_main
+
+    class _WorkerProcess(_spawn.Process):
+        _start_method = "spawn"
+
+        @staticmethod
+        def _Popen(process_obj):
+            return _WorkerPopen(process_obj)
+
+    class _WorkerContext(type(_spawn)):
+        Process = _WorkerProcess
+
+    _worker_context = _WorkerContext()
+else:
+    _worker_context = _spawn
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Process pool'u ilk ihtiyaçta oluşturur (makinedeki çekirdek sayısına göre)."""
+    global _pool
+    if _pool is None:
+        # Thread'li (uvicorn/torch) bir süreçten fork güvenli değil; spawn kullanıyoruz.
+        _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS, mp_context=_worker_context)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str, float]]:
+    """[start, end) aralığındaki sayfaları okur. Process pool içinde çalışır."""
+    import pdfplumber
+
+    out = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for i in range(start, end):
+            t0 = time.perf_counter()
+            try:
+                page = pdf.pages[i]
+                text = page.extract_text() or ""
+                page.flush_cache()
+            except Exception as e:
+                logger.error(f"PDF Sayfa Hatası (sayfa {i + 1}): {e}")
+                text = ""
+            out.append((i, text, time.perf_counter() - t0))
+    return out
+
+
+def _page_ranges(page_count: int, shard_size: int) -> List[Tuple[int, int]]:
+    return [(s, min(s + shard_size, page_count)) for s in range(0, page_count, shard_size)]
+
+
+def _extract_pdf_serial(pdf_file) -> ExtractResult:
+    import pdfplumber
+
+    parts, timings = [], []
+    with pdfplumber.open(pdf_file) as pdf:
+        for page in pdf.pages:
+            t0 = time.perf_counter()
+            parts.append((page.extract_text() or "") + "\n")
+            timings.append(time.perf_counter() - t0)
+    return ExtractResult(text="".join(parts), pages=len(timings), mode="serial", page_seconds=timings)
+
+
+def _extract_pdf_parallel(pdf_path: str, page_count: int) -> ExtractResult:
+    pool = _get_pool()
+    futures = [
+        pool.submit(_extract_page_range, pdf_path, start, end)
+        for start, end in _page_ranges(page_count, PDF_PAGES_PER_SHARD)
+    ]
+    texts: List[str] = [""] * page_count
+    timings: List[float] = [0.0] * page_count
+    # Sayfa sırası index üzerinden korunur
+    for fut in futures:
+        for i, text, seconds in fut.result():
+            texts[i] = text
+            timings[i] = seconds
+    return ExtractResult(
+        text="".join(t + "\n" for t in texts),
+        pages=page_count,
+        mode=f"parallel x{PDF_EXTRACT_WORKERS}",
+        page_seconds=timings
+    )
+
+
+def _should_parallelize(page_count: int) -> bool:
+    return page_count >= PDF_PARALLEL_MIN_PAGES and PDF_EXTRACT_WORKERS >= 2
+
+
+def _extract_pdf_path_parallel(pdf_path: str, page_count: int) -> ExtractResult:
+    try:
+        return _extract_pdf_parallel(pdf_path, page_count)
+    except Exception as e:
+        logger.warning(f"⚠️ Paralel PDF okuma başarısız ({e}). Seri okumaya geçiliyor...")
+        shutdown_pool()
+        return _extract_pdf_serial(pdf_path)
+
+
+def extract_pdf_path(pdf_path: str) -> ExtractResult:
+    """Diskteki PDF'i okur. Küçük dosyalarda seri, büyüklerde sayfa-paralel çalışır."""
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+    if not _should_parallelize(page_count):
+        return _extract_pdf_serial(pdf_path)
+    return _extract_pdf_path_parallel(pdf_path, page_count)
+
+
+def extract_pdf(file_bytes: bytes) -> ExtractResult:
+    """Bellekteki PDF'i okur. Paralel modda çocuk süreçler için geçici dosyaya yazılır."""
+    import pdfplumber
+
+    with pdfplumber.open(BytesIO(file_bytes)) as pdf:
+        page_count = len(pdf.pages)
+    if not _should_parallelize(page_count):
+        return _extract_pdf_serial(BytesIO(file_bytes))
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        tmp.write(file_bytes)
+        tmp.flush()
+        return _extract_pdf_path_parallel(tmp.name, page_count)
+
+
+def extract_text(file_bytes: bytes, ftype: str) -> ExtractResult:
+    """Dosya tipine göre metni çıkarır. (PDF + OCR Resim Desteği)"""
+    if 'pdf' in ftype:
+        try:
+            return extract_pdf(file_bytes)
+        except Exception as pdf_err:
+            logger.error(f"PDF Okuma Hatası: {pdf_err}")
+            return ExtractResult(text="", pages=0)
+
+    if ftype in IMAGE_TYPES:
+        try:
+            import pytesseract
+            from PIL import Image
+            image = Image.open(BytesIO(file_bytes))
+            return ExtractResult(text=pytesseract.image_to_string(image), pages=1, mode="ocr")
+        except Exception:
+            logger.warning("OCR Hatası veya Tesseract yüklü değil.")
+            return ExtractResult(text="", pages=1, mode="ocr")
+
+    return ExtractResult(text=file_bytes.decode('utf-8', errors='ignore'), pages=1, mode="text")
+
+
+# -----------------------------------------------------------------------------
+# AKIŞ (STREAMING) MODU: sayfa sayfa metin üreten generator'lar
+# -----------------------------------------------------------------------------
+
+def _iter_pdf_pages_serial(pdf_path: str, start: int = 0) -> Iterator[str]:
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path) as pdf:
+        for i in range(start, len(pdf.pages)):
+            page = pdf.pages[i]
+            try:
+                text = page.extract_text() or ""
+            except Exception as e:
+                logger.error(f"PDF Sayfa Hatası (sayfa {i + 1}): {e}")
+                text = ""
+            # Sayfa önbelleğini bırak, büyük dosyalarda bellek birikmesin
+            page.flush_cache()
+            yield text + "\n"
+
+
+def _iter_pdf_pages_parallel(pdf_path: str, page_count: int) -> Iterator[str]:
+    """
+    Sayfa aralıklarını process pool'a sınırlı bir pencereyle gönderir.
+    Tüketici yavaşsa yeni shard gönderilmez (back-pressure), sayfa sırası korunur.
+    """
+    pool = _get_pool()
+    ranges = deque(_page_ranges(page_count, PDF_PAGES_PER_SHARD))
+    in_flight = deque()
+    window = PDF_EXTRACT_WORKERS * 2
+
+    while ranges or in_flight:
+        while ranges and len(in_flight) < window:
+            start, end = ranges.popleft()
+            in_flight.append((start, pool.submit(_extract_page_range, pdf_path, start, end)))
+
+        start, fut = in_flight.popleft()
+        try:
+            pages = fut.result()
+        except Exception as e:
+            logger.warning(f"⚠️ Paralel PDF okuma başarısız ({e}). Sayfa {start + 1}'den itibaren seri okumaya geçiliyor...")
+            for _, pending in in_flight:
+                pending.cancel()
+            shutdown_pool()
+            yield from _iter_pdf_pages_serial(pdf_path, start)
+            return
+        for _, text, _ in pages:
+            yield text + "\n"
+
+
+def iter_pdf_pages(pdf_path: str) -> Iterator[str]:
+    """Diskteki PDF'i sayfa sayfa okur. Büyük dosyalarda sayfa-paralel çalışır."""
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+    if not _should_parallelize(page_count):
+        return _iter_pdf_pages_serial(pdf_path)
+    return _iter_pdf_pages_parallel(pdf_path, page_count)
+
+
+def iter_file_text(path: str, ftype: str) -> Iterator[str]:
+    """Diskteki dosyanın metnini parça parça üretir. Her PDF sayfası ayrı bir parçadır."""
+    if 'pdf' in ftype:
+        try:
+            yield from iter_pdf_pages(path)
+        except Exception as pdf_err:
+            logger.error(f"PDF Okuma Hatası: {pdf_err}")
+        return
+
+    if ftype in IMAGE_TYPES:
+        try:
+            import pytesseract
+            from PIL import Image
+            with Image.open(path) as image:
+                yield pytesseract.image_to_string(image)
+        except Exception:
+            logger.warning("OCR Hatası veya Tesseract yüklü değil.")
+        return
+
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        while True:
+            block = f.read(TEXT_READ_BLOCK_CHARS)
+            if not block:
+                break
+            yield block
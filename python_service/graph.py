@@ -1,4 +1,5 @@
 import os
+import time
 import logging
 import asyncio
 from typing import TypedDict, Optional, Literal, List
@@ -6,53 +7,72 @@ from langgraph.graph import StateGraph, END
 
 # Katmanlar
 from layers.guard import GuardLayer
+from layers.understanding import UnderstandingLayer, QueryUnderstanding
 from layers.router import RouterLayer
 from layers.rag import RagLayer, RagResult
 from layers.web import WebLayer, WebResult
 from layers.expert import ExpertLayer, ExpertResult
 from layers.author import AuthorLayer
+from query_embedding import QueryEmbedding, embedding_stats
+from semantic_cache import cache_metrics
 
-# Supabase Client
-try:
-    from utils.supabase import supabase_client
-except ImportError:
-    from supabase import create_client, Client
-    url: str = os.environ.get("SUPABASE_URL") or os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
-    key: str = os.environ.get("SUPABASE_KEY") or os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
-    if url and key:
-        supabase_client: Client = create_client(url, key)
-    else:
-        supabase_client = None
+# Supabase Client (süreç genelinde paylaşılan istemci)
+from clients import supabase_client as _shared_supabase
+supabase_client = _shared_supabase()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("BabyLexitGraph")
 
+# --- AYARLAR ---
+# 1: Guard, router ve retrieval aynı anda başlar; guard engellerse router/retrieval iptal edilir.
+# Güvenli sorularda (büyük çoğunluk) guard gecikmesi kritik yoldan çıkar. Bedeli: engellenen
+# sorularda boşa giden (iptal edilen) router/retrieval çağrıları.
+GUARD_SPECULATIVE = os.getenv("GUARD_SPECULATIVE", "0") == "1"
+
 # --- 1. State Tanımı ---
 class AgentState(TypedDict):
     question_id: str
     query: str
     safety_status: str
+    # Tek çağrılık soru anlama sonucu (güvenlik, rota, niyet, karmaşıklık, konu); başarısızsa None
+    understanding: Optional[QueryUnderstanding]
+    # İstek kapsamlı soru vektörü (router cache + RAG araması aynı vektörü kullanır)
+    embedding: Optional[QueryEmbedding]
     route: str
+    # Router anlamsal cache isabeti: {"tier": "local" | "rpc", "similarity": float}; varsa graph db_writer'a atlar
+    cache_hit: Optional[dict]
+    started_at: Optional[float]
     rag_result: Optional[RagResult]
     web_result: Optional[WebResult]
     expert_result: Optional[ExpertResult]
     final_report: str
     status: str
+    # True ise author_node raporu token token üretir ve "author_token" olayları yayınlar (SSE)
+    stream: Optional[bool]
 
 # --- 2. Node Tanımları ---
+understanding_layer = UnderstandingLayer()
 guard_layer = GuardLayer()
 router_layer = RouterLayer()
 rag_layer = RagLayer()
 web_layer = WebLayer()
+# RAG'in web fallback'i WebLayer'ın önbellekli aramasını kullanır (tek sağlayıcı çağrısı)
+rag_layer.web_search = web_layer.search
 expert_layer = ExpertLayer()
 author_layer = AuthorLayer()
 
+# Akış modunda author_node'un yayınladığı özel olayın adı (main.py SSE'ye çevirir)
+AUTHOR_TOKEN_EVENT = "author_token"
+
 # NOT: Paralel çalışacak node'lar (RAG, Web) SADECE kendi güncelledikleri key'i döndürmelidir.
 # {**state} kullanımı paralel kollarda çakışma yaratır.
 
-async def guard_node(state: AgentState) -> dict:
-    logger.info("--- NODE: Guard ---")
-    result = guard_layer.check(state["query"])
+async def _guard_verdict(query: str, understanding: Optional[QueryUnderstanding]) -> dict:
+    # Soru anlama başarısızsa guard'ın kendi çağrısına düşülür
+    if understanding:
+        result = understanding.guard_output(query)
+    else:
+        result = await guard_layer.analyze_input(query)
     is_safe = getattr(result, 'safe', getattr(result, 'is_safe', True))
     
     if not is_safe:
@@ -63,18 +83,47 @@ async def guard_node(state: AgentState) -> dict:
         }
     return {"safety_status": "safe"}
 
+def _new_embedding(state: AgentState) -> QueryEmbedding:
+    return state.get("embedding") or QueryEmbedding(state["query"], rag_layer.embed_query)
+
+def _request_context(state: AgentState) -> dict:
+    """Giriş node'unun state'e eklediği istek kapsamlı alanlar."""
+    return {"embedding": _new_embedding(state), "started_at": state.get("started_at") or time.perf_counter()}
+
+async def guard_node(state: AgentState) -> dict:
+    logger.info("--- NODE: Guard ---")
+    understanding = await understanding_layer.analyze(state["query"])
+    return {
+        **await _guard_verdict(state["query"], understanding),
+        "understanding": understanding,
+        **_request_context(state)
+    }
+
 async def router_node(state: AgentState) -> dict:
     logger.info("--- NODE: Router ---")
     if asyncio.iscoroutinefunction(router_layer.decide):
-        decision = await router_layer.decide(state["query"])
+        decision = await router_layer.decide(
+            state["query"], understanding=state.get("understanding"), embedding=state.get("embedding")
+        )
     else:
         decision = router_layer.decide(state["query"])
+    if decision.action == "cache_hit" and decision.cached_response:
+        # Benzer soru daha önce cevaplanmış: RAG / Web / Expert / Author atlanır
+        return {
+            "route": decision.route,
+            "cache_hit": {"tier": decision.cache_tier, "similarity": decision.cache_similarity},
+            "final_report": decision.cached_response,
+            "status": "completed"
+        }
     return {"route": decision.route}
 
 async def rag_node(state: AgentState) -> dict:
     logger.info("--- NODE: RAG ---")
+    understanding = state.get("understanding")
     # DÜZELTME 1: await eklendi
-    result = await rag_layer.search(state["query"])
+    result = await rag_layer.search(
+        state["query"], intent=understanding.intent if understanding else None, embedding=state.get("embedding")
+    )
     # DÜZELTME 2: Sadece ilgili key dönüyor
     return {"rag_result": result}
 
@@ -90,12 +139,38 @@ async def expert_node(state: AgentState) -> dict:
     context = ""
     if state.get("rag_result"): context += str(state["rag_result"])
     if state.get("web_result"): context += str(state["web_result"])
-    result = expert_layer.get_response(state["query"], context=context)
+    understanding = state.get("understanding")
+    result = await expert_layer.get_response(
+        state["query"], context=context,
+        complexity_data=understanding.complexity_data() if understanding else None
+    )
     return {"expert_result": result}
 
+async def _stream_author(state: AgentState) -> str:
+    """Rapor parçalarını astream_events'e özel olay olarak yayınlar ve birleşik metni döndürür."""
+    try:
+        from langchain_core.callbacks import adispatch_custom_event
+    except ImportError:
+        # Eski langchain-core: özel olay yok, rapor yine parça parça üretilir ve sonda tek seferde döner
+        adispatch_custom_event = None
+
+    parts = []
+    async for text in author_layer.stream_report(
+        query=state["query"],
+        rag_result=state.get("rag_result"),
+        web_result=state.get("web_result"),
+        expert_result=state.get("expert_result")
+    ):
+        parts.append(text)
+        if adispatch_custom_event:
+            await adispatch_custom_event(AUTHOR_TOKEN_EVENT, {"text": text})
+    return "".join(parts)
+
 async def author_node(state: AgentState) -> dict:
     logger.info("--- NODE: Author ---")
-    result = author_layer.write_report(
+    if state.get("stream"):
+        return {"final_report": await _stream_author(state), "status": "completed"}
+    result = await author_layer.write_report(
         query=state["query"],
         rag_result=state.get("rag_result"),
         web_result=state.get("web_result"),
@@ -103,8 +178,65 @@ async def author_node(state: AgentState) -> dict:
     )
     return {"final_report": result.final_markdown, "status": "completed"}
 
+def route_decision_func(state: AgentState):
+    if state.get("cache_hit"): return ["db_writer_node"]
+    route = state.get("route", "internal")
+    if route == "internal": return ["rag_node"]
+    elif route == "web": return ["web_node"]
+    else: return ["rag_node", "web_node"] # Hybrid
+
+RETRIEVAL_NODES = {"rag_node": rag_node, "web_node": web_node}
+
+# Spekülatif modun sayaçları (main.py liveness çıktısında görünür)
+speculation_stats = {"runs": 0, "blocked": 0, "cancelled": 0}
+
+async def _route_and_retrieve(state: AgentState, understanding_task: asyncio.Task) -> dict:
+    # Router cache kontrolü soru anlama çağrısıyla eşzamanlı ilerler; rota için task'ın sonucu beklenir
+    update = await router_node({**state, "understanding": understanding_task})
+    if update.get("cache_hit"):
+        return update
+    routed = {**state, **update, "understanding": await understanding_task}
+    results = await asyncio.gather(*(RETRIEVAL_NODES[name](routed) for name in route_decision_func(routed)))
+    for result in results:
+        update.update(result)
+    return update
+
+async def speculative_node(state: AgentState) -> dict:
+    """Guard || (Router -> RAG/Web). Guard engellerse spekülatif dal iptal edilir ve sonucu atılır."""
+    logger.info("--- NODE: Speculative (Guard || Router -> Retrieval) ---")
+    speculation_stats["runs"] += 1
+    state = {**state, **_request_context(state)}
+    understanding_task = asyncio.create_task(understanding_layer.analyze(state["query"]))
+    speculative = asyncio.create_task(_route_and_retrieve(state, understanding_task))
+    try:
+        understanding = await understanding_task
+        verdict = {
+            **await _guard_verdict(state["query"], understanding),
+            "understanding": understanding,
+            "embedding": state["embedding"],
+            "started_at": state["started_at"]
+        }
+    except BaseException:
+        understanding_task.cancel()
+        speculative.cancel()
+        raise
+
+    if verdict.get("safety_status") == "toxic":
+        speculation_stats["blocked"] += 1
+        if not speculative.done():
+            speculative.cancel()
+            speculation_stats["cancelled"] += 1
+        await asyncio.gather(speculative, return_exceptions=True)
+        logger.info("🛑 Guard engelledi, spekülatif router/retrieval iptal edildi.")
+        return verdict
+    return {**verdict, **await speculative}
+
 async def db_writer_node(state: AgentState) -> dict:
     logger.info(f"--- NODE: DB Writer (ID: {state.get('question_id')}) ---")
+    if state.get("embedding"):
+        embedding_stats.record(state["embedding"])
+    if state.get("started_at") and state.get("safety_status") == "safe":
+        cache_metrics.finished((time.perf_counter() - state["started_at"]) * 1000, bool(state.get("cache_hit")))
     if supabase_client and state.get("question_id"):
         try:
             def to_dict_safe(obj):
@@ -113,7 +245,8 @@ async def db_writer_node(state: AgentState) -> dict:
             sources_payload = {
                 "rag": to_dict_safe(state.get("rag_result")) if state.get("rag_result") else None,
                 "web": to_dict_safe(state.get("web_result")) if state.get("web_result") else None,
-                "expert": to_dict_safe(state.get("expert_result")) if state.get("expert_result") else None
+                "expert": to_dict_safe(state.get("expert_result")) if state.get("expert_result") else None,
+                "cache": state.get("cache_hit")
             }
             
             # answer kolonu yok hatası almamak için önce select ile kontrol edilebilir ama
@@ -131,6 +264,7 @@ async def db_writer_node(state: AgentState) -> dict:
 # --- 3. Graph Kurulumu ---
 workflow = StateGraph(AgentState)
 workflow.add_node("guard_node", guard_node)
+workflow.add_node("speculative_node", speculative_node)
 workflow.add_node("router_node", router_node)
 workflow.add_node("rag_node", rag_node)
 workflow.add_node("web_node", web_node)
@@ -138,20 +272,19 @@ workflow.add_node("expert_node", expert_node)
 workflow.add_node("author_node", author_node)
 workflow.add_node("db_writer_node", db_writer_node)
 
-workflow.set_entry_point("guard_node")
+workflow.set_entry_point("speculative_node" if GUARD_SPECULATIVE else "guard_node")
 
 def check_safety(state: AgentState):
     return "end" if state.get("safety_status") == "toxic" else "continue"
 
 workflow.add_conditional_edges("guard_node", check_safety, {"end": "db_writer_node", "continue": "router_node"})
+# Spekülatif modda router ve retrieval guard ile birlikte koştu; güvenliyse doğrudan Expert'e (cache isabeti: DB Writer)
+def after_speculative(state: AgentState):
+    return "end" if state.get("safety_status") == "toxic" or state.get("cache_hit") else "continue"
 
-def route_decision_func(state: AgentState):
-    route = state.get("route", "internal")
-    if route == "internal": return ["rag_node"]
-    elif route == "web": return ["web_node"]
-    else: return ["rag_node", "web_node"] # Hybrid
+workflow.add_conditional_edges("speculative_node", after_speculative, {"end": "db_writer_node", "continue": "expert_node"})
 
-workflow.add_conditional_edges("router_node", route_decision_func, ["rag_node", "web_node"])
+workflow.add_conditional_edges("router_node", route_decision_func, ["rag_node", "web_node", "db_writer_node"])
 
 # RAG ve Web bittikten sonra Expert'e mi Author'a mı gidecek?
 # Şimdilik direkt Author'a bağlayalım (Basitlik için)
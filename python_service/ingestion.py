@@ -0,0 +1,337 @@
+import os
+import gc
+import time
+import logging
+import tempfile
+from dataclasses import dataclass, field
+from typing import List, Optional, Dict, Any, Iterator, Iterable, Callable
+
+from extraction import iter_file_text
+from chunking import get_chunker
+from vector_format import storage_fields, COMPACT_COLUMN, FULL_COLUMN
+
+# Dosya işleme (ingestion) yardımcıları:
+# chunk'ları batch halinde vektöre çevirir ve documents tablosuna sayfa sayfa yazar.
+
+logger = logging.getLogger("BabyLexitIngest")
+
+# --- AYARLAR ---
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+INSERT_PAGE_SIZE = int(os.getenv("INSERT_PAGE_SIZE", "200"))
+INSERT_MAX_RETRIES = int(os.getenv("INSERT_MAX_RETRIES", "3"))
+INSERT_RETRY_BACKOFF = float(os.getenv("INSERT_RETRY_BACKOFF", "1.0"))
+
+# Akış modu: auto (büyük dosyalarda), stream (her zaman), memory (eski davranış)
+INGEST_MODE = os.getenv("INGEST_MODE", "auto").lower()
+INGEST_STREAM_MIN_MB = float(os.getenv("INGEST_STREAM_MIN_MB", "20"))
+# Pipeline içinde tamponlanabilecek en fazla veri (embedding batch'i + bekleyen insert sayfası)
+INGEST_BUFFER_MB = float(os.getenv("INGEST_BUFFER_MB", "32"))
+# Süreç RSS tavanı (0 = kapalı). Aşılırsa tamponlar boşaltılır ve batch boyutları küçültülür.
+INGEST_MEMORY_LIMIT_MB = float(os.getenv("INGEST_MEMORY_LIMIT_MB", "0"))
+# RSS (tavan - marj) altına inince batch/sayfa boyutları eski haline döner (histerezis)
+INGEST_MEMORY_MARGIN_MB = float(os.getenv("INGEST_MEMORY_MARGIN_MB", "64"))
+DOWNLOAD_BLOCK_BYTES = 1 << 20
+
+
+@dataclass
+class IngestStats:
+    """Tek bir dosya işinin hız ölçümleri."""
+    file_path: str
+    pages: int = 0
+    chunks: int = 0
+    inserted: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    finished_at: Optional[float] = None
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at or time.perf_counter()
+        return max(end - self.started_at, 1e-9)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "file_path": self.file_path,
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "inserted": self.inserted,
+            "seconds": round(self.elapsed, 3),
+            "pages_per_sec": round(self.pages / self.elapsed, 2),
+            "chunks_per_sec": round(self.chunks / self.elapsed, 2),
+        }
+
+    def summary(self) -> str:
+        d = self.as_dict()
+        return (
+            f"📊 {d['file_path']}: {d['pages']} sayfa, {d['chunks']} chunk, {d['seconds']} sn "
+            f"({d['pages_per_sec']} sayfa/sn, {d['chunks_per_sec']} chunk/sn)"
+        )
+
+
+def encode_batched(model, texts: List[str], batch_size: Optional[int] = None,
+                   cache=None) -> List[Optional[List[float]]]:
+    """
+    Metinleri batch halinde vektöre çevirir.
+    Padding'i azaltmak için metinler uzunluğa göre sıralanır, sonuç orijinal sırayla döner.
+    Başarısız batch'lerin vektörleri None olarak kalır.
+    `cache` (EmbeddingCache) verilirse sadece önbellekte olmayan metinler encode edilir.
+    """
+    if cache is not None and model and texts:
+        return cache.get_or_compute(texts, lambda missing: encode_batched(model, missing, batch_size))
+
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    vectors: List[Optional[List[float]]] = [None] * len(texts)
+    if not model or not texts:
+        return vectors
+
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    for start in range(0, len(order), batch_size):
+        idx = order[start:start + batch_size]
+        batch = [texts[i] for i in idx]
+        try:
+            embeddings = model.encode(
+                batch,
+                batch_size=len(batch),
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+        except Exception as e:
+            logger.error(f"Batch Embedding Hatası ({len(batch)} chunk): {e}")
+            continue
+        for i, emb in zip(idx, embeddings):
+            vectors[i] = emb.tolist()
+    return vectors
+
+
+def insert_paged(client, table: str, rows: List[Dict[str, Any]],
+                 page_size: Optional[int] = None, max_retries: Optional[int] = None,
+                 on_inserted: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> int:
+    """
+    Satırları sınırlı boyutlu sayfalar halinde yazar. Her sayfa ayrı ayrı tekrar denenir.
+    Bir sayfa tüm denemelerde başarısız olursa son hata yükseltilir.
+    `on_inserted` her başarılı sayfadan sonra DB'nin döndürdüğü satırlarla (id dahil) çağrılır.
+    """
+    page_size = page_size or INSERT_PAGE_SIZE
+    max_retries = max_retries or INSERT_MAX_RETRIES
+    inserted = 0
+
+    for start in range(0, len(rows), page_size):
+        page = rows[start:start + page_size]
+        for attempt in range(1, max_retries + 1):
+            try:
+                res = client.table(table).insert(page).execute()
+                inserted += len(page)
+                break
+            except Exception as e:
+                if attempt == max_retries:
+                    logger.error(f"❌ Insert sayfası başarısız ({start}-{start + len(page)}): {e}")
+                    raise
+                wait = INSERT_RETRY_BACKOFF * (2 ** (attempt - 1))
+                logger.warning(f"⚠️ Insert hatası, {wait:.1f} sn sonra tekrar denenecek ({attempt}/{max_retries}): {e}")
+                time.sleep(wait)
+        if on_inserted:
+            # Yerel indeksler (BM25 vb.) için; hata insert'i başarısız saymaz
+            try:
+                on_inserted(res.data or [])
+            except Exception as e:
+                logger.error(f"❌ Insert Sonrası İndeks Güncelleme Hatası: {e}")
+    return inserted
+
+
+
+def delete_source(client, source: str,
+                  on_removed: Optional[Callable[[List[str]], None]] = None) -> int:
+    """
+    Bir dosyanın daha önce yazılmış chunk'larını siler (metadata.source eşleşmesi).
+    Sayfalı insert yarıda kalırsa ilk sayfalar tabloda kalır; iş tekrar çalıştığında (retry, reaper requeue)
+    aynı chunk'lar ikinci kez yazılmasın diye ingest'ten önce ve hata sonrası çağrılır.
+    `on_removed` silinen satırların id'leriyle çağrılır (yerel indeksler için).
+    """
+    res = client.table('documents').delete().eq('metadata->>source', source).execute()
+    ids = [str(row['id']) for row in (res.data or []) if row.get('id') is not None]
+    if ids:
+        logger.info(f"🧹 {source}: önceki denemeden kalan {len(ids)} chunk silindi")
+        if on_removed:
+            try:
+                on_removed(ids)
+            except Exception as e:
+                logger.error(f"❌ Silme Sonrası İndeks Güncelleme Hatası: {e}")
+    return len(ids)
+
+# -----------------------------------------------------------------------------
+# AKIŞ (STREAMING) MODU: indir -> çıkar -> parçala -> vektörle -> yaz
+# Her aşama bir generator; bir sonraki aşama çekmedikçe önceki aşama ilerlemez.
+# -----------------------------------------------------------------------------
+
+def download_to_tempfile(client, bucket: str, path: str):
+    """
+    Dosyayı bellekte tek parça tutmadan diskteki geçici dosyaya indirir.
+    Signed URL ile akışlı indirme başarısız olursa SDK'nın tek parça indirmesine düşer.
+    Dönen dosya kapatıldığında silinir.
+    """
+    import requests
+
+    suffix = "." + path.split(".")[-1] if "." in path else ""
+    tmp = tempfile.NamedTemporaryFile(suffix=suffix)
+    try:
+        signed = client.storage.from_(bucket).create_signed_url(path, 600)
+        url = signed.get("signedURL") or signed.get("signedUrl")
+        with requests.get(url, stream=True, timeout=60) as r:
+            r.raise_for_status()
+            for block in r.iter_content(DOWNLOAD_BLOCK_BYTES):
+                tmp.write(block)
+    except Exception as e:
+        logger.warning(f"⚠️ Akışlı indirme başarısız ({e}). Tek parça indiriliyor...")
+        tmp.seek(0)
+        tmp.truncate()
+        tmp.write(client.storage.from_(bucket).download(path))
+    tmp.flush()
+    tmp.seek(0)
+    return tmp
+
+
+def should_stream(size_bytes: int) -> bool:
+    if INGEST_MODE == "stream":
+        return True
+    if INGEST_MODE == "memory":
+        return False
+    return size_bytes >= INGEST_STREAM_MIN_MB * 1024 * 1024
+
+
+def _current_rss_mb() -> Optional[float]:
+    """Anlık RSS (Linux /proc üzerinden). Okunamazsa None."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except Exception:
+        return None
+
+
+class StreamBudget:
+    """
+    Akış pipeline'ının bellek bütçesi.
+    Tampon sınırlarını tutar; RSS tavanı aşıldığında (her aşımda bir kez) batch/sayfa boyutlarını yarıya indirir,
+    RSS tavan - marj altına inince başlangıç boyutlarına döner.
+    """
+
+    def __init__(self,
+                 batch_size: int = EMBED_BATCH_SIZE,
+                 page_size: int = INSERT_PAGE_SIZE,
+                 buffer_mb: float = INGEST_BUFFER_MB,
+                 memory_limit_mb: float = INGEST_MEMORY_LIMIT_MB,
+                 memory_margin_mb: float = INGEST_MEMORY_MARGIN_MB):
+        self.batch_size = self.initial_batch_size = max(1, batch_size)
+        self.page_size = self.initial_page_size = max(1, page_size)
+        self.buffer_bytes = int(buffer_mb * 1024 * 1024)
+        self.memory_limit_mb = memory_limit_mb
+        self.resume_mb = max(0.0, memory_limit_mb - memory_margin_mb)
+        self.peak_rss_mb = 0.0
+        self.pressured = False
+
+    def over_limit(self) -> bool:
+        """Sadece tavanın yeni aşıldığı anda True döner (çağıran sayfayı boşaltıp shrink() çağırır)."""
+        rss = _current_rss_mb()
+        if rss is None:
+            return False
+        self.peak_rss_mb = max(self.peak_rss_mb, rss)
+        if not self.memory_limit_mb:
+            return False
+        if self.pressured:
+            if rss < self.resume_mb:
+                self.restore(rss)
+            return False
+        return rss > self.memory_limit_mb
+
+    def shrink(self):
+        self.pressured = True
+        gc.collect()
+        self.batch_size = max(1, self.batch_size // 2)
+        self.page_size = max(1, self.page_size // 2)
+        logger.warning(
+            f"⚠️ Bellek tavanı ({self.memory_limit_mb:.0f} MB) aşıldı. "
+            f"Batch: {self.batch_size}, sayfa: {self.page_size}"
+        )
+
+    def restore(self, rss: float):
+        self.pressured = False
+        self.batch_size = self.initial_batch_size
+        self.page_size = self.initial_page_size
+        logger.info(
+            f"✅ Bellek {rss:.0f} MB'a indi. Batch: {self.batch_size}, sayfa: {self.page_size}"
+        )
+
+
+def iter_embedded_rows(model, chunks: Iterable[str], metadata: Dict[str, Any],
+                       budget: StreamBudget, cache=None, tagger=None) -> Iterator[Dict[str, Any]]:
+    """
+    Chunk'ları bütçe sınırında batch'ler halinde vektörler ve documents satırları üretir.
+    tagger verilirse (citations.CitationTagger) chunk'lar sırayla etiketlenir ve metadata'ya eklenir.
+    """
+    batch: List[str] = []
+    batch_bytes = 0
+
+    def flush():
+        for chunk, vec in zip(batch, encode_batched(model, batch, batch_size=len(batch), cache=cache)):
+            chunk_meta = tagger.metadata_for(chunk, metadata) if tagger else metadata
+            if vec:
+                yield {'content': chunk, 'metadata': chunk_meta, **storage_fields(vec)}
+
+    for chunk in chunks:
+        batch.append(chunk)
+        batch_bytes += len(chunk.encode('utf-8'))
+        if len(batch) >= budget.batch_size or batch_bytes >= budget.buffer_bytes // 2:
+            yield from flush()
+            batch, batch_bytes = [], 0
+    if batch:
+        yield from flush()
+
+
+def _row_bytes(row: Dict[str, Any]) -> int:
+    # JSON payload tahmini: içerik + float başına ~20 karakter
+    vec = row.get(COMPACT_COLUMN) or row.get(FULL_COLUMN) or []
+    return len(row['content'].encode('utf-8')) + 20 * len(vec)
+
+
+def stream_ingest(client, model, path: str, ftype: str, metadata: Dict[str, Any],
+                  stats: IngestStats, chunker=None,
+                  budget: Optional[StreamBudget] = None, cache=None, tagger=None,
+                  on_inserted: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> IngestStats:
+    """
+    Diskteki dosyayı sınırlı bellekle işler.
+    Çıkarım, parçalama, embedding ve insert aşamaları generator zinciri olarak çalışır;
+    insert sayfası yazılmadan yeni chunk üretilmez (back-pressure).
+    """
+    budget = budget or StreamBudget()
+    chunker = chunker or get_chunker(model)
+    is_pdf = 'pdf' in ftype
+
+    def counted_pieces():
+        for piece in iter_file_text(path, ftype):
+            if is_pdf: stats.pages += 1
+            yield piece
+        if not is_pdf: stats.pages = 1
+
+    rows = iter_embedded_rows(model, chunker.iter_chunks(counted_pieces()), metadata, budget, cache, tagger)
+
+    page: List[Dict[str, Any]] = []
+    page_bytes = 0
+    for row in rows:
+        page.append(row)
+        page_bytes += _row_bytes(row)
+        stats.chunks += 1
+        over = budget.over_limit()
+        if len(page) >= budget.page_size or page_bytes >= budget.buffer_bytes // 2 or over:
+            stats.inserted += insert_paged(client, 'documents', page, page_size=len(page), on_inserted=on_inserted)
+            page, page_bytes = [], 0
+            if over: budget.shrink()
+    if page:
+        stats.inserted += insert_paged(client, 'documents', page, page_size=len(page), on_inserted=on_inserted)
+
+    if stats.chunks == 0:
+        raise ValueError("Dosyadan anlamlı metin çıkarılamadı.")
+    if budget.peak_rss_mb:
+        logger.info(f"🌊 Akış modu tamamlandı. En yüksek RSS: {budget.peak_rss_mb:.0f} MB")
+    return stats
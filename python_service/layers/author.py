@@ -1,13 +1,18 @@
 import os
+import inspect
 import logging
-from typing import Optional, Any
+from typing import Optional, Any, AsyncIterator
 from pydantic import BaseModel
-from google import genai
 from google.genai import types
+from llm_limits import provider_slot, provider_call
+from clients import gemini_client
 
 # Loglama
 logger = logging.getLogger(__name__)
 
+MISSING_KEY_MESSAGE = "⚠️ API Anahtarı eksik olduğu için rapor oluşturulamadı. Lütfen .env dosyasını kontrol edin."
+ERROR_MESSAGE = "⚠️ Rapor oluşturulurken bir hata meydana geldi. Lütfen tekrar deneyin."
+
 class AuthorResult(BaseModel):
     final_markdown: str
     status: str = "completed"
@@ -15,14 +20,14 @@ class AuthorResult(BaseModel):
 class AuthorLayer:
     def __init__(self):
         # API Anahtarını al (Environment değişkenlerinden)
-        self.api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+        self.api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
         self.model_name = "gemini-2.0-flash"
         self.client = None
         
         # Client'ı güvenli başlat (API key yoksa None kalır, program çökmez)
         if self.api_key:
             try:
-                self.client = genai.Client(api_key=self.api_key)
+                self.client = gemini_client(self.api_key)
             except Exception as e:
                 logger.error(f"Google GenAI Client başlatılamadı: {e}")
         else:
@@ -56,18 +61,8 @@ class AuthorLayer:
             
         return "\n".join(context_parts)
 
-    def write_report(self, 
-                     query: str, 
-                     rag_result: Optional[Any] = None, 
-                     web_result: Optional[Any] = None, 
-                     expert_result: Optional[Any] = None) -> AuthorResult:
-        
-        if not self.client:
-            return AuthorResult(
-                final_markdown="⚠️ API Anahtarı eksik olduğu için rapor oluşturulamadı. Lütfen .env dosyasını kontrol edin.", 
-                status="error"
-            )
-
+    def _build_prompt(self, query: str, rag_result: Optional[Any], web_result: Optional[Any],
+                      expert_result: Optional[Any]) -> str:
         context_str = self._prepare_context(rag_result, web_result, expert_result)
         
         prompt = f"""
@@ -89,17 +84,60 @@ class AuthorLayer:
 
         Eğer veri yetersizse, dürüstçe "Bu konuda yeterli bilgiye ulaşamadım" de.
         """
+        return prompt
+
+    async def write_report(self, 
+                     query: str, 
+                     rag_result: Optional[Any] = None, 
+                     web_result: Optional[Any] = None, 
+                     expert_result: Optional[Any] = None) -> AuthorResult:
+        
+        if not self.client:
+            return AuthorResult(
+                final_markdown=MISSING_KEY_MESSAGE, 
+                status="error"
+            )
+
+        prompt = self._build_prompt(query, rag_result, web_result, expert_result)
 
         try:
             # Yeni SDK kullanımı (google-genai)
-            response = self.client.models.generate_content(
+            response = await provider_call("gemini", lambda: self.client.aio.models.generate_content(
                 model=self.model_name,
                 contents=prompt
-            )
+            ), model=self.model_name)
             return AuthorResult(final_markdown=response.text)
         except Exception as e:
             logger.error(f"Author layer failed: {e}")
             return AuthorResult(
-                final_markdown="⚠️ Rapor oluşturulurken bir hata meydana geldi. Lütfen tekrar deneyin.",
+                final_markdown=ERROR_MESSAGE,
                 status="error"
-            )
\ No newline at end of file
+            )
+
+    async def stream_report(self,
+                            query: str,
+                            rag_result: Optional[Any] = None,
+                            web_result: Optional[Any] = None,
+                            expert_result: Optional[Any] = None) -> AsyncIterator[str]:
+        """Raporu üretildikçe parça parça verir (SSE akışı için). Hata olursa hata mesajını verir."""
+        if not self.client:
+            yield MISSING_KEY_MESSAGE
+            return
+
+        prompt = self._build_prompt(query, rag_result, web_result, expert_result)
+        try:
+            # Akış boyunca slot tutulur: sağlayıcıdaki açık istek sayısı sınırı aşmaz
+            async with provider_slot("gemini", self.model_name):
+                stream = self.client.aio.models.generate_content_stream(
+                    model=self.model_name,
+                    contents=prompt
+                )
+                # SDK sürümüne göre coroutine (-> async iterator) ya da doğrudan async generator döner
+                if inspect.isawaitable(stream):
+                    stream = await stream
+                async for chunk in stream:
+                    if chunk.text:
+                        yield chunk.text
+        except Exception as e:
+            logger.error(f"Author layer stream failed: {e}")
+            yield f"\n\n{ERROR_MESSAGE}"
@@ -3,12 +3,19 @@ import json
 import logging
 from typing import Dict, Optional, Any
 from pydantic import BaseModel, Field
-from litellm import completion
+from llm_limits import provider_call, provider_of
+from llm_cache import cached_response
 
 # Loglama ayarları
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+async def acompletion(*args, **kwargs):
+    """litellm import'u ağırdır; ilk LLM çağrısına kadar ertelenir. Sağlayıcı/model kotası ve eşzamanlılık sınırı uygulanır, 429'da tekrar sıraya girer."""
+    from litellm import acompletion as _acompletion
+    model = kwargs["model"]
+    return await provider_call(provider_of(model), lambda: _acompletion(*args, **kwargs), model=model)
+
 # Çıktı Modeli
 class ExpertResult(BaseModel):
     answer: str
@@ -25,7 +32,7 @@ class ExpertLayer:
         self.pro_model = "gemini/gemini-1.5-pro"
         self.fallback_model = "gemini/gemini-2.0-flash" 
 
-    def measure_complexity(self, query: str, context: str) -> Dict[str, Any]:
+    async def measure_complexity(self, query: str, context: str) -> Dict[str, Any]:
         """
         Sorunun zorluk derecesini ve konusunu analiz eder.
         Model: gemini-2.0-flash
@@ -50,13 +57,15 @@ class ExpertLayer:
             }}
             """
 
-            response = completion(
-                model=self.default_model,
-                messages=[{"role": "user", "content": prompt}],
-                response_format={"type": "json_object"}
-            )
-            
-            content = response.choices[0].message.content
+            async def call() -> str:
+                response = await acompletion(
+                    model=self.default_model,
+                    messages=[{"role": "user", "content": prompt}],
+                    response_format={"type": "json_object"}
+                )
+                return response.choices[0].message.content
+
+            content = await cached_response("expert_complexity", self.default_model, prompt, call, validate=json.loads)
             data = json.loads(content)
             return data
 
@@ -65,12 +74,12 @@ class ExpertLayer:
             # Hata durumunda varsayılan orta seviye karmaşıklık döndür
             return {"score": 5, "topic": "General", "reasoning": "Analysis failed, default used."}
 
-    def get_response(self, query: str, context: str = "", complexity_data: Dict = None) -> ExpertResult:
+    async def get_response(self, query: str, context: str = "", complexity_data: Dict = None) -> ExpertResult:
         """
         Karmaşıklığa göre en uygun modeli seçer ve cevabı üretir.
         """
         if complexity_data is None:
-            complexity_data = self.measure_complexity(query, context)
+            complexity_data = await self.measure_complexity(query, context)
         
         score = complexity_data.get("score", 5)
         selected_model = self.default_model
@@ -103,7 +112,7 @@ class ExpertLayer:
                 "Cevabının en başına kalın harflerle '**Yapay Zeka yorumudur, dış kaynaklardan teyit edilememiştir.**' uyarısını ekle."
             )
 
-            response = completion(
+            response = await acompletion(
                 model=selected_model,
                 messages=[
                     {"role": "system", "content": system_prompt},
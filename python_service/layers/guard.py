@@ -8,8 +8,10 @@ from typing import Literal
 from pydantic import BaseModel, Field, ValidationError
 
 # --- YENİ KÜTÜPHANE IMPORTLARI ---
-from google import genai
 from google.genai import types
+from llm_limits import provider_call
+from clients import gemini_client
+from llm_cache import cached_response
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -34,7 +36,7 @@ class GuardLayer:
     Filters input for injections, illegal intent, and gibberish using gemini-2.0-flash.
     """
     def __init__(self):
-        self.api_key = os.getenv("GEMINI_API_KEY") # STANDART ENV İSMİ
+        self.api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY") # STANDART ENV İSMİ
         self.client = None
         
         if not self.api_key:
@@ -42,7 +44,7 @@ class GuardLayer:
         else:
             try:
                 # v1.0 SDK Client Init
-                self.client = genai.Client(api_key=self.api_key)
+                self.client = gemini_client(self.api_key)
             except Exception as e:
                 logger.error(f"Failed to initialize GenAI Client: {e}")
 
@@ -78,28 +80,19 @@ Your SOLE purpose is to classify user input and output a SINGLE valid JSON objec
 
     def check(self, query: str) -> GuardOutput:
         """
-        Graph.py tarafından çağrılan SENKRON metod.
-        Asenkron analyze_input fonksiyonunu çalıştırır ve sonucu bekler.
+        Senkron scriptler için sarmalayıcı (çalışan event loop yokken).
+        Async kod (graph.py) doğrudan `await analyze_input(query)` kullanmalıdır; loop içinde
+        run_until_complete/nest_asyncio o loop'taki tüm diğer istekleri Gemini cevabına kadar bloklar.
         """
         try:
-            # Mevcut bir event loop var mı kontrol et (FastAPI içinde çalışırken olabilir)
-            try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-
-            if loop.is_running():
-                # Loop zaten çalışıyorsa (nadir durumlarda), run_until_complete hata verebilir.
-                # Bu durumda nest_asyncio gerekebilir veya farklı bir yaklaşım.
-                # Ancak basit scriptlerde bu çalışır.
-                # Şimdilik basitçe yeni bir loop oluşturup çalıştıralım:
-                import nest_asyncio
-                nest_asyncio.apply()
-                return loop.run_until_complete(self.analyze_input(query))
-            else:
-                return loop.run_until_complete(self.analyze_input(query))
-                
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError("GuardLayer.check çalışan bir event loop içinde çağrılamaz; 'await analyze_input' kullanın.")
+
+        try:
+            return asyncio.run(self.analyze_input(query))
         except Exception as e:
             logger.error(f"Sync Check Wrapper Error: {e}")
             # Fail-open
@@ -124,18 +117,25 @@ Your SOLE purpose is to classify user input and output a SINGLE valid JSON objec
 
         # 3. API Call
         try:
-            response = await self.client.aio.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=sanitized_query,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    temperature=0.0,
-                    system_instruction=self._get_system_prompt()
-                )
+            async def call() -> str:
+                response = await provider_call("gemini", lambda: self.client.aio.models.generate_content(
+                    model="gemini-2.0-flash",
+                    contents=sanitized_query,
+                    config=types.GenerateContentConfig(
+                        response_mime_type="application/json",
+                        temperature=0.0,
+                        system_instruction=self._get_system_prompt()
+                    )
+                ), model="gemini-2.0-flash")
+                return response.text
+
+            text = await cached_response(
+                "guard", "gemini-2.0-flash", sanitized_query, call,
+                system=self._get_system_prompt(), validate=json.loads
             )
             
             # 4. Parse & Validate
-            data = json.loads(response.text)
+            data = json.loads(text)
             
             # Graph.py 'safe' alanını kullanıyor, model 'is_safe' dönüyor. Eşitleyelim.
             if "safe" not in data:
@@ -1,11 +1,15 @@
 import os
 import asyncio
-from typing import List, Dict, Any, Literal
+from typing import List, Dict, Any, Literal, Optional
 from pydantic import BaseModel, Field
-from google import genai
 from google.genai import types
-from supabase import create_client, Client
-from flashrank import Ranker, RerankRequest
+from supabase import Client
+from vector_format import match_request
+from llm_limits import provider_call
+from clients import gemini_client, supabase_client
+from llm_cache import cached_response
+from web_cache import cached_search
+from citations import citation_only
 
 # --- AYARLAR ---
 ENABLE_WEB_SEARCH = True 
@@ -40,25 +44,39 @@ class RagLayer:
         self.client = None
         self.supabase = None
         self.ranker = None
-        
-        # FlashRank'i güvenli başlat
-        try:
-            print("⚡ FlashRank (CPU) hazırlanıyor...")
-            self.ranker = Ranker(model_name="ms-marco-TinyBERT-L-2-v2", cache_dir="./.flashrank_cache")
-        except Exception as e:
-            print(f"⚠️ Ranker başlatılamadı: {e}")
+        self._ranker_tried = False
+        # main.py yerel embedding modelini (documents'a yazan model) buraya bağlar: async (text) -> List[float]
+        self.embed_fn = None
+        # main.py süreç içi ANN indeksini bağlar: (vector, k, threshold) -> List[Dict] | None (hazır değil)
+        self.ann_search = None
+        # main.py kanun/madde atıf indeksini bağlar: (query) -> List[Dict] (çözülemezse boş)
+        self.citation_lookup = None
+        # graph.py WebLayer.search'ü bağlar: hibrit rotada web_node ile aynı sorgu tek arama çağrısını paylaşır
+        self.web_search = None
+
+    def _get_ranker(self):
+        """Lazy FlashRank (CPU): flashrank import'u ve model yüklemesi ilk ihtiyaçta yapılır."""
+        if self.ranker is None and not self._ranker_tried:
+            self._ranker_tried = True
+            try:
+                from flashrank import Ranker
+                print("⚡ FlashRank (CPU) hazırlanıyor...")
+                self.ranker = Ranker(model_name="ms-marco-TinyBERT-L-2-v2", cache_dir="./.flashrank_cache")
+            except Exception as e:
+                print(f"⚠️ Ranker başlatılamadı: {e}")
+        return self.ranker
 
     def _connect_google(self):
         """Lazy connection for Google GenAI"""
         if not self.client and self.google_api_key:
-            self.client = genai.Client(api_key=self.google_api_key)
+            self.client = gemini_client(self.google_api_key)
         return self.client
 
     def _connect_supabase(self):
         """Lazy connection for Supabase"""
         if not self.supabase and self.supabase_url and self.supabase_key:
             try:
-                self.supabase = create_client(self.supabase_url, self.supabase_key)
+                self.supabase = supabase_client(self.supabase_url, self.supabase_key)
             except Exception as e:
                 print(f"❌ Supabase Bağlantı Hatası: {e}")
         return self.supabase
@@ -67,17 +85,13 @@ class RagLayer:
         client = self._connect_google()
         if not client: return []
         
-        loop = asyncio.get_running_loop()
         try:
             # Yeni SDK Embedding Çağrısı
-            result = await loop.run_in_executor(
-                None, 
-                lambda: client.models.embed_content(
-                    model=EMBEDDING_MODEL,
-                    contents=text,
-                    config=types.EmbedContentConfig(task_type="RETRIEVAL_QUERY")
-                )
-            )
+            result = await provider_call("gemini", lambda: client.aio.models.embed_content(
+                model=EMBEDDING_MODEL,
+                contents=text,
+                config=types.EmbedContentConfig(task_type="RETRIEVAL_QUERY")
+            ), model=EMBEDDING_MODEL)
             return result.embeddings[0].values
         except Exception as e:
             print(f"⚠️ Embedding Hatası: {e}")
@@ -94,30 +108,51 @@ class RagLayer:
         Cevabı JSON ver: {{ "category": "...", "reasoning": "..." }}
         """
         try:
-            resp = client.models.generate_content(
-                model=MODEL_NAME,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json"
-                )
-            )
-            return QueryIntent.model_validate_json(resp.text)
+            async def call() -> str:
+                resp = await provider_call("gemini", lambda: client.aio.models.generate_content(
+                    model=MODEL_NAME,
+                    contents=prompt,
+                    config=types.GenerateContentConfig(
+                        response_mime_type="application/json"
+                    )
+                ), model=MODEL_NAME)
+                return resp.text
+
+            text = await cached_response("rag_intent", MODEL_NAME, prompt, call, validate=QueryIntent.model_validate_json)
+            return QueryIntent.model_validate_json(text)
         except:
             return QueryIntent(category="INTERNAL", reasoning="Fail-safe")
 
-    async def _search_supabase(self, query: str) -> List[Dict]:
+    async def embed_query(self, query: str) -> List[float]:
+        """Soru vektörü: documents'a yazan yerel model (main.py bağlar), yoksa Gemini embedding."""
+        if self.embed_fn:
+            return await self.embed_fn(query)
+        return await self._get_embedding(query)
+
+    async def _search_supabase(self, query: str, embedding=None) -> List[Dict]:
         sb = self._connect_supabase()
         if not sb: return []
 
-        vector = await self._get_embedding(query)
+        # İstek kapsamlı QueryEmbedding varsa router'ın hesapladığı vektör yeniden kullanılır
+        vector = await embedding.get() if embedding else await self.embed_query(query)
         if not vector: return []
+
+        if self.embed_fn:
+            # Saklama biçimine göre (float16 / kırpılmış) RPC ve sorgu vektörü seçilir
+            if self.ann_search:
+                try:
+                    docs = await asyncio.to_thread(self.ann_search, vector, 10, 0.5)
+                    if docs:
+                        return docs
+                except Exception as e:
+                    print(f"⚠️ ANN İndeks Hatası (RPC'ye geçiliyor): {e}")
+            rpc, params = match_request(vector, 0.5, 10)
+        else:
+            rpc, params = 'match_documents', {'query_embedding': vector, 'match_threshold': 0.5, 'match_count': 10}
         
         try:
-            res = sb.rpc('match_documents', {
-                'query_embedding': vector,
-                'match_threshold': 0.5, 
-                'match_count': 10
-            }).execute()
+            # Senkron supabase istemcisi event loop'u bloklamasın
+            res = await asyncio.to_thread(lambda: sb.rpc(rpc, params).execute())
             return res.data if res.data else []
         except Exception as e:
             print(f"⚠️ DB Hatası: {e}")
@@ -126,7 +161,22 @@ class RagLayer:
     async def _web_fallback(self, query: str) -> RagResult:
         if not ENABLE_WEB_SEARCH:
             return RagResult(found=False, source_type="none", context_str="", sources=[], chunks=[])
-        
+
+        if self.web_search:
+            res = await self.web_search(query)
+            return RagResult(
+                found=res.found,
+                source_type="error" if res.source_type == "error" else "external",
+                context_str=res.summary if res.found else "",
+                sources=res.source_links,
+                chunks=[]
+            )
+        return await cached_search(
+            "rag_web", query, lambda: self._web_search_uncached(query),
+            cacheable=lambda result: result.source_type != "error"
+        )
+
+    async def _web_search_uncached(self, query: str) -> RagResult:
         client = self._connect_google()
         if not client: return RagResult(found=False, source_type="error", context_str="", sources=[], chunks=[])
 
@@ -135,13 +185,13 @@ class RagLayer:
             # Yeni SDK ile Google Search Tool kullanımı
             google_search_tool = types.Tool(google_search=types.GoogleSearch())
             
-            resp = client.models.generate_content(
+            resp = await provider_call("gemini", lambda: client.aio.models.generate_content(
                 model=MODEL_NAME,
                 contents=f"Soruyu şu resmi kaynaklara göre cevapla ({', '.join(TRUSTED_LEGAL_SITES)}): {query}",
                 config=types.GenerateContentConfig(
                     tools=[google_search_tool]
                 )
-            )
+            ), model=MODEL_NAME)
             
             sources = []
             if resp.candidates and resp.candidates[0].grounding_metadata:
@@ -160,39 +210,79 @@ class RagLayer:
             print(f"❌ Web Search Hatası: {e}")
             return RagResult(found=False, source_type="error", context_str="", sources=[], chunks=[])
 
+    def _citation_docs(self, query: str) -> List[Dict]:
+        """"TCK 86", "TBK m. 344" gibi atıfların madde metni chunk'ları (indeks yoksa / çözülemezse boş)."""
+        if not self.citation_lookup:
+            return []
+        try:
+            docs = self.citation_lookup(query)
+        except Exception as e:
+            print(f"⚠️ Atıf İndeksi Hatası: {e}")
+            return []
+        if docs:
+            print(f"📑 Atıf çözüldü: {', '.join(dict.fromkeys(d['citation'] for d in docs))}")
+        return docs or []
+
+    def _citation_result(self, docs: List[Dict]) -> RagResult:
+        final = [{"id": str(d['id']), "text": d.get('content', ''), "meta": d.get('metadata', {})} for d in docs]
+        context = "\n---\n".join([f"Kaynak: {i['meta'].get('source')} ({d['citation']})\n{i['text']}" for i, d in zip(final, docs)])
+        return RagResult(
+            found=True,
+            source_type="internal",
+            context_str=context,
+            sources=list(dict.fromkeys(i['meta'].get('source') for i in final)),
+            chunks=final
+        )
+
     # DÜZELTME: Metot adı 'process' yerine 'search' yapıldı. graph.py bu ismi bekliyor.
-    async def search(self, query: str) -> RagResult:
+    async def search(self, query: str, intent: Optional[str] = None, embedding=None) -> RagResult:
+        """
+        intent: soru anlama aşamasından gelen "INTERNAL" / "FACTUAL"; yoksa burada sınıflandırılır.
+        embedding: istek kapsamlı QueryEmbedding (graph.py); soru bir analizde yalnızca bir kez vektörlenir.
+        """
         print(f"🚀 RAG İşleniyor: {query}")
+
+        # 0. Doğrudan madde atfı: sorgu sadece atıftan ibaretse niyet analizi, embedding, RPC ve reranking atlanır;
+        # atıf daha uzun bir sorunun parçasıysa madde chunk'ları aşağıda vektör adaylarına eklenir
+        cited = self._citation_docs(query)
+        if cited and citation_only(query):
+            return self._citation_result(cited)
         
         if not self._connect_google():
             return RagResult(found=False, source_type="error", context_str="API Key eksik", sources=[], chunks=[])
 
         # 1. Intent Analizi
-        intent = await self._classify_intent(query)
-        if intent.category == "FACTUAL":
+        if intent is None:
+            intent = (await self._classify_intent(query)).category
+        if intent == "FACTUAL":
             return await self._web_fallback(query)
 
-        # 2. Supabase Araması
-        docs = await self._search_supabase(query)
+        # 2. Supabase Araması (+ atıf yapılan maddelerin chunk'ları, tekrar edenler bir kez)
+        docs = await self._search_supabase(query, embedding)
+        if cited:
+            seen = {str(d.get('id')) for d in docs}
+            docs = [d for d in cited if str(d['id']) not in seen] + docs
         
         # 3. Sonuç yoksa Web Fallback
         if not docs:
             return await self._web_fallback(query)
 
         # 4. Reranking
-        if self.ranker:
+        ranker = self._get_ranker()
+        if ranker:
+            from flashrank import RerankRequest
             passages = [
                 {"id": str(d['id']), "text": d.get('content', ''), "meta": d.get('metadata', {})} 
                 for d in docs
             ]
             rerank_req = RerankRequest(query=query, passages=passages)
-            ranked = self.ranker.rerank(rerank_req)
+            ranked = await asyncio.to_thread(ranker.rerank, rerank_req)
             final = ranked[:5]
         else:
             final = docs[:5]
 
         # Skor düşükse yine Web'e git
-        if not final or (self.ranker and final[0]['score'] < 0.20):
+        if not final or (ranker and final[0]['score'] < 0.20):
              print("⚠️ Skor düşük -> Web Fallback")
              return await self._web_fallback(query)
 
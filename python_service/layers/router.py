@@ -1,11 +1,15 @@
 import os
 import json
 import asyncio
+import inspect
 import logging
 # Yeni Kütüphane Yapısı
-from google import genai
 from google.genai import types
-from supabase import create_client, Client
+from llm_limits import provider_call
+from clients import gemini_client, supabase_client
+from llm_cache import cached_response
+from semantic_cache import SemanticCache, SEMANTIC_CACHE_ENABLED, cache_metrics
+from supabase import Client
 from pydantic import BaseModel, Field
 from typing import Literal, Optional, List, Dict, Any
 
@@ -16,26 +20,31 @@ class RouteDecision(BaseModel):
     route: Literal["internal", "web", "hybrid"] # Graph.py bunları bekliyor
     action: Literal["cache_hit", "route"] = "route"
     cached_response: Optional[str] = None
+    cache_tier: Optional[Literal["local", "rpc"]] = None
+    cache_similarity: Optional[float] = None
     confidence: float = Field(default=0.0)
     reasoning: str = Field(default="")
 
 class RouterLayer:
     def __init__(self):
-        self.gemini_api_key = os.getenv("GOOGLE_API_KEY") # Standart key ismi
+        # Diğer katmanlarla aynı: GEMINI_API_KEY öncelikli, GOOGLE_API_KEY yedek
+        self.gemini_api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
         self.supabase_url = os.getenv("SUPABASE_URL")
-        self.supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+        self.supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY")
         self.client = None
+        # RPC'nin önündeki süreç içi anlamsal cache (RPC isabetleriyle dolar)
+        self.local_cache = SemanticCache() if SEMANTIC_CACHE_ENABLED else None
 
         if self.gemini_api_key:
             try:
                 # v1.0 SDK Client Init
-                self.client = genai.Client(api_key=self.gemini_api_key)
+                self.client = gemini_client(self.gemini_api_key)
             except Exception as e:
                 logger.error(f"Router Client başlatılamadı: {e}")
 
         if self.supabase_url and self.supabase_key:
             try:
-                self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
+                self.supabase: Client = supabase_client(self.supabase_url, self.supabase_key)
             except Exception as e:
                 logger.error(f"Router Supabase bağlantı hatası: {e}")
 
@@ -43,10 +52,10 @@ class RouterLayer:
         if not self.client: return []
         try:
             # Yeni SDK ile embedding çağrısı
-            result = await self.client.aio.models.embed_content(
+            result = await provider_call("gemini", lambda: self.client.aio.models.embed_content(
                 model="text-embedding-004",
                 contents=text
-            )
+            ), model="text-embedding-004")
             return result.embeddings[0].values
         except Exception as e:
             logger.error(f"Embedding Hatası: {e}")
@@ -55,15 +64,47 @@ class RouterLayer:
     async def _search_cache(self, embedding: List[float], threshold: float = 0.95) -> Optional[Dict]:
         if not embedding or not hasattr(self, 'supabase'): return None
         try:
-            response = self.supabase.rpc(
-                "match_similar_questions",
-                {"query_embedding": embedding, "match_threshold": threshold, "match_count": 1}
-            ).execute()
+            response = await asyncio.to_thread(
+                lambda: self.supabase.rpc(
+                    "match_similar_questions",
+                    {"query_embedding": embedding, "match_threshold": threshold, "match_count": 1}
+                ).execute()
+            )
             return response.data[0] if response.data else None
         except Exception as e:
             logger.error(f"Cache Hatası: {e}")
             return None
 
+    async def _cached_decision(self, vector: List[float]) -> Optional[RouteDecision]:
+        """Önce yerel anlamsal cache, sonra match_similar_questions RPC'si. Boş cevaplar isabet sayılmaz."""
+        if not vector:
+            return None
+        tier, answer, similarity = None, None, None
+        local = self.local_cache.lookup(vector) if self.local_cache else None
+        if local:
+            tier, (answer, similarity) = "local", local
+        else:
+            cache_result = await self._search_cache(vector)
+            if cache_result:
+                # Next.js tarafı answer_text, eski şema answer_content döndürür
+                answer = cache_result.get('answer_content') or cache_result.get('answer_text')
+                similarity = cache_result.get('similarity')
+                tier = "rpc"
+                if answer and self.local_cache:
+                    self.local_cache.put(vector, answer)
+        if not answer:
+            return None
+        logger.info(f"⚡ Cache Hit ({tier}, benzerlik {similarity})")
+        return RouteDecision(
+            route="internal", # Cache hit genellikle internal veridir
+            action="cache_hit",
+            cached_response=answer,
+            cache_tier=tier,
+            cache_similarity=similarity,
+            confidence=1.0,
+            reasoning="Cache Hit"
+        )
+
     async def _classify_intent(self, query: str) -> Dict[str, Any]:
         if not self.client:
             return {"category": "web", "confidence": 0.0}
@@ -81,37 +122,48 @@ class RouterLayer:
         """
 
         try:
-            response = await self.client.aio.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    temperature=0.0
-                )
-            )
-            return json.loads(response.text)
+            async def call() -> str:
+                response = await provider_call("gemini", lambda: self.client.aio.models.generate_content(
+                    model="gemini-2.0-flash",
+                    contents=prompt,
+                    config=types.GenerateContentConfig(
+                        response_mime_type="application/json",
+                        temperature=0.0
+                    )
+                ), model="gemini-2.0-flash")
+                return response.text
+
+            return json.loads(await cached_response("router", "gemini-2.0-flash", prompt, call, validate=json.loads))
         except Exception as e:
             logger.error(f"Sınıflandırma Hatası: {e}")
             return {"category": "web", "confidence": 0.0, "reasoning": "Fallback"}
 
-    async def decide(self, query: str) -> RouteDecision:
-        """Graph.py'nin beklediği ana metod."""
+    async def decide(self, query: str, understanding=None, embedding=None) -> RouteDecision:
+        """
+        Graph.py'nin beklediği ana metod.
+        understanding: soru anlama sonucu (QueryUnderstanding) veya onu verecek bir task; varsa ayrı
+        sınıflandırma çağrısı yapılmaz. Task ise cache kontrolüyle eşzamanlı ilerler, cache ıskalanınca beklenir.
+        embedding: istek kapsamlı QueryEmbedding; soru vektörü RAG ile paylaşılır (yoksa burada hesaplanır).
+        """
         
         # 1. Önce Cache Kontrolü (Hız için)
-        embedding = await self._get_embedding(query)
-        cache_result = await self._search_cache(embedding)
-        
-        if cache_result:
-            return RouteDecision(
-                route="internal", # Cache hit genellikle internal veridir
-                action="cache_hit",
-                cached_response=cache_result.get('answer_content', ''),
-                confidence=1.0,
-                reasoning="Cache Hit"
-            )
+        vector = await embedding.get() if embedding else await self._get_embedding(query)
+        decision = await self._cached_decision(vector)
+        cache_metrics.lookup(decision.cache_tier if decision else None)
+        if decision:
+            return decision
 
-        # 2. AI Sınıflandırma
-        intent = await self._classify_intent(query)
+        # 2. AI Sınıflandırma (soru anlama sonucu varsa tekrar sorulmaz)
+        if inspect.isawaitable(understanding):
+            understanding = await understanding
+        if understanding:
+            intent = {
+                "category": understanding.route,
+                "confidence": understanding.route_confidence,
+                "reasoning": understanding.reasoning
+            }
+        else:
+            intent = await self._classify_intent(query)
         category = intent.get("category", "web").lower()
         
         # Güvenlik Ağı: Confidence düşükse hybrid'e zorla
@@ -5,8 +5,10 @@ from typing import List, Dict, Optional, Any
 from pydantic import BaseModel, Field
 
 # --- YENİ SDK ---
-from google import genai
 from google.genai import types
+from llm_limits import provider_call
+from clients import gemini_client
+from web_cache import cached_search
 
 # Logger yapılandırması
 logging.basicConfig(level=logging.INFO)
@@ -58,7 +60,7 @@ class WebLayer:
         if self.api_key:
             try:
                 # Yeni SDK Client Başlatma
-                self.client = genai.Client(api_key=self.api_key)
+                self.client = gemini_client(self.api_key)
             except Exception as e:
                 logger.error(f"Google Client başlatılamadı: {e}")
         else:
@@ -79,8 +81,15 @@ class WebLayer:
     async def search(self, query: str) -> WebResult:
         """
         Google Search Tool kullanarak internetten güncel bilgi çeker.
-        Bu metod Rate Limit sorununu çözer.
+        Aynı (normalize) sorgu önbellekten döner; eşzamanlı aynı sorgular tek sağlayıcı çağrısını paylaşır.
+        Hata sonuçları önbelleğe yazılmaz.
         """
+        return await cached_search(
+            "web", query, lambda: self._search_uncached(query),
+            cacheable=lambda result: result.source_type != "error"
+        )
+
+    async def _search_uncached(self, query: str) -> WebResult:
         if not self.client:
             return WebResult(found=False, summary="API Key eksik, arama yapılamadı.", source_type="error")
 
@@ -105,21 +114,15 @@ class WebLayer:
             4. Cevap yoksa "Bilgi bulunamadı" de.
             """
 
-            # 3. Modeli Çağır (Asenkron Wrapper ile)
-            # Google'ın yeni SDK'sı şu an native async tam desteklemediği için executor kullanıyoruz
-            loop = asyncio.get_running_loop()
-            
-            def call_model():
-                return self.client.models.generate_content(
-                    model=self.model_name,
-                    contents=prompt,
-                    config=types.GenerateContentConfig(
-                        tools=[google_search_tool],
-                        response_mime_type="text/plain"
-                    )
+            # 3. Modeli Çağır (native async, sağlayıcı kota ve eşzamanlılık sınırı içinde)
+            response = await provider_call("gemini", lambda: self.client.aio.models.generate_content(
+                model=self.model_name,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    tools=[google_search_tool],
+                    response_mime_type="text/plain"
                 )
-
-            response = await loop.run_in_executor(None, call_model)
+            ), model=self.model_name)
 
             # 4. Kaynakları Ayıkla (Grounding Metadata)
             sources = []
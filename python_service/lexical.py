@@ -0,0 +1,353 @@
+import os
+import re
+import math
+import heapq
+import pickle
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Türkçe metin için BM25 ters indeksi.
+# - Normalizasyon: Türkçe küçük harf (I->ı, İ->i), ardından ı/ş/ğ/ç/ö/ü katlama ("kiracının" ~ "KIRACININ" ~ "kiracinin")
+# - Hafif kök bulma: çekim eklerini sabit sırayla sondan atar (kiracının -> kirac, sözleşmenin -> sozlesm)
+# - documents.ingest_seq yüksek su işaretinden artımlı senkron + ingestion sırasında anında ekleme.
+# Anlık görüntü (snapshot) diske yazılır; yeniden başlatmada korpus baştan indirilmez.
+
+logger = logging.getLogger("BabyLexitLexical")
+
+# --- AYARLAR ---
+# /search'ün BM25 ayağı. Prefork sunumda (serve.py) snapshot ana süreçte gc.freeze'den önce bir kez yüklenir,
+# HTTP çocukları sayfaları paylaşır ve sadece artımlı senkronu kendileri yapar. Kuyruk süreci indeksi yüklemez.
+# 0 ise /search sadece vektör + atıf sıralamasıyla çalışır ve yanıtta "lexical": "disabled" döner.
+LEXICAL_INDEX_ENABLED = os.getenv("LEXICAL_INDEX_ENABLED", "1") == "1"
+LEXICAL_INDEX_PATH = os.getenv(
+    "LEXICAL_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".lexical_index", "bm25.pkl")
+)
+LEXICAL_SYNC_SECONDS = float(os.getenv("LEXICAL_SYNC_SECONDS", "60"))
+LEXICAL_SYNC_BATCH = int(os.getenv("LEXICAL_SYNC_BATCH", "1000"))
+LEXICAL_SYNC_OVERLAP = int(os.getenv("LEXICAL_SYNC_OVERLAP", "500"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+SEQ_COLUMN = "ingest_seq"
+
+# --- TÜRKÇE NORMALİZASYON ---
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_FOLD = str.maketrans({"ı": "i", "ş": "s", "ğ": "g", "ç": "c", "ö": "o", "ü": "u", "â": "a", "î": "i", "û": "u"})
+_LOWER = str.maketrans({"I": "ı", "İ": "i"})
+
+_STOPWORDS = frozenset({
+    "ve", "veya", "ile", "bir", "bu", "su", "o", "icin", "de", "da", "ki", "mi", "mu", "ne", "olan", "olarak",
+    "gibi", "kadar", "daha", "en", "ama", "fakat", "ancak", "ya", "hem", "her", "cok", "sonra", "once", "ise",
+    "nasil", "neden", "nedir", "hangi", "midir", "var", "yok", "degil", "the", "and", "of",
+})
+
+# Katlanmış (ascii) biçimde ekler. Kelime sonundan başa doğru her yuva (slot) en fazla bir kez denenir:
+# kök + çoğul + iyelik + hal + ki + ek-fiil. Yuva içinde uzundan kısaya. Tek ünlü ekler (i, a, e, u) yuvalarda
+# yoktur; kök sonundaki ünlüler ve kaynaştırma harfleri _tail() ile her biçimde aynı şekilde atılır.
+_VOWELS = frozenset("aeiou")
+_VOICELESS = frozenset("cfhkpst")
+_PREDICATE = ("dir", "dur", "tir", "tur")
+_RELATIVE = ("ki",)
+_CASE = (
+    "ndan", "nden", "nda", "nde", "nin", "nun", "yla", "yle",
+    "dan", "den", "tan", "ten", "da", "de", "ta", "te", "la", "le",
+    "ya", "ye", "yi", "yu", "na", "ne", "ni", "nu", "in", "un",
+)
+_POSSESSIVE = ("lari", "leri", "imiz", "iniz", "miz", "niz", "si", "su")
+_PLURAL = ("lar", "ler")
+_SLOTS = (_PREDICATE, _RELATIVE, _CASE, _POSSESSIVE, _PLURAL)
+# Ünlü düşmesi / ünsüz ikizleşmesi olan sık hukuk kökleri: "hapsi" -> "hapis", "hükmü" -> "hüküm", "hakkı" -> "hak"
+_ELIDED = {
+    "haps": "hapis", "hukm": "hukum", "hacz": "haciz", "akd": "akit", "ahd": "ahit", "nakl": "nakil",
+    "kasd": "kasit", "kast": "kasit", "emr": "emir", "akl": "akil", "ism": "isim", "sehr": "sehir",
+    "kayb": "kayip", "hakk": "hak", "redd": "ret", "aff": "af", "hiss": "his", "zann": "zan",
+}
+# Ünsüz yumuşaması: "sanığın" -> sanig -> sanik
+_SOFTENED = {"g": "k", "d": "t", "b": "p"}
+_MIN_STEM = 4
+# Kök bulucu değişince artırılır: eski analizle kurulmuş snapshot yüklenmez, indeks baştan kurulur
+ANALYZER_VERSION = 2
+
+
+def normalize_tr(text: str) -> str:
+    """Türkçe kurallarla küçük harfe çevirir ve diakritikleri katlar."""
+    return text.translate(_LOWER).lower().replace("i̇", "i").translate(_FOLD)
+
+
+def _strip_slot(token: str, suffixes) -> str:
+    for suffix in suffixes:
+        if not token.endswith(suffix) or len(token) - len(suffix) < _MIN_STEM:
+            continue
+        before = token[-len(suffix) - 1]
+        # Kaynaştırmalı biçimler (nin, ye, si, miz...) ünlüden, kaynaştırmasızlar (in, un) ünsüzden,
+        # sertleşmiş biçimler (ta, ten) sert ünsüzden sonra gelir: "tazminat-a" locative "ta" değildir
+        if suffix[0] in "nys" or suffix in ("miz", "niz"):
+            if before not in _VOWELS:
+                continue
+        elif suffix in ("in", "un") and before in _VOWELS:
+            continue
+        elif suffix[0] == "t" and before not in _VOICELESS:
+            continue
+        return token[:-len(suffix)]
+    return token
+
+
+def _tail(token: str) -> str:
+    """Kök sonunu tek biçime indirir: ünlüler ve ünlü sonrası y/n atılır (tahliye, tahliye-si, tahliye-ye -> tahl)."""
+    base = token.rstrip("aeiou")
+    if base in _ELIDED:
+        return _ELIDED[base]
+    while len(token) > _MIN_STEM:
+        if token[-1] in _VOWELS or (token[-1] in "yn" and token[-2] in _VOWELS):
+            token = token[:-1]
+        else:
+            break
+    return token[:-1] + _SOFTENED[token[-1]] if token[-1] in _SOFTENED else token
+
+
+def stem_tr(token: str) -> str:
+    """Ekleri sabit sırayla, her yuvadan en fazla bir kez atar; kök _MIN_STEM karakterden kısa kalmaz."""
+    if len(token) <= _MIN_STEM:
+        return _ELIDED.get(token.rstrip("aeiou"), token)
+    for suffixes in _SLOTS:
+        token = _strip_slot(token, suffixes)
+    return _tail(token)
+
+
+def analyze(text: str) -> List[str]:
+    """Metni indeks terimlerine çevirir (sayılar korunur: madde numaraları önemlidir)."""
+    return [
+        stem_tr(t) if not t.isdigit() else t
+        for t in _TOKEN_RE.findall(normalize_tr(text or ""))
+        if t not in _STOPWORDS
+    ]
+
+
+# Aynı köke inmesi gereken çekimler (kök bulucu değişirse import sırasında yakalanır)
+_STEM_CHECKS = (
+    ("tahliye", "tahliyesi", "tahliyeye", "tahliyenin"),
+    ("mahkeme", "mahkemenin", "mahkemeye", "mahkemesinde", "mahkemelerde", "mahkemedeki"),
+    ("işveren", "işverenin", "işverene", "işverenlerin"),
+    ("hapis", "hapsi", "hapse", "hapiste"),
+    ("kiracı", "kiracının", "kiracısı", "kiracıya", "kiracılar"),
+    ("sözleşme", "sözleşmenin", "sözleşmesi", "sözleşmeden"),
+    ("tazminat", "tazminatı", "tazminatın", "tazminata", "tazminattan"),
+    ("madde", "maddesi", "maddenin", "maddede"),
+    ("hüküm", "hükmü", "hükmün"),
+    ("sanık", "sanığın", "sanığa", "sanıklar"),
+    ("hak", "hakkı", "hakkında"),
+)
+for _forms in _STEM_CHECKS:
+    assert len({stem_tr(normalize_tr(f)) for f in _forms}) == 1, f"Kök uyuşmazlığı: {_forms}"
+
+
+class Bm25Index:
+    """Bellek içi BM25 ters indeksi. add/search thread-safe'tir."""
+
+    def __init__(self, path: Optional[str] = LEXICAL_INDEX_PATH, k1: float = BM25_K1, b: float = BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.doc_ids: List[str] = []
+        self.docs: List[Tuple[str, Dict[str, Any]]] = []   # (content, metadata)
+        self.lengths: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self._pos: Dict[str, int] = {}
+        self._total_len = 0
+        self.hwm = 0
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.searches = 0
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    # --- Kalıcılık ---
+
+    def load(self) -> "Bm25Index":
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "rb") as f:
+                    state = pickle.load(f)
+                version, *state = state
+                if version != ANALYZER_VERSION:
+                    raise ValueError(f"analyzer sürümü {version} != {ANALYZER_VERSION}")
+                with self._lock:
+                    self.doc_ids, self.docs, self.lengths, self.postings, self.hwm = state
+                    self._pos = {d: i for i, d in enumerate(self.doc_ids)}
+                    self._total_len = sum(self.lengths)
+                logger.info(f"📚 BM25 indeksi yüklendi: {len(self)} doküman")
+            except Exception as e:
+                logger.warning(f"⚠️ BM25 snapshot okunamadı ({e}), sıfırdan kurulacak.")
+        return self
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            state = (ANALYZER_VERSION, self.doc_ids, self.docs, self.lengths, self.postings, self.hwm)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._dirty = False
+        os.replace(tmp, self.path)
+
+    # --- Yazma ---
+
+    def add(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """documents satırlarını (id, content, metadata) ekler; zaten olanlar atlanır."""
+        added = 0
+        with self._lock:
+            for row in rows:
+                doc_id = str(row.get("id") or "")
+                content = row.get("content") or ""
+                if not doc_id or doc_id in self._pos or not content.strip():
+                    continue
+                terms = Counter(analyze(content))
+                pos = len(self.doc_ids)
+                self._pos[doc_id] = pos
+                self.doc_ids.append(doc_id)
+                self.docs.append((content, row.get("metadata") or {}))
+                length = sum(terms.values())
+                self.lengths.append(length)
+                self._total_len += length
+                for term, tf in terms.items():
+                    self.postings.setdefault(term, {})[pos] = tf
+                added += 1
+            if added:
+                self._dirty = True
+        return added
+
+    def remove(self, doc_ids: Iterable[str]) -> int:
+        """Silinen documents satırlarını çıkarır. Pozisyonlar yeniden numaralanır (seyrek işlem: dosya tekrar işlenince)."""
+        with self._lock:
+            drop = {self._pos[d] for d in map(str, doc_ids) if d in self._pos}
+            if not drop:
+                return 0
+            keep = [pos for pos in range(len(self.doc_ids)) if pos not in drop]
+            remap = {old: new for new, old in enumerate(keep)}
+            self.doc_ids = [self.doc_ids[pos] for pos in keep]
+            self.docs = [self.docs[pos] for pos in keep]
+            self.lengths = [self.lengths[pos] for pos in keep]
+            postings: Dict[str, Dict[int, int]] = {}
+            for term, posting in self.postings.items():
+                kept = {remap[pos]: tf for pos, tf in posting.items() if pos in remap}
+                if kept:
+                    postings[term] = kept
+            self.postings = postings
+            self._pos = {d: i for i, d in enumerate(self.doc_ids)}
+            self._total_len = sum(self.lengths)
+            self._dirty = True
+        return len(drop)
+
+    # --- Arama ---
+
+    def search(self, query: str, k: int = 20) -> List[Dict[str, Any]]:
+        terms = set(analyze(query))
+        with self._lock:
+            n = len(self.doc_ids)
+            if not n or not terms:
+                return []
+            avgdl = self._total_len / n
+            scores: Dict[int, float] = {}
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for pos, tf in posting.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[pos] / avgdl)
+                    scores[pos] = scores.get(pos, 0.0) + idf * tf * (self.k1 + 1) / norm
+            top = heapq.nlargest(k, scores.items(), key=lambda x: x[1])
+            results = [
+                {"id": self.doc_ids[pos], "content": self.docs[pos][0], "metadata": self.docs[pos][1], "score": score}
+                for pos, score in top
+            ]
+        self.searches += 1
+        return results
+
+    # --- Senkron ---
+
+    def sync_once(self, client) -> int:
+        added = 0
+        cursor = max(0, self.hwm - LEXICAL_SYNC_OVERLAP)
+        while True:
+            data = (
+                client.table("documents")
+                .select(f"id, content, metadata, {SEQ_COLUMN}")
+                .gt(SEQ_COLUMN, cursor)
+                .order(SEQ_COLUMN)
+                .limit(LEXICAL_SYNC_BATCH)
+                .execute().data or []
+            )
+            if not data:
+                break
+            added += self.add(data)
+            cursor = int(data[-1][SEQ_COLUMN])
+            with self._lock:
+                self.hwm = max(self.hwm, cursor)
+                self._dirty = True
+            if len(data) < LEXICAL_SYNC_BATCH:
+                break
+        if added:
+            logger.info(f"🔄 BM25 indeksine {added} doküman eklendi (toplam {len(self)})")
+        self.save()
+        return added
+
+    def start_sync(self, client, interval: float = LEXICAL_SYNC_SECONDS):
+        if self._thread:
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.sync_once(client)
+                except Exception as e:
+                    logger.error(f"❌ BM25 Senkron Hatası: {e}")
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, daemon=True, name="bm25-sync")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self.save()
+        except Exception as e:
+            logger.error(f"BM25 Snapshot Yazma Hatası: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self),
+            "terms": len(self.postings),
+            "hwm": self.hwm,
+            "searches": self.searches,
+        }
+
+
+def rrf_fuse(rankings: Dict[str, List[Dict[str, Any]]], k: int = 60, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Reciprocal Rank Fusion: her listedeki sıra r için 1 / (k + r) toplanır.
+    rankings: {"bm25": [...], "dense": [...]}; her eleman en az "id" içerir.
+    Sonuçlarda kaynak başına sıra ve ham skor da döner.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for name, results in rankings.items():
+        for rank, item in enumerate(results, start=1):
+            doc_id = str(item["id"])
+            entry = fused.setdefault(doc_id, {
+                "id": doc_id, "content": item.get("content"), "metadata": item.get("metadata") or {},
+                "score": 0.0, "ranks": {}, "scores": {},
+            })
+            entry["score"] += 1.0 / (k + rank)
+            entry["ranks"][name] = rank
+            entry["scores"][name] = item.get("score", item.get("similarity"))
+            if not entry["content"] and item.get("content"):
+                entry["content"] = item["content"]
+    return sorted(fused.values(), key=lambda e: e["score"], reverse=True)[:limit]
@@ -0,0 +1,182 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from embedding_cache import normalize_text
+
+# Deterministik LLM çağrıları için kalıcı cevap önbelleği (opt-in: LLM_CACHE_ENABLED=1).
+# Guard, router, RAG niyet, soru anlama ve expert karmaşıklık çağrıları temperature=0 / JSON çıktılıdır;
+# popüler sorular, start_analysis tekrar denemeleri ve aynı SSS aynı cevabı üretir.
+# Anahtar: sha256(model + sistem promptu + normalize edilmiş prompt). sqlite'ta TTL ve boyut sınırlı (LRU) saklanır.
+
+logger = logging.getLogger("BabyLexitLLMCache")
+
+# --- AYARLAR ---
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "0") == "1"
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_DISK_MB = float(os.getenv("LLM_CACHE_DISK_MB", "256"))
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache", "responses.db")
+)
+# Disk boyutu her N yazımda bir kontrol edilir
+_DISK_CHECK_EVERY = 200
+
+# Prefork sunumda (serve.py) her çocuk süreç kendi sqlite bağlantısını açar
+_live_caches: "weakref.WeakSet" = weakref.WeakSet()
+_inherited_connections: list = []
+
+
+def _reopen_after_fork():
+    for cache in list(_live_caches):
+        cache._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reopen_after_fork)
+
+
+def response_key(model: str, prompt: str, system: str = "") -> str:
+    return hashlib.sha256(
+        f"{model}\x00{normalize_text(system)}\x00{normalize_text(prompt)}".encode("utf-8")
+    ).hexdigest()
+
+
+class LlmResponseCache:
+    """sqlite tabanlı, TTL ve boyut sınırlı LLM cevap önbelleği. Katman başına isabet sayaçları tutar."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL, disk_mb: float = LLM_CACHE_DISK_MB):
+        self.path = path
+        self.ttl = ttl
+        self.disk_limit = int(disk_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes = 0
+        self.evictions = 0
+        self.layers: Dict[str, Dict[str, int]] = {}
+        self._open_db()
+        _live_caches.add(self)
+
+    def _open_db(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, layer TEXT NOT NULL, model TEXT NOT NULL, response TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, last_used INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+            logger.info(f"💾 LLM cevap önbelleği: {self.path}")
+        except Exception as e:
+            logger.warning(f"⚠️ LLM cevap önbelleği açılamadı ({e}). Önbelleksiz devam edilecek.")
+            self._db = None
+
+    def _after_fork(self):
+        """fork sonrası çocuk süreçte: ebeveynin bağlantısı kapatılmadan bırakılır, yenisi açılır."""
+        self._lock = threading.Lock()
+        if self._db is not None:
+            _inherited_connections.append(self._db)
+            self._db = None
+            self._open_db()
+
+    def _counter(self, layer: str) -> Dict[str, int]:
+        return self.layers.setdefault(layer, {"hits": 0, "misses": 0, "writes": 0})
+
+    def get(self, layer: str, key: str) -> Optional[str]:
+        if not self._db:
+            return None
+        with self._lock:
+            try:
+                row = self._db.execute("SELECT response, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and row[1] > time.time():
+                    self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (int(time.time()), key))
+                    self._counter(layer)["hits"] += 1
+                    return row[0]
+                if row:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            except Exception as e:
+                logger.error(f"LLM Önbellek Okuma Hatası: {e}")
+            self._counter(layer)["misses"] += 1
+            return None
+
+    def put(self, layer: str, key: str, model: str, response: str, ttl: Optional[float] = None):
+        if not self._db or not response:
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, layer, model, response, expires_at, last_used)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, layer, model, response, now + (ttl or self.ttl), int(now))
+                )
+                self._counter(layer)["writes"] += 1
+                self._writes += 1
+                if self._writes >= _DISK_CHECK_EVERY:
+                    self._writes = 0
+                    self._evict()
+            except Exception as e:
+                logger.error(f"LLM Önbellek Yazma Hatası: {e}")
+
+    def _evict(self):
+        """Süresi dolanları siler; disk sınırı hâlâ aşılıyorsa en uzun süredir kullanılmayan ~%10'u siler."""
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        page_count = self._db.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+        freelist = self._db.execute("PRAGMA freelist_count").fetchone()[0]
+        if (page_count - freelist) * page_size <= self.disk_limit:
+            return
+        total = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        n = max(1, total // 10)
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)", (n,)
+        )
+        self.evictions += n
+        logger.info(f"🧹 LLM cevap önbelleğinden {n} kayıt silindi.")
+
+    def stats(self) -> Dict[str, Any]:
+        layers = {}
+        for layer, c in self.layers.items():
+            lookups = c["hits"] + c["misses"]
+            layers[layer] = {**c, "hit_ratio": round(c["hits"] / lookups, 4) if lookups else 0.0}
+        return {"disk": bool(self._db), "ttl": self.ttl, "evictions": self.evictions, "layers": layers}
+
+
+llm_cache: Optional[LlmResponseCache] = LlmResponseCache() if LLM_CACHE_ENABLED else None
+
+
+async def cached_response(layer: str, model: str, prompt: str, call: Callable[[], Awaitable[str]],
+                          system: str = "", validate: Optional[Callable[[str], Any]] = None) -> str:
+    """
+    Önbellekte varsa cevabı döndürür, yoksa `call()` ile üretip yazar. Önbellek kapalıysa doğrudan çağırır.
+    validate verilirse (ör. json.loads) hata fırlatan cevaplar önbelleğe yazılmaz / önbellekten okunmaz.
+    """
+    if not llm_cache:
+        return await call()
+
+    key = response_key(model, prompt, system)
+    cached = llm_cache.get(layer, key)
+    if cached is not None:
+        try:
+            if validate:
+                validate(cached)
+            return cached
+        except Exception:
+            pass
+
+    text = await call()
+    try:
+        if validate:
+            validate(text)
+    except Exception:
+        return text
+    llm_cache.put(layer, key, model, text)
+    return text
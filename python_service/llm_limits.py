@@ -0,0 +1,360 @@
+import os
+import re
+import time
+import random
+import asyncio
+import logging
+import threading
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+# Sağlayıcı başına uyarlanabilir eşzamanlılık, model başına hız sınırı.
+# Katmanlar (guard, router, rag, web, expert, author) çağrılarını `provider_call(...)` ya da
+# `async with provider_slot(...)` ile sarar.
+#   - sağlayıcı başına AIMD eşzamanlılık: 429'da limit yarıya iner, aksi halde her "limit" başarılı çağrıda +1 artar
+#   - (sağlayıcı, model) başına token kovası: dakikalık istek kotası (LLM_RPM_*), fazlası sırada bekler
+# provider_call 429 alan çağrıyı hata olarak döndürmek yerine geri çekilip tekrar sıraya koyar.
+
+logger = logging.getLogger("BabyLexitLLM")
+
+# --- AYARLAR ---
+# LLM_CONCURRENCY_<SAĞLAYICI> (ör. LLM_CONCURRENCY_GEMINI=16); tanımsızsa LLM_CONCURRENCY_DEFAULT. Başlangıç limiti.
+LLM_CONCURRENCY_DEFAULT = int(os.getenv("LLM_CONCURRENCY_DEFAULT", "8"))
+# AIMD'nin çıkabileceği üst sınır: başlangıç limitinin katı
+LLM_CONCURRENCY_MAX_FACTOR = float(os.getenv("LLM_CONCURRENCY_MAX_FACTOR", "4"))
+# LLM_RPM_<SAĞLAYICI>_<MODEL> > LLM_RPM_<SAĞLAYICI> > LLM_RPM_DEFAULT (0: kova yok)
+LLM_RPM_DEFAULT = float(os.getenv("LLM_RPM_DEFAULT", "600"))
+# 429 alan çağrı kaç kez tekrar sıraya konur
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+# Gecikme hareketli ortalaması (limit düşürme kararında kullanılmaz)
+_EMA_ALPHA = 0.2
+_RETRY_AFTER_RE = re.compile(r"retry[ _-]?(?:after|delay)\D{0,10}(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+_RATE_LIMIT_TEXT_RE = re.compile(r"\b429\b|RESOURCE_EXHAUSTED")
+
+T = TypeVar("T")
+
+
+def provider_of(model: str) -> str:
+    """litellm model adından sağlayıcıyı çıkarır: "gemini/gemini-2.0-flash" -> "gemini", "gemini-2.0-flash" -> "gemini"."""
+    if "/" in model:
+        return model.split("/", 1)[0].lower()
+    if model.startswith("gemini") or model.startswith("text-embedding"):
+        return "gemini"
+    if model.startswith(("gpt-", "o1", "o3")):
+        return "openai"
+    if model.startswith("claude"):
+        return "anthropic"
+    return "default"
+
+
+def _env_name(value: str) -> str:
+    return re.sub(r"[^A-Z0-9]+", "_", value.upper()).strip("_")
+
+
+def concurrency_for(provider: str) -> int:
+    return max(1, int(os.getenv(f"LLM_CONCURRENCY_{_env_name(provider)}", LLM_CONCURRENCY_DEFAULT)))
+
+
+def rpm_for(provider: str, model: Optional[str] = None) -> float:
+    if model:
+        value = os.getenv(f"LLM_RPM_{_env_name(provider)}_{_env_name(model.split('/')[-1])}")
+        if value:
+            return float(value)
+    return float(os.getenv(f"LLM_RPM_{_env_name(provider)}", LLM_RPM_DEFAULT))
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """google-genai (APIError.code), litellm (RateLimitError, status_code) ve metin içi 429 / RESOURCE_EXHAUSTED."""
+    for attr in ("code", "status_code", "status"):
+        if getattr(exc, attr, None) in (429, "429", "RESOURCE_EXHAUSTED"):
+            return True
+    if "RateLimit" in type(exc).__name__:
+        return True
+    return bool(_RATE_LIMIT_TEXT_RE.search(str(exc)))
+
+
+def _retry_after(exc: BaseException, attempt: int) -> float:
+    match = _RETRY_AFTER_RE.search(str(exc))
+    if match:
+        return min(LLM_BACKOFF_MAX, float(match.group(1)))
+    delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
+
+
+class TokenBucket:
+    """Rezervasyonlu token kovası: her istek bir token ayırır, kova eksiye düşerse o kadar bekler (FIFO adil)."""
+
+    def __init__(self, rpm: float, burst: float):
+        self.rate = rpm / 60.0
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self, now: float) -> float:
+        """Bir token ayırır; istek gönderilmeden önce beklenecek süreyi (sn) döndürür."""
+        if self.rate <= 0:
+            return max(0.0, self.blocked_until - now)
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def block(self, now: float, seconds: float):
+        """429 sonrası: kova boşaltılır ve süre dolana kadar yeni istek çıkmaz."""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = min(self.tokens, 0.0)
+        self._updated = now
+
+
+class _Gate:
+    """Tek event loop içinde değişken limitli semafor (limit AdaptiveLimit'ten okunur)."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self, limit: Callable[[], int]):
+        if self.in_flight < limit() and not self.waiters:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Slot verilmişti ama bekleyen iptal edildi: slotu sıradakine devret
+                self.release(limit)
+            elif future in self.waiters:
+                self.waiters.remove(future)
+            raise
+
+    def release(self, limit: Callable[[], int]):
+        self.in_flight -= 1
+        self.wake(limit)
+
+    def wake(self, limit: Callable[[], int]):
+        while self.waiters and self.in_flight < limit():
+            future = self.waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+
+class ModelBucket:
+    """Bir (sağlayıcı, model) anahtarının token kovası ve metrikleri (kotalar modele göre tanımlanır)."""
+
+    def __init__(self, provider: str, model: Optional[str], burst: int):
+        self.key = f"{provider}:{model}" if model else provider
+        rpm = rpm_for(provider, model)
+        self.bucket = TokenBucket(rpm, burst=burst)
+        self._lock = threading.Lock()
+        self.latency_ema: Optional[float] = None
+        self.stat: Dict[str, Any] = {"rpm": rpm, "calls": 0, "rate_limited": 0, "rate_wait_ms_total": 0.0}
+
+    def reserve(self) -> float:
+        with self._lock:
+            return self.bucket.reserve(time.monotonic())
+
+    def observe(self, latency_ms: float):
+        with self._lock:
+            self.latency_ema = latency_ms if self.latency_ema is None else \
+                (1 - _EMA_ALPHA) * self.latency_ema + _EMA_ALPHA * latency_ms
+
+    def block(self, seconds: float):
+        with self._lock:
+            self.stat["rate_limited"] += 1
+            self.bucket.block(time.monotonic(), seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        stat = self.stat
+        calls = stat["calls"]
+        return {
+            "rpm": stat["rpm"], "calls": calls, "rate_limited": stat["rate_limited"],
+            "rate_wait_ms_avg": round(stat["rate_wait_ms_total"] / calls, 1) if calls else 0.0,
+            "latency_ms_ema": round(self.latency_ema, 1) if self.latency_ema is not None else None,
+        }
+
+
+class AdaptiveLimit:
+    """
+    Bir sağlayıcının AIMD eşzamanlılık limiti (tüm modelleri ortak). Event loop'lar arasında paylaşılır.
+    Limit sadece 429'da düşer: aynı modelde kısa JSON ve uzun rapor çağrıları karışık olduğundan gecikme
+    tek başına aşırı yük sinyali değildir.
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.initial = concurrency_for(provider)
+        self.min_limit = 1.0
+        self.max_limit = max(float(self.initial), self.initial * LLM_CONCURRENCY_MAX_FACTOR)
+        self.limit = float(self.initial)
+        self._lock = threading.Lock()
+        self._gates: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _Gate]" = weakref.WeakKeyDictionary()
+        self._last_decrease = 0.0
+        # Tüm modellerin ortak gecikme ortalaması: 429 yarılamaları arasındaki asgari aralık (bir "tur")
+        self.latency_ema: Optional[float] = None
+        self.stat: Dict[str, Any] = {
+            "in_flight": 0, "peak_in_flight": 0, "queue_depth": 0, "peak_queue_depth": 0,
+            "calls": 0, "errors": 0, "rate_limited": 0, "retries": 0, "decreases": 0,
+            "wait_ms_total": 0.0, "wait_ms_max": 0.0,
+        }
+
+    def current(self) -> int:
+        return max(1, int(self.limit))
+
+    def gate(self) -> _Gate:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._gates:
+                self._gates[loop] = _Gate()
+            return self._gates[loop]
+
+    def on_success(self, latency_ms: float):
+        with self._lock:
+            self.latency_ema = latency_ms if self.latency_ema is None else \
+                (1 - _EMA_ALPHA) * self.latency_ema + _EMA_ALPHA * latency_ms
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def on_rate_limited(self, key: str, backoff: float):
+        now = time.monotonic()
+        with self._lock:
+            self.stat["rate_limited"] += 1
+            # Aynı 429 dalgasında üst üste yarılamaz: en az bir ortalama çağrı süresi arayla
+            if now - self._last_decrease >= (self.latency_ema or 1000.0) / 1000:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * 0.5)
+                self.stat["decreases"] += 1
+        logger.warning(f"🚦 {key} 429: eşzamanlılık {self.current()}, {backoff:.1f} sn geri çekiliniyor")
+
+    def stats(self) -> Dict[str, Any]:
+        stat = self.stat
+        calls = stat["calls"]
+        return {
+            **{k: v for k, v in stat.items() if not k.endswith("_total")},
+            "limit": self.current(),
+            "initial_limit": self.initial,
+            "wait_ms_avg": round(stat["wait_ms_total"] / calls, 1) if calls else 0.0,
+            "wait_ms_max": round(stat["wait_ms_max"], 1),
+            "latency_ms_ema": round(self.latency_ema, 1) if self.latency_ema is not None else None,
+        }
+
+
+class ProviderLimiter:
+    """
+    Sağlayıcı başına tek eşzamanlılık kapısı (AdaptiveLimit), (sağlayıcı, model) başına token kovası (ModelBucket).
+    Kapılar event loop başına ayrı tutulur (asyncio.run kullanan scriptler için).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limits: Dict[str, AdaptiveLimit] = {}
+        self._buckets: Dict[str, ModelBucket] = {}
+
+    def _limit(self, provider: str) -> AdaptiveLimit:
+        with self._lock:
+            if provider not in self._limits:
+                self._limits[provider] = AdaptiveLimit(provider)
+            return self._limits[provider]
+
+    def _bucket(self, provider: str, model: Optional[str]) -> ModelBucket:
+        key = f"{provider}:{model}" if model else provider
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = ModelBucket(provider, model, burst=concurrency_for(provider))
+            return self._buckets[key]
+
+    @asynccontextmanager
+    async def slot(self, provider: str, model: Optional[str] = None):
+        limit = self._limit(provider)
+        bucket = self._bucket(provider, model)
+        stat = limit.stat
+        gate = limit.gate()
+        t0 = time.perf_counter()
+        stat["queue_depth"] += 1
+        stat["peak_queue_depth"] = max(stat["peak_queue_depth"], stat["queue_depth"])
+        try:
+            await gate.acquire(limit.current)
+            try:
+                # Kova beklemesi slot tutulurken yapılır: kota dolunca eşzamanlı açık istek de birikmez
+                rate_wait = bucket.reserve()
+                if rate_wait > 0:
+                    await asyncio.sleep(rate_wait)
+            except BaseException:
+                gate.release(limit.current)
+                raise
+        finally:
+            stat["queue_depth"] -= 1
+        waited = (time.perf_counter() - t0) * 1000
+        stat["wait_ms_total"] += waited
+        stat["wait_ms_max"] = max(stat["wait_ms_max"], waited)
+        bucket.stat["rate_wait_ms_total"] += rate_wait * 1000
+        if waited > 1000:
+            logger.warning(f"⏳ {bucket.key} sırası: {waited:.0f} ms beklendi (limit {limit.current()})")
+        stat["calls"] += 1
+        bucket.stat["calls"] += 1
+        stat["in_flight"] += 1
+        stat["peak_in_flight"] = max(stat["peak_in_flight"], stat["in_flight"])
+        started = time.perf_counter()
+        try:
+            yield limit
+        except BaseException as e:
+            stat["errors"] += 1
+            if isinstance(e, Exception) and is_rate_limited(e):
+                backoff = _retry_after(e, 0)
+                bucket.block(backoff)
+                limit.on_rate_limited(bucket.key, backoff)
+            raise
+        else:
+            latency_ms = (time.perf_counter() - started) * 1000
+            bucket.observe(latency_ms)
+            limit.on_success(latency_ms)
+        finally:
+            stat["in_flight"] -= 1
+            gate.release(limit.current)
+
+    async def call(self, provider: str, call: Callable[[], Awaitable[T]], model: Optional[str] = None) -> T:
+        """429 alırsa geri çekilip (Retry-After / üstel) tekrar sıraya girer; diğer hatalar olduğu gibi yükselir."""
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(provider, model):
+                    return await call()
+            except Exception as e:
+                if not is_rate_limited(e) or attempt >= LLM_RATE_LIMIT_RETRIES:
+                    raise
+                self._limit(provider).stat["retries"] += 1
+                await asyncio.sleep(_retry_after(e, attempt))
+                attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            limits = dict(self._limits)
+            buckets = list(self._buckets.items())
+        out = {provider: {**limit.stats(), "models": {}} for provider, limit in limits.items()}
+        for key, bucket in buckets:
+            provider, _, model = key.partition(":")
+            if provider in out:
+                out[provider]["models"][model or "-"] = bucket.stats()
+        return out
+
+
+provider_limiter = ProviderLimiter()
+
+
+def provider_slot(provider: str, model: Optional[str] = None):
+    """`async with provider_slot("gemini", "gemini-2.0-flash"):` kota ve eşzamanlılık sınırı içinde çalışır (tekrar denemesiz, akışlar için)."""
+    return provider_limiter.slot(provider, model)
+
+
+async def provider_call(provider: str, call: Callable[[], Awaitable[T]], model: Optional[str] = None) -> T:
+    """`await provider_call("gemini", lambda: client.aio.models.generate_content(...), model=...)`; 429'da sıraya geri döner."""
+    return await provider_limiter.call(provider, call, model)
@@ -5,7 +5,6 @@ import asyncio
 import logging
 import pathlib
 from contextlib import asynccontextmanager
-from io import BytesIO
 
 # --- 1. ÇEVRESEL DEĞİŞKENLERİ (ENV) EN BAŞTA YÜKLE ---
 from dotenv import load_dotenv
@@ -29,43 +28,180 @@ else:
     logger.error("❌ KRİTİK: .env dosyası hiçbir yerde bulunamadı!")
 
 # --- 2. IMPORTLAR (ENV YÜKLENDİKTEN SONRA) ---
-from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import uvicorn
-from supabase import create_client, Client
-import pdfplumber
-import pytesseract
-from PIL import Image
-from sentence_transformers import SentenceTransformer
-
-# --- 3. LANGGRAPH ORKESTRASYONU (HATA DETAYI EKLENDİ) ---
-try:
-    import graph
-    from graph import start_analysis, app as graph_app
+# Ağır kütüphaneler (sentence_transformers, pdfplumber, pytesseract, litellm, flashrank) burada import edilmez;
+# ilgili kaynak yüklenirken veya ilk kullanımda import edilir. Süreler /startup'ta raporlanır.
+import importlib
+from startup import startup_report, LazyResource, boot, MODEL_LOAD_MODE, READY_REQUIRES
+
+with startup_report.track("import fastapi"):
+    from fastapi import FastAPI, HTTPException, BackgroundTasks
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import StreamingResponse
+    from pydantic import BaseModel
+    from typing import List, Optional
+    import uvicorn
+with startup_report.track("import servis modülleri"):
+    from embedding_backends import load_embedding_model
+    from ingestion import (
+        IngestStats, INGEST_MODE, encode_batched, insert_paged, delete_source,
+        download_to_tempfile, should_stream, stream_ingest
+    )
+    from embedding import EmbeddingBatcher
+    from embedding_cache import EmbeddingCache, EMBED_CACHE_ENABLED
+    from extraction import extract_text, shutdown_pool
+    from jobs import JobLeases, QueueWakeup, PollBackoff
+    from chunking import get_chunker
+    from vector_format import STORE_FORMAT, storage_fields, match_request
+    from lexical import rrf_fuse
+    from citations import CitationTagger
+    from sse import SSE_HEADERS, stream_graph, stream_latency
+    from llm_limits import provider_limiter
+    from llm_cache import llm_cache
+    from web_cache import web_cache
+    from clients import client_registry, supabase_client
+
+# --- 3. LANGGRAPH ORKESTRASYONU (ARKA PLANDA / İLK KULLANIMDA YÜKLENİR) ---
+start_analysis = None
+graph_app = None
+
+def _load_graph():
+    """graph modülünü ve bağımlılıklarını yükler; her import ayrı ölçülür."""
+    global start_analysis, graph_app
+    try:
+        for module in ("litellm", "google.genai", "langgraph.graph"):
+            with startup_report.track(f"import {module}"):
+                importlib.import_module(module)
+        with startup_report.track("import graph"):
+            import graph
+    except Exception as e:
+        import traceback
+        logger.error("❌ GRAPH MODÜLÜ YÜKLENİRKEN HATA OLUŞTU!")
+        traceback.print_exc()
+        logger.warning(f"⚠️ Hata özeti: {e}")
+        logger.warning("AI motoru sınırlı modda (Sadece Dosya İşleme ve Embedding) çalışacak.")
+        raise
+    start_analysis = graph.start_analysis
+    graph_app = graph.app
+    # RAG sorgusu documents'a yazılan modelle (ve saklama biçimiyle) aynı uzayda vektörlenir
+    # /embed ile aynı micro-batcher: eşzamanlı analizlerin soru vektörleri tek encode çağrısında birleşir
+    graph.rag_layer.embed_fn = embed_batcher.embed
+    # Yerel ANN indeksi hazırsa match_documents RPC'si yerine süreç içinde aranır
+    graph.rag_layer.ann_search = ann_search
+    # "TCK 86" gibi doğrudan madde atıfları indeksten çözülür (niyet/embedding/rerank atlanır)
+    graph.rag_layer.citation_lookup = citation_lookup
     logger.info("✅ Graph modülü başarıyla yüklendi.")
-except Exception as e:
-    import traceback
-    start_analysis = None
-    graph_app = None
-    logger.error("❌ GRAPH MODÜLÜ YÜKLENİRKEN HATA OLUŞTU!")
-    traceback.print_exc()
-    logger.warning(f"⚠️ Hata özeti: {e}")
-    logger.warning("AI motoru sınırlı modda (Sadece Dosya İşleme ve Embedding) çalışacak.")
+
+    # Reranker modeli de ilk soruyu beklemeden ısıtılır (başarısızsa RAG reranking'siz çalışır)
+    try:
+        with startup_report.track("model flashrank"):
+            graph.rag_layer._get_ranker()
+    except Exception:
+        pass
+    return graph
+
+graph_resource = LazyResource("graph", _load_graph)
+
+def _load_ann_index():
+    """documents aynası olan süreç içi ANN indeksini açar ve artımlı senkronu başlatır (ANN_INDEX_ENABLED=1)."""
+    import ann_index
+    if not ann_index.ANN_INDEX_ENABLED:
+        return None
+    index = ann_index.AnnIndex().open()
+    if supabase:
+        index.start_sync(supabase)
+    return index
+
+ann_resource = LazyResource("ann_index", _load_ann_index)
+
+# Prefork ana süreci (serve.py) BM25 indeksini fork'tan önce yükler; senkron thread'i HTTP çocuklarında başlar
+LEXICAL_SYNC_IN_CHILD = False
+
+def _load_lexical_index():
+    """BM25 indeksini snapshot'tan açar ve documents'tan artımlı senkronu başlatır."""
+    import lexical
+    # Kuyruk süreci /search sunmaz
+    if not lexical.LEXICAL_INDEX_ENABLED or SERVICE_ROLE == "worker":
+        return None
+    index = lexical.Bm25Index().load()
+    if supabase and not LEXICAL_SYNC_IN_CHILD:
+        index.start_sync(supabase)
+    return index
+
+lexical_resource = LazyResource("lexical_index", _load_lexical_index)
+
+def _load_citation_index():
+    """Kanun/madde atıf indeksini snapshot'tan açar ve documents'tan artımlı senkronu başlatır."""
+    import citations
+    if not citations.CITATION_INDEX_ENABLED:
+        return None
+    index = citations.CitationIndex().load()
+    if supabase:
+        index.start_sync(supabase)
+    return index
+
+citation_resource = LazyResource("citation_index", _load_citation_index)
+
+def on_documents_inserted(rows: list):
+    """process_file_queue yeni chunk yazdığında yerel indeksleri senkronu beklemeden günceller."""
+    for index in (lexical_resource.value, citation_resource.value):
+        if index:
+            index.add(rows)
+
+def on_documents_removed(doc_ids: list):
+    """Tekrar işlenen dosyanın eski chunk'ları silinince yerel indekslerden de çıkarılır."""
+    for index in (ann_resource.value, lexical_resource.value, citation_resource.value):
+        if index:
+            index.remove(doc_ids)
+
+def citation_lookup(query: str) -> list:
+    """Sorgudaki madde atıflarının chunk'ları; indeks hazır değilse veya atıf çözülemezse boş liste."""
+    index = citation_resource.get(wait=False)
+    if not index:
+        return []
+    return index.lookup(query)
+
+def ann_search(vector, k: int, threshold: float):
+    """Yerel indeks hazır değilse None döner (çağıran RPC'ye düşer)."""
+    index = ann_resource.get(wait=False)
+    if not index or not index.ready:
+        return None
+    return index.search(vector, k, threshold)
 
 # --- 4. KONFIGÜRASYON KONTROLÜ ---
 SUPABASE_URL = os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY") or os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+# Katmanlarla aynı sıra (clients.ClientRegistry.supabase): aynı paylaşılan istemci kullanılır
+SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_KEY")
 
 supabase = None
+# Kuyruk işleri kiralama ile sahiplenilir (birden fazla süreç/node güvenle çalışabilir)
+job_leases = None
+
+def _connect_db():
+    """
+    Paylaşılan, havuzlu Supabase istemcisini ve kiralama yöneticisini bağlar.
+    Prefork sunumda (serve.py) fork sonrası her çocukta tekrar çağrılır: istemci kayıt defteri çocukta
+    sıfırlanır, böylece katmanlar ve kuyruk aynı (çocuğa ait) istemciyi ve worker kimliğini kullanır.
+    """
+    global supabase, job_leases
+    supabase = supabase_client(SUPABASE_URL, SUPABASE_KEY)
+    job_leases = JobLeases(supabase) if supabase else None
+
 if not SUPABASE_URL or not SUPABASE_KEY:
     logger.error("❌ Hata: SUPABASE_URL veya SUPABASE_KEY eksik. Lütfen .env dosyasını kontrol edin.")
 else:
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+    _connect_db()
+    if supabase:
         logger.info("✅ Supabase bağlantısı başarılı.")
-    except Exception as e:
-        logger.error(f"❌ Supabase Bağlantı Hatası: {e}")
+    if hasattr(os, "register_at_fork"):
+        # clients modülünün hook'undan (kayıt defterini sıfırlar) sonra çalışır
+        os.register_at_fork(after_in_child=_connect_db)
+
+QUEUE_WORKER_THREADS = int(os.getenv("QUEUE_WORKER_THREADS", "1"))
+# Sürecin görevi: all (HTTP + kuyruk, eski davranış) | api (sadece HTTP) | worker (sadece kuyruk)
+# Çok süreçli sunumda (serve.py) kuyruk worker'ları her HTTP sürecinde değil, ayrı bir süreçte çalışır.
+SERVICE_ROLE = os.getenv("SERVICE_ROLE", "all").lower()
+# Boştaki worker'lar sabit 2 sn uyumak yerine NOTIFY ile uyanır
+queue_wakeup = QueueWakeup()
 
 # -----------------------------------------------------------------------------
 # 5. DOSYA İŞLEME VE EMBEDDING (GÜVENLİ YÜKLEME MEKANİZMASI EKLENDİ)
@@ -77,112 +213,185 @@ if not os.getenv("HF_TOKEN"):
 
 PRIMARY_MODEL = 'BAAI/bge-m3'
 FALLBACK_MODEL = 'sentence-transformers/all-MiniLM-L6-v2' # Hafif model yedeği
+EMBED_BATCH_MAX_TEXTS = int(os.getenv("EMBED_BATCH_MAX_TEXTS", "256"))
+# /search: her kaynaktan (BM25, vektör) alınan aday sayısı ve RRF sabiti
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "50"))
+SEARCH_RRF_K = int(os.getenv("SEARCH_RRF_K", "60"))
 
 embed_model = None
+embed_model_name = None
+embed_backend = None
+embed_cache = None
+# Madde/paragraf/cümle sınırlarını gözeten, model token'ı ile ölçen parçalayıcı (CHUNKER=char eski davranış)
+chunker = None
 
-logger.info(f"📥 Yerel AI Modeli Yükleniyor...")
-try:
-    # Önce güçlü modeli dene
-    logger.info(f"⏳ Birincil model deneniyor: {PRIMARY_MODEL}")
-    embed_model = SentenceTransformer(PRIMARY_MODEL, device='cpu')
-    logger.info(f"✅ {PRIMARY_MODEL} başarıyla yüklendi!")
-except Exception as e:
-    logger.warning(f"⚠️ Birincil model yüklenemedi ({e}). Fallback modele geçiliyor...")
+def _load_embedding_model():
+    """Embedding modelini (birincil, olmazsa yedek), önbelleği ve chunker'ı hazırlar."""
+    global embed_model, embed_model_name, embed_backend, embed_cache, chunker
+
+    with startup_report.track("import sentence_transformers"):
+        import sentence_transformers  # noqa: F401
+
+    logger.info(f"📥 Yerel AI Modeli Yükleniyor...")
     try:
-        # Hata verirse hafif modeli dene
-        embed_model = SentenceTransformer(FALLBACK_MODEL, device='cpu')
-        logger.info(f"✅ Yedek model {FALLBACK_MODEL} başarıyla yüklendi.")
-    except Exception as e2:
-        logger.error(f"❌ Hiçbir embedding modeli yüklenemedi: {e2}")
+        # Önce güçlü modeli dene
+        logger.info(f"⏳ Birincil model deneniyor: {PRIMARY_MODEL}")
+        with startup_report.track(f"model {PRIMARY_MODEL}"):
+            model, backend = load_embedding_model(PRIMARY_MODEL)
+        name = PRIMARY_MODEL
+        logger.info(f"✅ {PRIMARY_MODEL} başarıyla yüklendi! (backend: {backend})")
+    except Exception as e:
+        logger.warning(f"⚠️ Birincil model yüklenemedi ({e}). Fallback modele geçiliyor...")
+        try:
+            # Hata verirse hafif modeli dene
+            with startup_report.track(f"model {FALLBACK_MODEL}"):
+                model, backend = load_embedding_model(FALLBACK_MODEL)
+            name = FALLBACK_MODEL
+            logger.info(f"✅ Yedek model {FALLBACK_MODEL} başarıyla yüklendi. (backend: {backend})")
+        except Exception as e2:
+            logger.error(f"❌ Hiçbir embedding modeli yüklenemedi: {e2}")
+            raise
+
+    # Aynı metin (kanun başlıkları, standart sözleşme maddeleri, tekrar eden sorular) bir kez vektörlenir
+    # int8/ONNX vektörleri fp32'den biraz farklıdır; önbellek anahtarı backend'i de içerir
+    cache_model_key = name if backend == "torch" else f"{name}#{backend}"
+    embed_cache = EmbeddingCache(cache_model_key) if EMBED_CACHE_ENABLED else None
+    chunker = get_chunker(model)
+    embed_model_name, embed_backend = name, backend
+    embed_model = model
+    return model
+
+embedding_resource = LazyResource("embedding_model", _load_embedding_model)
+
+def _require_embedding_model():
+    """Model yükleniyorsa bekler; yüklenemediyse hata verir. (Event loop dışında çağrılmalı)"""
+    model = embedding_resource.get()
+    if model is None:
+        raise RuntimeError(f"Embedding modeli yüklenemedi: {embedding_resource.error}")
+    return model
 
 def get_local_embedding(text: str):
     """Metni vektöre çevirir."""
     try:
-        if not embed_model: return []
-        embedding = embed_model.encode(text, normalize_embeddings=True)
-        return embedding.tolist()
+        return encode_texts([text])[0] or []
     except Exception as e:
         logger.error(f"Embedding Hatası: {e}")
         return []
 
-def chunk_text(text: str, chunk_size: int = 800, overlap: int = 100):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        if chunk: chunks.append(chunk)
-        start = end - overlap
-    return chunks
-
-def process_file_queue():
-    """Kullanıcının yüklediği dosyaları işler. (PDF + OCR Resim Desteği)"""
-    # Eğer model yüklenmediyse işlem yapma
-    if not supabase or not embed_model: return False
-
+def _encode_uncached(texts: list) -> list:
+    embeddings = _require_embedding_model().encode(
+        texts, batch_size=len(texts), normalize_embeddings=True, show_progress_bar=False
+    )
+    return [e.tolist() for e in embeddings]
+
+def encode_texts(texts: list) -> list:
+    """Metin listesini tek encode çağrısında vektörlere çevirir. (Micro-batcher tarafından kullanılır)"""
+    _require_embedding_model()
+    if embed_cache:
+        return embed_cache.get_or_compute(texts, _encode_uncached)
+    return _encode_uncached(texts)
+
+# /embed ve /embed/batch istekleri event loop'u bloklamadan bu batcher üzerinden geçer
+embed_batcher = EmbeddingBatcher(encode_texts)
+
+def ingest_in_memory(file_bytes: bytes, ftype: str, metadata: dict, stats: IngestStats):
+    """Küçük dosyalar için: metnin tamamını çıkarır, batch halinde vektörler ve sayfa sayfa kaydeder."""
+    # --- DOSYA OKUMA (PDF'ler büyükse sayfa-paralel okunur) ---
+    extracted = extract_text(file_bytes, ftype)
+    text = extracted.text
+    stats.pages = extracted.pages
+    logger.info(extracted.timing_summary())
+
+    if len(text.strip()) < 10: 
+        raise ValueError(f"Dosyadan anlamlı metin çıkarılamadı.")
+
+    chunks = chunker.chunk(text)
+    vectors = encode_batched(embed_model, chunks, cache=embed_cache)
+    # Madde başlıkları / atıflar chunk sırasıyla etiketlenir (kanun bağlamı önceki chunk'lardan gelir)
+    tagger = CitationTagger(metadata.get('source') or '')
+    metas = [tagger.metadata_for(chunk, metadata) for chunk in chunks]
+    docs = [
+        {'content': chunk, 'metadata': meta, **storage_fields(vec)}
+        for chunk, meta, vec in zip(chunks, metas, vectors) if vec
+    ]
+    stats.chunks = len(docs)
+
+    if docs: stats.inserted = insert_paged(supabase, 'documents', docs, on_inserted=on_documents_inserted)
+
+def process_file_job(job: dict) -> bool:
+    """Sahiplenilmiş tek bir dosya işini çalıştırır. (PDF + OCR Resim Desteği)"""
     try:
-        res = supabase.table('file_processing_queue').select("*").eq('status', 'pending').limit(1).execute()
-        if not res.data: return False
-
-        job = res.data[0]
         logger.info(f"📂 Dosya İşleniyor: {job['file_path']}")
+        stats = IngestStats(file_path=job['file_path'])
         
-        supabase.table('file_processing_queue').update({'status': 'processing'}).eq('id', job['id']).execute()
-        
-        # Dosyayı İndir
-        file_bytes = supabase.storage.from_('raw_uploads').download(job['file_path'])
-        
-        text = ""
-        ftype = job.get('file_type', '').lower()
+        ftype = (job.get('file_type') or '').lower()
         if not ftype:
             ftype = str(job['file_path']).split('.')[-1].lower()
-        
-        # --- DOSYA OKUMA MANTIĞI (ORİJİNAL KOD KORUNDU) ---
-        if 'pdf' in ftype:
-            try:
-                with pdfplumber.open(BytesIO(file_bytes)) as pdf:
-                    for page in pdf.pages:
-                        text += (page.extract_text() or "") + "\n"
-            except Exception as pdf_err:
-                logger.error(f"PDF Okuma Hatası: {pdf_err}")
-                
-        elif ftype in ['jpg', 'jpeg', 'png', 'bmp', 'tiff']:
-            try:
-                image = Image.open(BytesIO(file_bytes))
-                text = pytesseract.image_to_string(image) 
-            except Exception:
-                logger.warning("OCR Hatası veya Tesseract yüklü değil.")
-                text = ""
+        metadata = {'source': job['file_path'], 'user_id': job['user_id']}
+        # Önceki denemeden (yarıda kalan sayfalı insert, reaper requeue) kalan chunk'lar tekrar yazılmasın
+        delete_source(supabase, job['file_path'], on_removed=on_documents_removed)
+
+        if INGEST_MODE == "memory":
+            # Eski davranış: dosyanın tamamı bellekte
+            file_bytes = supabase.storage.from_('raw_uploads').download(job['file_path'])
+            ingest_in_memory(file_bytes, ftype, metadata, stats)
         else:
-            text = file_bytes.decode('utf-8', errors='ignore')
-
-        if len(text.strip()) < 10: 
-            raise ValueError(f"Dosyadan anlamlı metin çıkarılamadı.")
-
-        # Parçala ve Kaydet
-        chunks = chunk_text(text)
-        docs = []
-        for chunk in chunks:
-            vec = get_local_embedding(chunk)
-            if vec:
-                docs.append({
-                    'content': chunk,
-                    'metadata': {'source': job['file_path'], 'user_id': job['user_id']},
-                    'embedding': vec
-                })
+            # Dosyayı diske akışlı indir; büyükse akış modunda sınırlı bellekle işle
+            with download_to_tempfile(supabase, 'raw_uploads', job['file_path']) as tmp:
+                size = os.path.getsize(tmp.name)
+                if should_stream(size):
+                    logger.info(f"🌊 Akış modu: {job['file_path']} ({size / (1024 * 1024):.1f} MB)")
+                    stream_ingest(
+                        supabase, embed_model, tmp.name, ftype, metadata, stats,
+                        chunker=chunker, cache=embed_cache, on_inserted=on_documents_inserted,
+                        tagger=CitationTagger(job['file_path'])
+                    )
+                else:
+                    ingest_in_memory(tmp.read(), ftype, metadata, stats)
+
+        stats.finish()
+        logger.info(stats.summary())
         
-        if docs: supabase.table('documents').insert(docs).execute()
-        
-        supabase.table('file_processing_queue').update({'status': 'completed'}).eq('id', job['id']).execute()
+        supabase.table('file_processing_queue').update(
+            {'status': 'completed', 'locked_by': None, 'lease_expires_at': None}
+        ).eq('id', job['id']).execute()
         logger.info(f"✅ Dosya Tamamlandı: {job['file_path']}")
         return True
 
     except Exception as e:
         logger.error(f"❌ Dosya İşleme Hatası: {e}")
-        if 'job' in locals() and supabase:
-            supabase.table('file_processing_queue').update({'status': 'failed', 'error_message': str(e)}).eq('id', job['id']).execute()
+        # Yarıda kalan ingest'in yazdığı sayfalar aramalarda görünmesin
+        try:
+            delete_source(supabase, job['file_path'], on_removed=on_documents_removed)
+        except Exception as cleanup_error:
+            logger.error(f"❌ Yarım Chunk Temizleme Hatası: {cleanup_error}")
+        supabase.table('file_processing_queue').update(
+            {'status': 'failed', 'error_message': str(e), 'locked_by': None, 'lease_expires_at': None}
+        ).eq('id', job['id']).execute()
         return False
 
+def process_file_queue():
+    """Bekleyen dosya işlerini atomik olarak sahiplenip işler."""
+    # Model yüklenemediyse iş sahiplenme (yükleniyorsa sahiplenip hazır olmasını bekler)
+    if not supabase or not job_leases or embedding_resource.failed: return False
+
+    try:
+        jobs = job_leases.claim_files()
+    except Exception as e:
+        logger.error(f"❌ Dosya Kuyruğu Claim Hatası: {e}")
+        return False
+
+    if jobs and embedding_resource.get() is None:
+        for job in jobs:
+            supabase.table('file_processing_queue').update(
+                {'status': 'pending', 'locked_by': None, 'lease_expires_at': None}
+            ).eq('id', job['id']).execute()
+        return False
+
+    for job in jobs:
+        process_file_job(job)
+    return bool(jobs)
+
 # -----------------------------------------------------------------------------
 # 6. ASYNC HELPER & QUESTION WORKER
 # -----------------------------------------------------------------------------
@@ -201,33 +410,59 @@ def run_async(coro):
         return loop.run_until_complete(coro)
 
 def process_question_queue():
-    """Sıradaki soruyu alır ve LangGraph Orkestratörü üzerinden geçirir."""
-    if not supabase: return False
+    """Sıradaki soruları sahiplenir ve LangGraph Orkestratörü üzerinden geçirir."""
+    if not supabase or not job_leases: return False
+    # Graph hazır değilse (lazy modda yüklemeyi başlatır) bu turu atla
+    if not graph_resource.get(wait=False):
+        return False
 
     try:
-        res = supabase.table('questions').select("*").eq('status', 'analyzing').limit(1).execute()
-        if not res.data: return False
-
-        question = res.data[0]
-        logger.info(f"⚖️ Soru Tespit Edildi: {question['id']}")
-
-        if start_analysis:
-            run_async(start_analysis(question['id']))
-            return True
-        else:
-            logger.warning("Graph modülü yüklü değil, soru işlenemiyor.")
-            return False
-
+        questions = job_leases.claim_questions()
     except Exception as e:
         logger.error(f"❌ Soru Worker Hatası: {e}")
         return False
 
+    for question in questions:
+        logger.info(f"⚖️ Soru Tespit Edildi: {question['id']}")
+        try:
+            run_async(start_analysis(question['id']))
+        except Exception as e:
+            logger.error(f"❌ Soru Worker Hatası: {e}")
+        finally:
+            job_leases.release_question(question['id'])
+    return bool(questions)
+
+async def analyze_with_lease(question_id: str):
+    """/analyze arka plan görevi: soru başka bir worker'da işleniyorsa tekrar analiz etmez."""
+    # Graph henüz yükleniyorsa hazır olmasını bekle
+    await asyncio.to_thread(graph_resource.get)
+    if not start_analysis:
+        logger.error(f"❌ AI Engine hazır değil, soru analiz edilemedi: {question_id}")
+        return
+    if job_leases:
+        # SERVICE_ROLE=api'de kuyruk worker'ları (ve heartbeat'leri) başlamaz; kira burada da yenilenmeli
+        job_leases.start_background(reaper=False)
+        try:
+            claimed = await asyncio.to_thread(job_leases.claim_question, question_id)
+        except Exception as e:
+            logger.error(f"❌ Soru Claim Hatası: {e}")
+            return
+        if not claimed:
+            logger.info(f"⏭️ Soru alınamadı (başka worker'da, analiz beklemiyor veya deneme hakkı bitti): {question_id}")
+            return
+    try:
+        await start_analysis(question_id)
+    finally:
+        if job_leases:
+            await asyncio.to_thread(job_leases.release_question, question_id)
+
 # -----------------------------------------------------------------------------
 # 7. ANA DÖNGÜ VE API
 # -----------------------------------------------------------------------------
 
 def run_worker_loop():
-    logger.info("👷 Worker Thread Başladı...")
+    logger.info(f"👷 Worker Thread Başladı... ({threading.current_thread().name})")
+    backoff = PollBackoff()
     while True:
         try:
             if not supabase:
@@ -235,18 +470,66 @@ def run_worker_loop():
                 continue
             did_file = process_file_queue()
             did_question = process_question_queue()
-            if not did_file and not did_question:
-                time.sleep(2)
+            if did_file or did_question:
+                backoff.reset()
+                continue
+            # Boşta: NOTIFY gelene kadar veya adaptif polling süresi dolana kadar bekle
+            if queue_wakeup.wait(backoff.next(queue_wakeup.poll_ceiling())):
+                backoff.reset()
         except Exception as e:
             logger.error(f"Worker Loop Error: {e}")
             time.sleep(5)
 
+_queue_started = False
+
+def start_queue_workers():
+    """Kiralama arka plan thread'lerini, NOTIFY dinleyicisini ve kuyruk worker'larını başlatır."""
+    global _queue_started
+    if _queue_started:
+        return
+    _queue_started = True
+    if job_leases:
+        job_leases.start_background()
+    queue_wakeup.start()
+    for i in range(QUEUE_WORKER_THREADS):
+        worker_thread = threading.Thread(target=run_worker_loop, daemon=True, name=f"queue-worker-{i}")
+        worker_thread.start()
+
+def stop_queue_workers():
+    # Heartbeat /analyze tarafından da başlatılmış olabilir
+    if job_leases:
+        job_leases.stop()
+    if not _queue_started:
+        return
+    queue_wakeup.stop()
+
+def run_queue_service(stop_event: threading.Event = None):
+    """HTTP olmadan sadece kuyruk worker'larını çalıştırır (SERVICE_ROLE=worker). stop_event set edilene kadar bloklar."""
+    stop_event = stop_event or threading.Event()
+    boot([embedding_resource, graph_resource, ann_resource, lexical_resource, citation_resource])
+    start_queue_workers()
+    logger.info("🚀 BABYZLEXIT KUYRUK SERVİSİ HAZIR!")
+    try:
+        while not stop_event.wait(1.0):
+            pass
+    finally:
+        stop_queue_workers()
+        shutdown_pool()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    worker_thread = threading.Thread(target=run_worker_loop, daemon=True)
-    worker_thread.start()
-    logger.info("🚀 BABYZLEXIT AI ENGINE HAZIR!")
+    # Port hemen açılır; modeller MODEL_LOAD_MODE'a göre arka planda / ilk kullanımda yüklenir
+    await asyncio.to_thread(boot, [embedding_resource, graph_resource, ann_resource, lexical_resource, citation_resource])
+    if SERVICE_ROLE in ("all", "worker"):
+        start_queue_workers()
+    logger.info(f"🚀 BABYZLEXIT AI ENGINE HAZIR! (rol: {SERVICE_ROLE})")
     yield
+    for index in (ann_resource.value, lexical_resource.value, citation_resource.value):
+        if index:
+            index.stop()
+    stop_queue_workers()
+    await embed_batcher.close()
+    shutdown_pool()
 
 app = FastAPI(title="BabyLexit AI Service", lifespan=lifespan)
 
@@ -264,46 +547,203 @@ class AnalysisRequest(BaseModel):
 
 class EmbedRequest(BaseModel):
     text: str
+    # "documents": vektör documents tablosunun saklama biçiminde döner (float16 / kırpılmış)
+    target: Optional[str] = None
+
+class EmbedBatchRequest(BaseModel):
+    texts: List[str]
+    target: Optional[str] = None
 
 class ChatRequest(BaseModel):
     query: str
 
+class SearchRequest(BaseModel):
+    query: str
+    limit: int = 10
+
 # --- ENDPOINTLER ---
 
+def _resources():
+    return {"embedding_model": embedding_resource, "graph": graph_resource, "ann_index": ann_resource,
+            "lexical_index": lexical_resource, "citation_index": citation_resource}
+
+def _semantic_cache_stats():
+    graph = graph_resource.value
+    if not graph:
+        return None
+    local = graph.router_layer.local_cache
+    return {**graph.cache_metrics.stats(), "local": local.stats() if local else None}
+
 @app.get("/")
 def read_root():
+    """Liveness: süreç ayakta mı? Modellerin yüklenmesini beklemez."""
     return {
         "status": "active", 
+        "pid": os.getpid(),
+        "role": SERVICE_ROLE,
         "graph": bool(graph_app), 
+        "resources": {name: r.status() for name, r in _resources().items()},
         "db": bool(supabase),
-        "embedding_model": str(embed_model)
+        "embedding_model": str(embed_model),
+        "embedding_backend": embed_backend,
+        "embedding_store_format": STORE_FORMAT.label,
+        "embed_batcher": embed_batcher.stats(),
+        "queue_wakeup": queue_wakeup.stats(),
+        "embed_cache": embed_cache.stats() if embed_cache else None,
+        "ann_index": ann_resource.value.stats() if ann_resource.value else None,
+        "lexical_index": lexical_resource.value.stats() if lexical_resource.value else None,
+        "citation_index": citation_resource.value.stats() if citation_resource.value else None,
+        "chat_stream": stream_latency.stats(),
+        "guard_speculation": graph_resource.value.speculation_stats if graph_resource.value else None,
+        "query_understanding": graph_resource.value.understanding_layer.stats() if graph_resource.value else None,
+        "query_embedding": graph_resource.value.embedding_stats.stats() if graph_resource.value else None,
+        "semantic_cache": _semantic_cache_stats(),
+        "llm_providers": provider_limiter.stats(),
+        "llm_cache": llm_cache.stats() if llm_cache else None,
+        "web_cache": web_cache.stats() if web_cache else None,
+        "clients": client_registry.stats()
     }
 
+@app.get("/ready")
+def readiness():
+    """Readiness: READY_REQUIRES'taki kaynaklar yüklendiyse 200, değilse 503."""
+    resources = _resources()
+    status = {name: r.status() for name, r in resources.items()}
+    errors = {name: r.error for name, r in resources.items() if r.error}
+    ready = all(resources[name].ready for name in READY_REQUIRES if name in resources)
+    body = {"ready": ready, "mode": MODEL_LOAD_MODE, "resources": status, "errors": errors}
+    if not ready:
+        raise HTTPException(status_code=503, detail=body)
+    return body
+
+@app.get("/startup")
+def startup_timings():
+    """Açılış süre dökümü (import ve model yüklemeleri ayrı ayrı)."""
+    return startup_report.as_dict()
+
+async def _require_graph():
+    """Graph'ı event loop'u bloklamadan bekler."""
+    await asyncio.to_thread(graph_resource.get)
+    if not graph_app:
+        raise HTTPException(status_code=503, detail="AI Engine not ready")
+
 @app.post("/analyze")
 async def trigger_analysis(request: AnalysisRequest, background_tasks: BackgroundTasks):
     """Soruyu LangGraph ile analiz et (DB tabanlı)."""
     if not request.question_id:
         raise HTTPException(status_code=400, detail="Question ID required")
     
-    if start_analysis:
-        background_tasks.add_task(start_analysis, request.question_id)
+    if not graph_resource.failed:
+        graph_resource.start()
+        background_tasks.add_task(analyze_with_lease, request.question_id)
         return {"status": "accepted", "message": "Analysis started"}
     return {"status": "error", "message": "AI Engine not ready"}
 
 @app.post("/embed")
 async def embed_endpoint(req: EmbedRequest):
     """(YENİ) Metni vektöre çevir. Next.js tarafından RAG araması için kullanılır."""
-    if not embed_model:
+    if embedding_resource.failed:
         raise HTTPException(status_code=503, detail="Embedding model not loaded")
     
-    vector = get_local_embedding(req.text)
+    try:
+        vector = await embed_batcher.embed(req.text)
+    except Exception as e:
+        logger.error(f"Embedding Hatası: {e}")
+        vector = []
+    if req.target == "documents":
+        # Çağıran match_rpc'yi kullanmalı; sorgu vektörü saklanan vektörlerle aynı uzayda
+        return {"embedding": STORE_FORMAT.apply(vector), "match_rpc": STORE_FORMAT.rpc, "format": STORE_FORMAT.label}
     return {"embedding": vector}
 
+@app.post("/embed/batch")
+async def embed_batch_endpoint(req: EmbedBatchRequest):
+    """Metin listesini vektörlere çevir. Sıra korunur."""
+    if embedding_resource.failed:
+        raise HTTPException(status_code=503, detail="Embedding model not loaded")
+    if len(req.texts) > EMBED_BATCH_MAX_TEXTS:
+        raise HTTPException(status_code=400, detail=f"En fazla {EMBED_BATCH_MAX_TEXTS} metin gönderilebilir")
+
+    try:
+        vectors = await embed_batcher.embed_many(req.texts)
+    except Exception as e:
+        logger.error(f"Batch Embedding Hatası: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if req.target == "documents":
+        return {
+            "embeddings": [STORE_FORMAT.apply(v) for v in vectors],
+            "match_rpc": STORE_FORMAT.rpc, "format": STORE_FORMAT.label
+        }
+    return {"embeddings": vectors}
+
+async def _dense_search(query: str, k: int) -> list:
+    """Vektör araması: yerel ANN indeksi, yoksa match_documents RPC."""
+    if embedding_resource.failed:
+        return []
+    vector = await embed_batcher.embed(query)
+    if not vector:
+        return []
+    docs = await asyncio.to_thread(ann_search, vector, k, 0.0)
+    if docs is None and supabase:
+        rpc, params = match_request(vector, 0.0, k)
+        res = await asyncio.to_thread(lambda: supabase.rpc(rpc, params).execute())
+        docs = res.data
+    return docs or []
+
+async def _citation_search(query: str, k: int) -> list:
+    index = await asyncio.to_thread(citation_resource.get)
+    if not index:
+        return []
+    return index.lookup(query, k)
+
+async def _lexical_search(query: str, k: int) -> list:
+    index = await asyncio.to_thread(lexical_resource.get)
+    if not index:
+        return []
+    return await asyncio.to_thread(index.search, query, k)
+
+@app.post("/search")
+async def search_endpoint(req: SearchRequest):
+    """
+    Hibrit arama: Türkçe normalize BM25 + vektör araması, Reciprocal Rank Fusion ile birleştirilir.
+    Sorgu "TCK 86" gibi bir madde atfı içeriyorsa madde metni chunk'ları ayrı bir sıralama olarak eklenir.
+    """
+    if not req.query.strip():
+        raise HTTPException(status_code=400, detail="Query required")
+    t0 = time.perf_counter()
+    citation_hits, lexical_hits, dense_hits = await asyncio.gather(
+        _citation_search(req.query, SEARCH_CANDIDATES),
+        _lexical_search(req.query, SEARCH_CANDIDATES),
+        _dense_search(req.query, SEARCH_CANDIDATES),
+        return_exceptions=True
+    )
+    rankings = {}
+    for name, hits in (("citation", citation_hits), ("bm25", lexical_hits), ("dense", dense_hits)):
+        if isinstance(hits, Exception):
+            logger.error(f"❌ Arama Hatası ({name}): {hits}")
+            hits = []
+        rankings[name] = hits
+
+    # BM25 ayağı yoksa (LEXICAL_INDEX_ENABLED=0, yükleniyor, hata) sonuç sadece vektör sıralamasıdır: çağırana bildirilir
+    if lexical_resource.value:
+        lexical_status = "ready"
+    else:
+        lexical_status = "failed" if lexical_resource.failed else "disabled"
+
+    results = rrf_fuse(rankings, k=SEARCH_RRF_K, limit=max(1, min(req.limit, SEARCH_CANDIDATES)))
+    for r in results:
+        source = str(r["metadata"].get("source") or "")
+        r["title"] = os.path.basename(source) or "Belge"
+    return {
+        "results": results,
+        "counts": {name: len(hits) for name, hits in rankings.items()},
+        "lexical": lexical_status,
+        "took_ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+
 @app.post("/api/chat")
 async def chat_endpoint(req: ChatRequest):
     """(OPSİYONEL) Direkt Chat endpoint'i."""
-    if not graph_app:
-        raise HTTPException(status_code=503, detail="AI Engine not ready")
+    await _require_graph()
     
     try:
         inputs = {
@@ -320,5 +760,33 @@ async def chat_endpoint(req: ChatRequest):
         logger.error(f"API Chat Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest):
+    """
+    /api/chat'in SSE sürümü: node ilerleme olayları (node), rapor parçaları (token) ve
+    son olarak tam rapor + zamanlama (done). İlk bayt süresi toplam süreden ayrı ölçülür.
+    """
+    await _require_graph()
+    if not req.query.strip():
+        raise HTTPException(status_code=400, detail="Query required")
+
+    import graph
+    inputs = {
+        "question_id": "api-request",
+        "query": req.query,
+        "safety_status": "unknown",
+        "route": "internal",
+        "final_report": "",
+        "status": "processing"
+    }
+    return StreamingResponse(
+        stream_graph(graph_app, inputs, graph.AUTHOR_TOKEN_EVENT),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if SERVICE_ROLE == "worker":
+        run_queue_service()
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, Dict, List
+
+# İstek kapsamlı soru vektörü.
+# Router (soru cache'i) ve RAG (documents araması) aynı soruyu ayrı ayrı vektörlüyordu. Bir analiz boyunca
+# tek bir QueryEmbedding AgentState'te taşınır: ilk isteyen hesaplar, sonrakiler aynı sonucu (veya süren
+# hesaplamayı) bekler. Sayaçlar analiz başına kaç embedding yapıldığını doğrular (beklenen: tam 1).
+
+logger = logging.getLogger("BabyLexitEmbedding")
+
+
+class EmbeddingStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.analyses = 0
+        self.computed = 0
+        self.reused = 0
+        self.per_analysis: Dict[str, int] = {"0": 0, "1": 0, ">1": 0}
+
+    def record(self, embedding: "QueryEmbedding"):
+        """Analiz sonunda (db_writer) çağrılır."""
+        with self._lock:
+            self.analyses += 1
+            self.computed += embedding.computed
+            self.reused += embedding.reused
+            bucket = str(embedding.computed) if embedding.computed <= 1 else ">1"
+            self.per_analysis[bucket] += 1
+        if embedding.computed > 1:
+            logger.warning(f"⚠️ Bir analizde {embedding.computed} embedding hesaplandı (beklenen 1)")
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "analyses": self.analyses, "computed": self.computed, "reused": self.reused,
+                "per_analysis": dict(self.per_analysis),
+            }
+
+
+embedding_stats = EmbeddingStats()
+
+
+class QueryEmbedding:
+    """Tek bir analizin soru vektörü. get() eşzamanlı çağrılsa da embed_fn en fazla bir kez çalışır."""
+
+    def __init__(self, text: str, embed_fn: Callable[[str], Awaitable[List[float]]]):
+        self.text = text
+        self.embed_fn = embed_fn
+        self._task = None
+        self.computed = 0
+        self.reused = 0
+
+    async def get(self) -> List[float]:
+        if self._task is None:
+            self.computed += 1
+            self._task = asyncio.ensure_future(self.embed_fn(self.text))
+        else:
+            self.reused += 1
+        try:
+            # Bekleyenlerden biri iptal edilirse (spekülatif dal) hesaplama diğerleri için sürer
+            return await asyncio.shield(self._task) or []
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Soru Embedding Hatası: {e}")
+            return []
@@ -0,0 +1,154 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Süreç içi anlamsal cevap cache'i (router'ın match_similar_questions RPC'sinin önündeki yerel katman).
+# Küçük bir vektör kümesi: kosinüs benzerliği eşiği geçen en yakın soru bulunursa cevabı döner.
+# Kayıtlar TTL ile düşer, kapasite dolunca en uzun süredir kullanılmayan (LRU) atılır.
+
+logger = logging.getLogger("BabyLexitSemanticCache")
+
+# --- AYARLAR ---
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2048"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+# RPC eşiğiyle aynı (router._search_cache)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# Aynı soru tekrar eklenirse yeni kayıt açılmaz, mevcut kayıt tazelenir
+_DUPLICATE_SIMILARITY = 0.995
+# Tam pipeline süresinin hareketli ortalaması (kazanılan süre tahmini için)
+_EMA_ALPHA = 0.1
+
+
+class SemanticCache:
+    """TTL + LRU anlamsal cache. lookup/put thread-safe'tir."""
+
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_SIZE, ttl: float = SEMANTIC_CACHE_TTL,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[np.ndarray, str, float]]" = OrderedDict()
+        self._next_id = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._ids: List[int] = []
+        self.evictions = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm > 0 else None
+
+    def _purge(self, now: float):
+        stale = [key for key, (_, _, expires) in self._entries.items() if expires <= now]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self.expired += len(stale)
+            self._matrix = None
+
+    def _nearest(self, v: np.ndarray) -> Tuple[Optional[int], float]:
+        if not self._entries:
+            return None, 0.0
+        if self._matrix is None:
+            self._ids = list(self._entries.keys())
+            self._matrix = np.stack([self._entries[key][0] for key in self._ids])
+        if self._matrix.shape[1] != v.shape[0]:
+            return None, 0.0
+        scores = self._matrix @ v
+        best = int(np.argmax(scores))
+        return self._ids[best], float(scores[best])
+
+    def lookup(self, vector) -> Optional[Tuple[str, float]]:
+        """Eşiği geçen en yakın kaydın (cevap, benzerlik) ikilisi; yoksa None."""
+        v = self._normalize(vector) if vector is not None and len(vector) else None
+        if v is None:
+            return None
+        with self._lock:
+            self._purge(time.monotonic())
+            key, similarity = self._nearest(v)
+            if key is None or similarity < self.threshold:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][1], similarity
+
+    def put(self, vector, answer: str):
+        v = self._normalize(vector) if vector is not None and len(vector) else None
+        if v is None or not answer:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._purge(now)
+            key, similarity = self._nearest(v)
+            if key is not None and similarity >= _DUPLICATE_SIMILARITY:
+                self._entries[key] = (self._entries[key][0], answer, now + self.ttl)
+                self._entries.move_to_end(key)
+                return
+            self._entries[self._next_id] = (v, answer, now + self.ttl)
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self), "capacity": self.max_entries, "ttl": self.ttl,
+                "evictions": self.evictions, "expired": self.expired}
+
+
+class CacheMetrics:
+    """Cache isabet oranı ve kazanılan süre (tam pipeline ortalaması - cache yolunun süresi)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.local_hits = 0
+        self.rpc_hits = 0
+        self.full_runs = 0
+        self.full_run_ms: Optional[float] = None
+        self.saved_ms = 0.0
+
+    def lookup(self, tier: Optional[str]):
+        with self._lock:
+            self.lookups += 1
+            if tier == "local":
+                self.local_hits += 1
+            elif tier == "rpc":
+                self.rpc_hits += 1
+
+    def finished(self, elapsed_ms: float, cache_hit: bool):
+        """Analiz sonunda (db_writer) çağrılır."""
+        with self._lock:
+            if cache_hit:
+                if self.full_run_ms is not None:
+                    self.saved_ms += max(0.0, self.full_run_ms - elapsed_ms)
+            else:
+                self.full_runs += 1
+                self.full_run_ms = elapsed_ms if self.full_run_ms is None else \
+                    (1 - _EMA_ALPHA) * self.full_run_ms + _EMA_ALPHA * elapsed_ms
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.local_hits + self.rpc_hits
+            return {
+                "lookups": self.lookups,
+                "local_hits": self.local_hits,
+                "rpc_hits": self.rpc_hits,
+                "hit_ratio": round(hits / self.lookups, 4) if self.lookups else 0.0,
+                "full_run_ms_avg": round(self.full_run_ms, 1) if self.full_run_ms is not None else None,
+                "saved_ms_total": round(self.saved_ms, 1),
+            }
+
+
+cache_metrics = CacheMetrics()
@@ -0,0 +1,216 @@
+"""
+Çok süreçli (prefork) sunum.
+
+`uvicorn --workers N` her süreçte modeli yeniden yükler (N x bge-m3) ve her süreçte kuyruk
+worker'ları başlatır. Burada model ana süreçte BİR KEZ yüklenir, ardından HTTP worker'ları fork
+edilir: ağırlıklar copy-on-write ile paylaşılır (inference ağırlıklara yazmaz, sayfalar kopyalanmaz).
+Kuyruk worker'ları ayrı, tek bir çocuk süreçte çalışır (--queue-workers 0 ile kapatılabilir).
+BM25 indeksi de ana süreçte yüklenir; HTTP çocukları aynı sayfaları okur.
+
+Kullanım (python_service klasöründen):
+    python serve.py --workers 4
+    python serve.py --workers 4 --queue-workers 0     # kuyruk başka bir node'da çalışıyorsa
+    SERVICE_ROLE=worker python main.py                 # sadece kuyruk servisi
+"""
+import os
+import sys
+import gc
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+
+# HF tokenizer thread havuzu fork'tan önce kullanılırsa çocukta kilitlenebilir
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+logger = logging.getLogger("BabyLexitServe")
+
+# --- AYARLAR ---
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8000"))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "2"))
+SERVE_QUEUE_WORKERS = int(os.getenv("SERVE_QUEUE_WORKERS", "1"))
+# Çocuk başına torch thread sayısı (0: cpu_count / HTTP worker sayısı)
+SERVE_TORCH_THREADS = int(os.getenv("SERVE_TORCH_THREADS", "0"))
+
+
+def _rss_mb(pid: int) -> float:
+    """PSS (paylaşılan sayfalar süreçlere bölünmüş) varsa onu, yoksa RSS'i döndürür."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return 0.0
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PreforkServer:
+    """Ana süreç: modeli yükler, çocukları fork eder, ölenleri yeniden başlatır, sinyalleri iletir."""
+
+    def __init__(self, workers: int, queue_workers: int, host: str, port: int):
+        self.workers = max(1, workers)
+        self.queue_workers = max(0, queue_workers)
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.children = {}  # pid -> rol ("api" | "worker")
+        self.stopping = False
+
+    # --- Çocuk süreçler ---
+
+    def _child_setup(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        if "torch" in sys.modules:
+            threads = SERVE_TORCH_THREADS or max(1, (os.cpu_count() or 1) // self.workers)
+            sys.modules["torch"].set_num_threads(threads)
+        # Graph (ağ istemcileri içerir) fork'tan sonra her çocukta ayrı yüklenir
+        import main
+        main.graph_resource.start()
+
+    def _run_api(self):
+        import uvicorn
+        import main
+
+        main.SERVICE_ROLE = "api"
+        # BM25 indeksi ana süreçten devralındı (paylaşılan sayfalar); artımlı senkron her çocukta ayrı
+        index = main.lexical_resource.value
+        if index and main.supabase:
+            index.start_sync(main.supabase)
+        config = uvicorn.Config(main.app, log_level="info")
+        server = uvicorn.Server(config)
+        server.run(sockets=[self.sock])
+
+    def _run_queue(self):
+        import main
+
+        main.SERVICE_ROLE = "worker"
+        # Kuyruk süreci /search sunmaz: devralınan BM25 indeksi kullanılmaz (yeni satırları HTTP çocukları senkronlar)
+        main.lexical_resource.value = None
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        signal.signal(signal.SIGINT, lambda *_: stop.set())
+        main.run_queue_service(stop)
+
+    def _spawn(self, role: str):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._child_setup()
+                if role == "api":
+                    self._run_api()
+                else:
+                    self._run_queue()
+            except Exception as e:
+                logger.error(f"❌ {role} süreci hata ile çıktı: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = role
+        logger.info(f"👶 {role} süreci başlatıldı (pid {pid})")
+
+    # --- Ana süreç ---
+
+    def _preload(self):
+        import main
+
+        t0 = time.perf_counter()
+        model = main.embedding_resource.load()
+        if model is None:
+            logger.error(f"❌ Model ana süreçte yüklenemedi ({main.embedding_resource.error}); "
+                         "çocuklar embedding olmadan çalışacak.")
+        # BM25 snapshot'ı da bir kez burada yüklenir; senkron thread'i fork'tan sonra HTTP çocuklarında başlar
+        main.LEXICAL_SYNC_IN_CHILD = True
+        index = main.lexical_resource.load()
+        if index is not None:
+            logger.info(f"📚 BM25 indeksi ana süreçte yüklendi: {len(index)} doküman")
+        # Model yüklendikten sonra oluşan nesneleri GC'nin dışında tut:
+        # çocuklarda GC bu nesnelerin başlıklarına yazıp sayfaları kopyalamasın.
+        gc.collect()
+        gc.freeze()
+        logger.info(f"📦 Model ana süreçte yüklendi: {time.perf_counter() - t0:.1f}s, "
+                    f"ana süreç {_rss_mb(os.getpid()):.0f} MB")
+
+    def _stop(self, *_):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def memory_report(self) -> str:
+        parts = [f"ana={_rss_mb(os.getpid()):.0f}MB"]
+        parts += [f"{role}[{pid}]={_rss_mb(pid):.0f}MB" for pid, role in self.children.items()]
+        return "🧠 Bellek (PSS): " + ", ".join(parts)
+
+    def run(self):
+        self.sock = _bind(self.host, self.port)
+        self._preload()
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        for _ in range(self.workers):
+            self._spawn("api")
+        for _ in range(self.queue_workers):
+            self._spawn("worker")
+        logger.info(f"🚀 {self.host}:{self.port} üzerinde {self.workers} HTTP + {self.queue_workers} kuyruk süreci")
+
+        reported = False
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.5)
+                if not reported and not self.stopping:
+                    time.sleep(5)
+                    logger.info(self.memory_report())
+                    reported = True
+                continue
+            role = self.children.pop(pid, None)
+            if role and not self.stopping:
+                logger.warning(f"⚠️ {role} süreci çıktı (pid {pid}, durum {status}), yeniden başlatılıyor...")
+                time.sleep(1)
+                self._spawn(role)
+        self.sock.close()
+        logger.info("👋 Prefork sunucu kapandı.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BabyLexit prefork sunucu")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="HTTP süreç sayısı")
+    parser.add_argument("--queue-workers", type=int, default=SERVE_QUEUE_WORKERS,
+                        help="Kuyruk süreci sayısı (0: bu node'da kuyruk işlenmez)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not hasattr(os, "fork"):
+        sys.exit("Prefork sunum fork gerektirir (Linux/macOS). Tek süreç için: python main.py")
+    PreforkServer(args.workers, args.queue_workers, args.host, args.port).run()
+
+
+if __name__ == "__main__":
+    main()
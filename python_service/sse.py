@@ -0,0 +1,128 @@
+import json
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Optional
+
+# /api/chat/stream için Server-Sent Events akışı.
+# Graph'ın olay akışı (astream_events v2) node ilerleme olaylarına, author_node'un özel olayları
+# ise token olaylarına çevrilir. Gecikme üç ayrı ölçülür:
+#   ttfb_ms        : ilk SSE olayının (guard başladı) gönderilmesi
+#   first_token_ms : raporun ilk parçasının gönderilmesi (kullanıcının cevabı görmeye başladığı an)
+#   total_ms       : akışın tamamlanması
+
+logger = logging.getLogger("BabyLexitSSE")
+
+# --- AYARLAR ---
+SSE_STATS_WINDOW = 500
+
+PIPELINE_NODES = frozenset({
+    "guard_node", "speculative_node", "router_node", "rag_node", "web_node",
+    "expert_node", "author_node", "db_writer_node"
+})
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # nginx / proxy tamponlamasını kapatır, parçalar anında iletilir
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class StreamLatency:
+    """Son akışların TTFB / ilk token / toplam süre dağılımı."""
+
+    def __init__(self, window: int = SSE_STATS_WINDOW):
+        self._lock = threading.Lock()
+        self._samples = {name: deque(maxlen=window) for name in ("ttfb_ms", "first_token_ms", "total_ms")}
+        self.streams = 0
+        self.errors = 0
+        self.disconnects = 0
+
+    def record(self, timing: Dict[str, Optional[float]]):
+        with self._lock:
+            self.streams += 1
+            for name, value in timing.items():
+                if value is not None and name in self._samples:
+                    self._samples[name].append(value)
+
+    @staticmethod
+    def _percentile(values, q: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {"streams": self.streams, "errors": self.errors, "disconnects": self.disconnects}
+            for name, values in self._samples.items():
+                out[name] = {"p50": self._percentile(values, 0.5), "p95": self._percentile(values, 0.95)}
+            return out
+
+
+stream_latency = StreamLatency()
+
+
+async def stream_graph(graph_app, inputs: Dict[str, Any], token_event: str,
+                       latency: StreamLatency = stream_latency) -> AsyncIterator[str]:
+    """Graph'ı akış modunda çalıştırır ve SSE satırları üretir (node, token, done, error)."""
+    t0 = time.perf_counter()
+    timing: Dict[str, Optional[float]] = {"ttfb_ms": None, "first_token_ms": None, "total_ms": None}
+    state: Dict[str, Any] = {}
+    running = set()
+
+    def elapsed() -> float:
+        return round((time.perf_counter() - t0) * 1000, 1)
+
+    def emit(event: str, data: Dict[str, Any]) -> str:
+        if timing["ttfb_ms"] is None:
+            timing["ttfb_ms"] = elapsed()
+        return sse_event(event, data)
+
+    try:
+        async for ev in graph_app.astream_events({**inputs, "stream": True}, version="v2"):
+            kind = ev["event"]
+            name = ev.get("name")
+            if kind == "on_custom_event" and name == token_event:
+                if timing["first_token_ms"] is None:
+                    timing["first_token_ms"] = elapsed()
+                yield emit("token", {"text": ev["data"].get("text", "")})
+            elif name in PIPELINE_NODES and ev.get("metadata", {}).get("langgraph_node") == name:
+                # Node sarmalayıcısı ve içindeki fonksiyon aynı adla iki olay üretir; biri yayınlanır
+                if kind == "on_chain_start" and name not in running:
+                    running.add(name)
+                    yield emit("node", {"node": name, "phase": "start", "elapsed_ms": elapsed()})
+                elif kind == "on_chain_end" and name in running:
+                    running.discard(name)
+                    output = ev["data"].get("output")
+                    if isinstance(output, dict):
+                        state.update(output)
+                    yield emit("node", {"node": name, "phase": "end", "elapsed_ms": elapsed()})
+    except Exception as e:
+        latency.errors += 1
+        logger.error(f"❌ Chat Akış Hatası: {e}")
+        yield sse_event("error", {"detail": str(e)})
+        return
+    except BaseException:
+        # İstemci bağlantıyı kapattı (CancelledError / GeneratorExit): graph çalışması iptal edilir
+        latency.disconnects += 1
+        raise
+
+    timing["total_ms"] = elapsed()
+    latency.record(timing)
+    logger.info(
+        f"📡 Chat akışı: ttfb {timing['ttfb_ms']} ms, ilk token {timing['first_token_ms']} ms, "
+        f"toplam {timing['total_ms']} ms"
+    )
+    yield sse_event("done", {
+        "response": state.get("final_report", ""),
+        "status": state.get("status"),
+        "route": state.get("route"),
+        "timing": timing,
+    })
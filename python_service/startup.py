@@ -0,0 +1,151 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# Hızlı açılış (fast boot) yardımcıları.
+# - StartupReport: açılıştaki her import / model yüklemesinin süresini kaydeder (/startup, /ready).
+# - LazyResource: ağır kaynakları (embedding modeli, LangGraph) arka planda veya ilk kullanımda yükler.
+# Sunucu portu hemen açar; kaynak hazır olana kadar /ready 503 döner, / (liveness) her zaman 200 döner.
+
+logger = logging.getLogger("BabyLexitStartup")
+
+# --- AYARLAR ---
+# background : açılışta arka plan thread'inde yükle (varsayılan)
+# lazy       : ilk kullanımda yükle
+# eager      : eski davranış, açılış tamamlanmadan yükle
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "background").lower()
+# /ready'nin 200 dönmesi için hazır olması gereken kaynaklar
+READY_REQUIRES = [r.strip() for r in os.getenv("READY_REQUIRES", "embedding_model,graph").split(",") if r.strip()]
+
+_PROCESS_START = time.perf_counter()
+
+
+class StartupReport:
+    """Açılış adımlarının süre dökümü. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.steps: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def track(self, name: str):
+        t0 = time.perf_counter()
+        ok, error = True, None
+        try:
+            yield
+        except Exception as e:
+            ok, error = False, str(e)
+            raise
+        finally:
+            seconds = time.perf_counter() - t0
+            with self._lock:
+                self.steps.append({
+                    "step": name,
+                    "seconds": round(seconds, 3),
+                    "at": round(time.perf_counter() - _PROCESS_START, 3),
+                    "ok": ok,
+                    "error": error,
+                })
+            logger.info(f"⏱️ {name}: {seconds:.2f}s" + ("" if ok else f" (HATA: {error})"))
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            steps = list(self.steps)
+        return {
+            "uptime_seconds": round(time.perf_counter() - _PROCESS_START, 3),
+            "total_step_seconds": round(sum(s["seconds"] for s in steps), 3),
+            "steps": steps,
+        }
+
+    def summary(self) -> str:
+        with self._lock:
+            steps = sorted(self.steps, key=lambda s: s["seconds"], reverse=True)
+        return "📊 Açılış Süreleri: " + ", ".join(f"{s['step']}={s['seconds']:.2f}s" for s in steps)
+
+
+startup_report = StartupReport()
+
+
+class LazyResource:
+    """
+    Ağır bir kaynağı tek sefer yükler.
+    start() arka plan thread'i başlatır; get() hazır değilse yüklemenin bitmesini bekler
+    (hiç başlatılmadıysa başlatır). Yükleme hatası kaydedilir, get() None döner.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Any]):
+        self.name = name
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.value: Any = None
+        self.error: Optional[str] = None
+
+    def _run(self):
+        try:
+            with startup_report.track(self.name):
+                self.value = self._loader()
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"❌ {self.name} yüklenemedi: {e}")
+        finally:
+            self._done.set()
+
+    def start(self):
+        """Yüklemeyi arka planda başlatır (birden fazla çağrı güvenlidir)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name=f"load-{self.name}")
+                self._thread.start()
+
+    def load(self):
+        """Yüklemeyi çağıran thread'de yapar (eager mod)."""
+        with self._lock:
+            if self._thread is not None:
+                started = True
+            else:
+                started = False
+                self._thread = threading.current_thread()
+        if started:
+            self._done.wait()
+        else:
+            self._run()
+        return self.value
+
+    def get(self, wait: bool = True, timeout: Optional[float] = None):
+        if not self._done.is_set():
+            self.start()
+            if not wait or not self._done.wait(timeout):
+                return None
+        return self.value
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set() and self.error is None
+
+    @property
+    def failed(self) -> bool:
+        return self._done.is_set() and self.error is not None
+
+    def status(self) -> str:
+        if self.ready:
+            return "ready"
+        if self.failed:
+            return "failed"
+        return "loading" if self._thread is not None else "idle"
+
+
+def boot(resources: List[LazyResource], mode: str = MODEL_LOAD_MODE):
+    """Kaynakları MODEL_LOAD_MODE'a göre yükler."""
+    if mode == "eager":
+        for r in resources:
+            r.load()
+        logger.info(startup_report.summary())
+    elif mode == "background":
+        for r in resources:
+            r.start()
+    # lazy: ilk get() çağrısında yüklenir
@@ -0,0 +1,102 @@
+import os
+import math
+import struct
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+# documents tablosunda vektör saklama biçimi.
+#   float32, tam boyut  : eski davranış (`embedding` sütunu, match_documents)
+#   float16 ve/veya ilk N boyut (Matryoshka kırpma): `embedding_compact` sütunu (halfvec/vector),
+#   match_documents_compact. Kırpılan vektör yeniden normalize edilir.
+# Sorgu tarafı (/embed target=documents, RagLayer) aynı biçimi buradan alır.
+
+logger = logging.getLogger("BabyLexitVectorFormat")
+
+# --- AYARLAR ---
+EMBED_STORE_DTYPE = os.getenv("EMBED_STORE_DTYPE", "float32").lower()   # float32 | float16
+EMBED_STORE_DIM = int(os.getenv("EMBED_STORE_DIM", "0"))                # 0: modelin tam boyutu
+# Geçiş döneminde eski `embedding` sütununa da yaz (eski okuyucular için)
+EMBED_STORE_KEEP_FULL = os.getenv("EMBED_STORE_KEEP_FULL", "0") == "1"
+
+FULL_COLUMN = "embedding"
+FULL_RPC = "match_documents"
+COMPACT_COLUMN = "embedding_compact"
+COMPACT_RPC = "match_documents_compact"
+DTYPES = ("float32", "float16")
+
+
+@dataclass(frozen=True)
+class VectorFormat:
+    dtype: str = "float32"
+    dim: int = 0
+
+    @property
+    def compact(self) -> bool:
+        return self.dtype == "float16" or self.dim > 0
+
+    @property
+    def column(self) -> str:
+        return COMPACT_COLUMN if self.compact else FULL_COLUMN
+
+    @property
+    def rpc(self) -> str:
+        return COMPACT_RPC if self.compact else FULL_RPC
+
+    @property
+    def label(self) -> str:
+        return f"{self.dtype}/{self.dim or 'full'}"
+
+    def sql_type(self, full_dim: int) -> str:
+        dim = self.dim or full_dim
+        return f"halfvec({dim})" if self.dtype == "float16" else f"vector({dim})"
+
+    def bytes_per_vector(self, full_dim: int) -> int:
+        """pgvector'deki ham boyut (başlık hariç)."""
+        return (self.dim or full_dim) * (2 if self.dtype == "float16" else 4)
+
+    def apply(self, vec: List[float]) -> List[float]:
+        """Vektörü saklama biçimine çevirir (kırp, yeniden normalize et, float16'ya yuvarla)."""
+        if not vec or not self.compact:
+            return vec
+        if self.dim and self.dim < len(vec):
+            vec = vec[:self.dim]
+            norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+            vec = [x / norm for x in vec]
+        if self.dtype == "float16":
+            n = len(vec)
+            halves = struct.unpack(f"{n}e", struct.pack(f"{n}e", *vec))
+            # float16 ~3 anlamlı basamak taşır; JSON payload'ı da buna göre kısalır
+            vec = [float(f"{x:.4g}") for x in halves]
+        return vec
+
+
+def _parse_format(dtype: str, dim: int) -> VectorFormat:
+    if dtype not in DTYPES:
+        logger.warning(f"⚠️ Bilinmeyen EMBED_STORE_DTYPE '{dtype}', float32 kullanılıyor.")
+        dtype = "float32"
+    return VectorFormat(dtype, max(0, dim))
+
+
+STORE_FORMAT = _parse_format(EMBED_STORE_DTYPE, EMBED_STORE_DIM)
+
+
+def storage_fields(vec: List[float], fmt: VectorFormat = STORE_FORMAT) -> Dict[str, Any]:
+    """documents satırına yazılacak vektör sütun(lar)ı."""
+    if not fmt.compact:
+        return {FULL_COLUMN: vec}
+    fields = {COMPACT_COLUMN: fmt.apply(vec)}
+    if EMBED_STORE_KEEP_FULL:
+        fields[FULL_COLUMN] = vec
+    return fields
+
+
+def match_request(vec: List[float], threshold: float, count: int,
+                  fmt: Optional[VectorFormat] = None) -> Tuple[str, Dict[str, Any]]:
+    """Tam vektörden (RPC adı, parametreler) üretir; sorgu saklama biçimiyle aynı uzaya çevrilir."""
+    fmt = fmt or STORE_FORMAT
+    return fmt.rpc, {
+        'query_embedding': fmt.apply(vec),
+        'match_threshold': threshold,
+        'match_count': count,
+    }
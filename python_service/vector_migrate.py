@@ -0,0 +1,206 @@
+"""
+documents tablosu için kompakt vektör (float16 / Matryoshka kırpma) şema ve backfill komutu.
+
+Kullanım (python_service klasöründen):
+    python vector_migrate.py sql --dtype float16                      # varsayılan migration SQL'i
+    python vector_migrate.py sql --dtype float16 --dim 256 --replace  # başka bir biçime geçiş SQL'i
+    python vector_migrate.py backfill                                 # mevcut satırları doldurur
+    python vector_migrate.py status
+
+Backfill veritabanı içinde çalışır (backfill_compact_embeddings RPC): vektörler ağdan geçmez.
+Bitince .env'de EMBED_STORE_DTYPE / EMBED_STORE_DIM ayarlanır; yazma ve sorgu tarafı kendiliğinden
+embedding_compact / match_documents_compact'a geçer. Sadece `embedding` yazan istemcilerin (Next.js ingest)
+satırları için kompakt sütunu bir trigger doldurur.
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+
+from vector_format import VectorFormat, DTYPES, STORE_FORMAT, COMPACT_COLUMN, COMPACT_RPC
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("BabyLexitVectorMigrate")
+
+# bge-m3 çıktı boyutu (documents.embedding)
+FULL_DIM = 1024
+
+_SQL = """-- documents için kompakt vektör sütunu: {label} ({bytes} bayt/vektör, tam float32: {full_bytes} bayt).
+-- pgvector >= 0.7 gerekir (halfvec, subvector, l2_normalize).
+-- Üretildi: python vector_migrate.py sql --dtype {dtype} --dim {dim}{replace_flag}
+create extension if not exists vector with schema extensions;
+{drop_block}
+alter table public.documents add column if not exists {column} extensions.{sql_type};
+-- Kompakt modda yeni satırlar eski sütunu doldurmaz (EMBED_STORE_KEEP_FULL=1 hariç)
+alter table public.documents alter column embedding drop not null;
+
+drop index if exists public.documents_embedding_compact_idx;
+create index documents_embedding_compact_idx on public.documents using hnsw ({column} extensions.{ops});
+
+CREATE OR REPLACE FUNCTION public.{rpc}(query_embedding extensions.{sql_type}, match_threshold double precision, match_count integer)
+ RETURNS SETOF jsonb
+ LANGUAGE sql
+ STABLE
+ SET search_path TO 'public', 'extensions'
+AS $function$
+  select (to_jsonb(d) - 'embedding' - '{column}')
+         || jsonb_build_object('similarity', 1 - (d.{column} <=> query_embedding))
+  from public.documents d
+  where d.{column} is not null
+    and 1 - (d.{column} <=> query_embedding) > match_threshold
+  order by d.{column} <=> query_embedding
+  limit match_count;
+$function$
+;
+
+-- Mevcut satırları veritabanı içinde dönüştürür; dönüştürülen satır sayısını döndürür (0 = bitti)
+CREATE OR REPLACE FUNCTION public.backfill_compact_embeddings(batch_size integer DEFAULT 1000)
+ RETURNS integer
+ LANGUAGE sql
+ SET search_path TO 'public', 'extensions'
+AS $function$
+  with batch as (
+    select id from public.documents
+    where {column} is null and embedding is not null
+    limit batch_size
+    for update skip locked
+  ), upd as (
+    update public.documents d
+       set {column} = {expr}
+      from batch
+     where d.id = batch.id
+    returning 1
+  )
+  select count(*)::integer from upd;
+$function$
+;
+
+-- Sadece `embedding` yazan istemciler (app/actions/ingest.ts) için kompakt sütun insert/update sırasında doldurulur
+CREATE OR REPLACE FUNCTION public.documents_fill_embedding_compact()
+ RETURNS trigger
+ LANGUAGE plpgsql
+ SET search_path TO 'public', 'extensions'
+AS $function$
+begin
+  new.{column} := {new_expr};
+  return new;
+end;
+$function$
+;
+
+drop trigger if exists documents_fill_embedding_compact on public.documents;
+create trigger documents_fill_embedding_compact
+  before insert or update of embedding on public.documents
+  for each row when (new.embedding is not null)
+  execute function public.documents_fill_embedding_compact();
+"""
+
+_DROP_BLOCK = """
+-- Önceki biçimi kaldır (sütun backfill ile yeniden doldurulur)
+drop function if exists public.{rpc}(extensions.halfvec, double precision, integer);
+drop function if exists public.{rpc}(extensions.vector, double precision, integer);
+drop index if exists public.documents_embedding_compact_idx;
+alter table public.documents drop column if exists {column};
+"""
+
+
+def render_sql(fmt: VectorFormat, full_dim: int = FULL_DIM, replace: bool = False) -> str:
+    dim = fmt.dim or full_dim
+    sql_type = fmt.sql_type(full_dim)
+
+    def source(row: str) -> str:
+        column = f"{row}.embedding"
+        return column if dim >= full_dim else f"l2_normalize(subvector({column}, 1, {dim}))"
+
+    return _SQL.format(
+        label=fmt.label,
+        bytes=fmt.bytes_per_vector(full_dim),
+        full_bytes=full_dim * 4,
+        dtype=fmt.dtype,
+        dim=fmt.dim,
+        replace_flag=" --replace" if replace else "",
+        drop_block=_DROP_BLOCK.format(rpc=COMPACT_RPC, column=COMPACT_COLUMN) if replace else "",
+        column=COMPACT_COLUMN,
+        rpc=COMPACT_RPC,
+        sql_type=sql_type,
+        ops="halfvec_cosine_ops" if fmt.dtype == "float16" else "vector_cosine_ops",
+        expr=f"{source('d')}::{sql_type}",
+        new_expr=f"{source('new')}::{sql_type}",
+    )
+
+
+def _client():
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    for path in (os.path.join(here, ".env"), os.path.join(os.path.dirname(here), ".env")):
+        if os.path.exists(path):
+            load_dotenv(path)
+            break
+    url = os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY") or os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        sys.exit("❌ SUPABASE_URL / SUPABASE_KEY eksik.")
+    return create_client(url, key)
+
+
+def _count(client, column: str = None, missing: bool = False) -> int:
+    query = client.table("documents").select("id", count="exact", head=True)
+    if column:
+        query = query.is_(column, "null") if missing else query.not_.is_(column, "null")
+    return query.execute().count or 0
+
+
+def status(client):
+    total = _count(client)
+    done = _count(client, COMPACT_COLUMN)
+    logger.info(f"📊 documents: {total} satır, {COMPACT_COLUMN} dolu: {done} ({done / max(total, 1):.1%})")
+    logger.info(f"⚙️ Aktif saklama biçimi: {STORE_FORMAT.label} -> {STORE_FORMAT.rpc}")
+
+
+def backfill(client, batch_size: int):
+    started = time.perf_counter()
+    converted = 0
+    while True:
+        n = client.rpc("backfill_compact_embeddings", {"batch_size": batch_size}).execute().data or 0
+        if not n:
+            break
+        converted += n
+        elapsed = time.perf_counter() - started
+        logger.info(f"⏳ {converted} satır dönüştürüldü ({converted / elapsed:.0f} satır/sn)")
+    logger.info(f"✅ Backfill tamamlandı: {converted} satır, {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kompakt vektör şeması ve backfill")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sql = sub.add_parser("sql", help="Migration SQL'ini yazdır")
+    sql.add_argument("--dtype", choices=DTYPES, default=STORE_FORMAT.dtype)
+    sql.add_argument("--dim", type=int, default=STORE_FORMAT.dim, help="0: tam boyut")
+    sql.add_argument("--full-dim", type=int, default=FULL_DIM)
+    sql.add_argument("--replace", action="store_true", help="Mevcut embedding_compact sütununu yeniden oluştur")
+
+    fill = sub.add_parser("backfill", help="Mevcut satırları kompakt sütuna dönüştür")
+    fill.add_argument("--batch-size", type=int, default=1000)
+
+    sub.add_parser("status", help="Backfill durumu")
+    args = parser.parse_args()
+
+    if args.command == "sql":
+        fmt = VectorFormat(args.dtype, args.dim)
+        if not fmt.compact:
+            sys.exit("float32 / tam boyut zaten mevcut `embedding` sütunudur; --dtype float16 veya --dim verin.")
+        print(render_sql(fmt, args.full_dim, args.replace))
+    elif args.command == "backfill":
+        client = _client()
+        backfill(client, args.batch_size)
+        status(client)
+    else:
+        status(_client())
+
+
+if __name__ == "__main__":
+    main()
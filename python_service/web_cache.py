@@ -0,0 +1,129 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from lexical import normalize_tr
+
+# Web araması (Google Search grounding) sonuçları için TTL önbelleği + uçuştaki istek birleştirme.
+# Hibrit rotada web_node ve RAG'in web fallback'i aynı soruyu aynı anda arayabilir; aynı normalize sorgu
+# için tek sağlayıcı çağrısı yapılır, diğer çağıranlar onun sonucunu bekler.
+
+logger = logging.getLogger("BabyLexitWebCache")
+
+# --- AYARLAR ---
+WEB_CACHE_ENABLED = os.getenv("WEB_CACHE_ENABLED", "1") == "1"
+WEB_CACHE_TTL = float(os.getenv("WEB_CACHE_TTL", str(6 * 3600)))
+# "güncel", "bugün", "son dakika" gibi tazelik isteyen sorgular için kısa TTL
+WEB_CACHE_FRESH_TTL = float(os.getenv("WEB_CACHE_FRESH_TTL", "600"))
+WEB_CACHE_SIZE = int(os.getenv("WEB_CACHE_SIZE", "1024"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# normalize_tr sonrası (ascii katlanmış) biçimde. Önek eşleşmesi sadece başka kelimeyle çakışmayan köklerde
+# (guncel, doviz, faiz); "kur" (kurum, kurul), "dun" (dunya), "haber" (haberlesme) tam kelime olarak aranır.
+_FRESH_RE = re.compile(
+    r"\b(guncel\w*|son dakika|bugun|bugunku|bugune|dun|dunku|bu (?:hafta|haftaki|ay|ayki|yil|yilki)|"
+    r"simdi|simdiki|haber|haberler|haberleri|doviz\w*|dolar|dolari|dolara|euro|euroya|euronun|"
+    r"kur|kuru|kurlar|kurlari|faiz\w*|asgari ucret\w*|20[2-9]\d)\b"
+)
+
+
+def normalize_query(query: str) -> str:
+    """Büyük/küçük harf, diakritik, noktalama ve boşluk farklarını yok sayar."""
+    return " ".join(_TOKEN_RE.findall(normalize_tr(query or "")))
+
+
+def ttl_for(normalized: str) -> float:
+    return WEB_CACHE_FRESH_TTL if _FRESH_RE.search(normalized) else WEB_CACHE_TTL
+
+
+class WebSearchCache:
+    """
+    Bellek içi TTL + LRU önbellek. SERVICE_ROLE=all iken uvicorn loop'u ve kuyruk işçisi thread'lerinin loop'ları
+    aynı örneği kullanır: girdiler kilitle korunur, uçuştaki task'lar loop başına ayrı tutulur (Future başka loop'ta
+    beklenemez).
+    """
+
+    def __init__(self, max_entries: int = WEB_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[asyncio.AbstractEventLoop, Tuple[str, str]], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors_not_cached = 0
+
+    async def get_or_search(self, namespace: str, query: str, search_fn: Callable[[], Awaitable[Any]],
+                            cacheable: Callable[[Any], bool] = lambda result: True) -> Any:
+        """
+        namespace: çağıranın sonuç tipi ("web", "rag_web"); search_fn: sağlayıcı çağrısı.
+        cacheable(result) False ise (hata sonucu) sonuç paylaşılır ama önbelleğe yazılmaz.
+        """
+        normalized = normalize_query(query)
+        key = (namespace, normalized)
+        now = time.monotonic()
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+
+            task = self._inflight.get((loop, key))
+            if task is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+        if task is None:
+            # Arama ayrı bir task'ta koşar: ilk çağıran iptal edilse de (spekülatif dal) bekleyenler sonucu alır
+            task = asyncio.ensure_future(search_fn())
+            with self._lock:
+                self._inflight[(loop, key)] = task
+            task.add_done_callback(lambda t: self._finish(loop, key, normalized, t, cacheable))
+        return await asyncio.shield(task)
+
+    def _finish(self, loop, key, normalized: str, task: asyncio.Task, cacheable):
+        with self._lock:
+            self._inflight.pop((loop, key), None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        with self._lock:
+            if not cacheable(result):
+                self.errors_not_cached += 1
+                return
+            self._entries[key] = (result, time.monotonic() + ttl_for(normalized))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "inflight": len(self._inflight),
+                "errors_not_cached": self.errors_not_cached,
+                "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
+
+
+web_cache: Optional[WebSearchCache] = WebSearchCache() if WEB_CACHE_ENABLED else None
+
+
+async def cached_search(namespace: str, query: str, search_fn: Callable[[], Awaitable[Any]],
+                        cacheable: Callable[[Any], bool] = lambda result: True) -> Any:
+    if not web_cache:
+        return await search_fn()
+    return await web_cache.get_or_search(namespace, query, search_fn, cacheable)
@@ -0,0 +1,149 @@
+-- Kuyruk işleri için kiralama (lease) tabanlı sahiplenme.
+-- Birden fazla worker süreci / node aynı satırı asla aynı anda almaz (FOR UPDATE SKIP LOCKED).
+-- Süresi dolan kiralar reaper tarafından geri kuyruğa alınır veya failed yapılır.
+
+alter table "public"."file_processing_queue" add column if not exists "created_at" timestamp with time zone default now();
+alter table "public"."file_processing_queue" add column if not exists "locked_by" text;
+alter table "public"."file_processing_queue" add column if not exists "lease_expires_at" timestamp with time zone;
+alter table "public"."file_processing_queue" add column if not exists "attempts" integer not null default 0;
+
+alter table "public"."questions" add column if not exists "locked_by" text;
+alter table "public"."questions" add column if not exists "lease_expires_at" timestamp with time zone;
+alter table "public"."questions" add column if not exists "analysis_attempts" integer not null default 0;
+
+create index if not exists file_processing_queue_pending_idx
+  on "public"."file_processing_queue" using btree (created_at) where (status = 'pending'::text);
+
+create index if not exists questions_analyzing_idx
+  on "public"."questions" using btree (created_at) where (status = 'analyzing'::text);
+
+
+CREATE OR REPLACE FUNCTION public.claim_file_jobs(p_worker text, p_limit integer DEFAULT 1, p_lease_seconds integer DEFAULT 300)
+ RETURNS SETOF public.file_processing_queue
+ LANGUAGE sql
+ SECURITY DEFINER
+AS $function$
+  UPDATE public.file_processing_queue q
+     SET status = 'processing',
+         locked_by = p_worker,
+         lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+         attempts = q.attempts + 1
+   WHERE q.id IN (
+     SELECT id FROM public.file_processing_queue
+      WHERE status = 'pending'
+      ORDER BY created_at
+      LIMIT p_limit
+      FOR UPDATE SKIP LOCKED
+   )
+  RETURNING q.*;
+$function$
+;
+
+CREATE OR REPLACE FUNCTION public.claim_questions(p_worker text, p_limit integer DEFAULT 1, p_lease_seconds integer DEFAULT 300, p_max_attempts integer DEFAULT 3)
+ RETURNS SETOF public.questions
+ LANGUAGE sql
+ SECURITY DEFINER
+AS $function$
+  -- Soru durumu 'analyzing' olarak kalır (frontend bunu bekliyor); sahiplik lease kolonlarıyla tutulur.
+  UPDATE public.questions q
+     SET locked_by = p_worker,
+         lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+         analysis_attempts = q.analysis_attempts + 1
+   WHERE q.id IN (
+     SELECT id FROM public.questions
+      WHERE status = 'analyzing'
+        AND (lease_expires_at IS NULL OR lease_expires_at < now())
+        AND analysis_attempts < p_max_attempts
+      ORDER BY created_at
+      LIMIT p_limit
+      FOR UPDATE SKIP LOCKED
+   )
+  RETURNING q.*;
+$function$
+;
+
+DROP FUNCTION IF EXISTS public.claim_question(uuid, text, integer);
+
+CREATE OR REPLACE FUNCTION public.claim_question(p_id uuid, p_worker text, p_lease_seconds integer DEFAULT 300, p_max_attempts integer DEFAULT 3)
+ RETURNS boolean
+ LANGUAGE plpgsql
+ SECURITY DEFINER
+AS $function$
+BEGIN
+  -- /analyze endpoint'i belirli bir soruyu işlemeden önce sahiplenir.
+  UPDATE public.questions
+     SET locked_by = p_worker,
+         lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+         analysis_attempts = analysis_attempts + 1
+   WHERE id = p_id
+     AND status = 'analyzing'
+     AND analysis_attempts < p_max_attempts
+     AND (lease_expires_at IS NULL OR lease_expires_at < now() OR locked_by = p_worker);
+  RETURN FOUND;
+END;
+$function$
+;
+
+CREATE OR REPLACE FUNCTION public.heartbeat_jobs(p_worker text, p_lease_seconds integer DEFAULT 300)
+ RETURNS integer
+ LANGUAGE plpgsql
+ SECURITY DEFINER
+AS $function$
+DECLARE
+  v_files integer;
+  v_questions integer;
+BEGIN
+  UPDATE public.file_processing_queue
+     SET lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+   WHERE locked_by = p_worker AND status = 'processing';
+  GET DIAGNOSTICS v_files = ROW_COUNT;
+
+  UPDATE public.questions
+     SET lease_expires_at = now() + make_interval(secs => p_lease_seconds)
+   WHERE locked_by = p_worker AND status = 'analyzing';
+  GET DIAGNOSTICS v_questions = ROW_COUNT;
+
+  RETURN v_files + v_questions;
+END;
+$function$
+;
+
+CREATE OR REPLACE FUNCTION public.reap_stale_jobs(p_max_attempts integer DEFAULT 3)
+ RETURNS json
+ LANGUAGE plpgsql
+ SECURITY DEFINER
+AS $function$
+DECLARE
+  v_requeued integer;
+  v_failed_files integer;
+  v_failed_questions integer;
+BEGIN
+  -- Kirası dolan dosya işleri: deneme hakkı varsa tekrar kuyruğa, yoksa failed.
+  UPDATE public.file_processing_queue
+     SET status = 'pending', locked_by = NULL, lease_expires_at = NULL
+   WHERE status = 'processing' AND lease_expires_at < now() AND attempts < p_max_attempts;
+  GET DIAGNOSTICS v_requeued = ROW_COUNT;
+
+  UPDATE public.file_processing_queue
+     SET status = 'failed', locked_by = NULL, lease_expires_at = NULL,
+         error_message = 'Lease süresi doldu (worker yanıt vermedi)'
+   WHERE status = 'processing' AND lease_expires_at < now() AND attempts >= p_max_attempts;
+  GET DIAGNOSTICS v_failed_files = ROW_COUNT;
+
+  -- Sorular kira dolunca (veya bırakılınca) claim_questions tarafından zaten tekrar alınır; hakkı bitenler failed.
+  -- release_question kirayı NULL'a çeker: hakkı biten ama kirası bırakılmış sorular da burada kapanır.
+  UPDATE public.questions
+     SET status = 'failed', locked_by = NULL, lease_expires_at = NULL
+   WHERE status = 'analyzing'
+     AND (lease_expires_at IS NULL OR lease_expires_at < now())
+     AND analysis_attempts >= p_max_attempts;
+  GET DIAGNOSTICS v_failed_questions = ROW_COUNT;
+
+  RETURN json_build_object(
+    'requeued_files', v_requeued,
+    'failed_files', v_failed_files,
+    'failed_questions', v_failed_questions
+  );
+END;
+$function$
+;
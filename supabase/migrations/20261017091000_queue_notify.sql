@@ -0,0 +1,20 @@
+-- Kuyruğa yeni iş düştüğünde Python worker'larını uyandırmak için NOTIFY.
+-- Worker'lar 'babylexit_jobs' kanalını LISTEN eder (QUEUE_LISTEN_DSN); payload: {"table": ..., "id": ...}
+-- Kanal adı python_service/jobs.py QUEUE_NOTIFY_CHANNEL ile aynı olmalı (ikisi de sabit).
+
+CREATE OR REPLACE FUNCTION public.notify_job_queue()
+ RETURNS trigger
+ LANGUAGE plpgsql
+AS $function$
+BEGIN
+  PERFORM pg_notify('babylexit_jobs', json_build_object('table', TG_TABLE_NAME, 'id', NEW.id)::text);
+  RETURN NEW;
+END;
+$function$
+;
+
+drop trigger if exists file_processing_queue_notify on "public"."file_processing_queue";
+CREATE TRIGGER file_processing_queue_notify AFTER INSERT OR UPDATE OF status ON public.file_processing_queue FOR EACH ROW WHEN ((new.status = 'pending'::text)) EXECUTE FUNCTION public.notify_job_queue();
+
+drop trigger if exists questions_analyzing_notify on "public"."questions";
+CREATE TRIGGER questions_analyzing_notify AFTER INSERT OR UPDATE OF status ON public.questions FOR EACH ROW WHEN ((new.status = 'analyzing'::text)) EXECUTE FUNCTION public.notify_job_queue();
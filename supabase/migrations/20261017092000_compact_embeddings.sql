@@ -0,0 +1,68 @@
+-- documents için kompakt vektör sütunu: float16/full (2048 bayt/vektör, tam float32: 4096 bayt).
+-- pgvector >= 0.7 gerekir (halfvec, subvector, l2_normalize).
+-- Üretildi: python vector_migrate.py sql --dtype float16 --dim 0
+create extension if not exists vector with schema extensions;
+
+alter table public.documents add column if not exists embedding_compact extensions.halfvec(1024);
+-- Kompakt modda yeni satırlar eski sütunu doldurmaz (EMBED_STORE_KEEP_FULL=1 hariç)
+alter table public.documents alter column embedding drop not null;
+
+drop index if exists public.documents_embedding_compact_idx;
+create index documents_embedding_compact_idx on public.documents using hnsw (embedding_compact extensions.halfvec_cosine_ops);
+
+CREATE OR REPLACE FUNCTION public.match_documents_compact(query_embedding extensions.halfvec(1024), match_threshold double precision, match_count integer)
+ RETURNS SETOF jsonb
+ LANGUAGE sql
+ STABLE
+ SET search_path TO 'public', 'extensions'
+AS $function$
+  select (to_jsonb(d) - 'embedding' - 'embedding_compact')
+         || jsonb_build_object('similarity', 1 - (d.embedding_compact <=> query_embedding))
+  from public.documents d
+  where d.embedding_compact is not null
+    and 1 - (d.embedding_compact <=> query_embedding) > match_threshold
+  order by d.embedding_compact <=> query_embedding
+  limit match_count;
+$function$
+;
+
+-- Mevcut satırları veritabanı içinde dönüştürür; dönüştürülen satır sayısını döndürür (0 = bitti)
+CREATE OR REPLACE FUNCTION public.backfill_compact_embeddings(batch_size integer DEFAULT 1000)
+ RETURNS integer
+ LANGUAGE sql
+ SET search_path TO 'public', 'extensions'
+AS $function$
+  with batch as (
+    select id from public.documents
+    where embedding_compact is null and embedding is not null
+    limit batch_size
+    for update skip locked
+  ), upd as (
+    update public.documents d
+       set embedding_compact = d.embedding::halfvec(1024)
+      from batch
+     where d.id = batch.id
+    returning 1
+  )
+  select count(*)::integer from upd;
+$function$
+;
+
+-- Sadece `embedding` yazan istemciler (app/actions/ingest.ts) için kompakt sütun insert/update sırasında doldurulur
+CREATE OR REPLACE FUNCTION public.documents_fill_embedding_compact()
+ RETURNS trigger
+ LANGUAGE plpgsql
+ SET search_path TO 'public', 'extensions'
+AS $function$
+begin
+  new.embedding_compact := new.embedding::halfvec(1024);
+  return new;
+end;
+$function$
+;
+
+drop trigger if exists documents_fill_embedding_compact on public.documents;
+create trigger documents_fill_embedding_compact
+  before insert or update of embedding on public.documents
+  for each row when (new.embedding is not null)
+  execute function public.documents_fill_embedding_compact();
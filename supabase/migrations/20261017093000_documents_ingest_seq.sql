@@ -0,0 +1,5 @@
+-- Süreç içi ANN indeksinin (python_service/ann_index.py) artımlı senkronu için monoton sıra numarası.
+-- Mevcut satırlar eklenirken numaralandırılır; yeni satırlar sequence'ten alır.
+alter table public.documents add column if not exists ingest_seq bigserial;
+
+create index if not exists documents_ingest_seq_idx on public.documents using btree (ingest_seq);